@@ -6,7 +6,7 @@ Provides common functionality and interface definition.
 import logging
 from abc import ABC, abstractmethod
 from dataclasses import dataclass, field
-from typing import Any, Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, FrozenSet, List, Optional
 
 from models import LLMClientProtocol
 
@@ -44,6 +44,13 @@ class BaseAgent(ABC):
     # Default model to use (can be overridden per-call)
     default_model: str = "small"  # "small" or "large"
     
+    # Whether the result depends only on the message, settings and the context
+    # keys in `reads` (pure agents have their results memoized by the executor)
+    pure: bool = False
+    
+    # Context keys the agent reads - part of the memoization key for pure agents
+    reads: FrozenSet[str] = frozenset()
+    
     def __init__(self, llm_client: LLMClientProtocol):
         """
         Initialize the agent with an LLM client.
@@ -102,6 +109,43 @@ class BaseAgent(ABC):
             max_tokens=max_tokens,
         )
     
+    async def _chat_stream(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        temperature: float = 0.2,
+        max_tokens: int = 512,
+    ) -> AsyncIterator[str]:
+        """
+        Helper method to stream an LLM reply.
+        
+        Uses the client's chat_stream when it has one, and otherwise yields
+        the whole `_chat` reply as a single chunk.
+        
+        Args:
+            messages: Chat messages
+            model: Model name
+            temperature: Sampling temperature
+            max_tokens: Maximum tokens to generate
+            
+        Yields:
+            Content deltas as they arrive
+        """
+        if not hasattr(self.llm, "chat_stream"):
+            yield await self._chat(messages, model, temperature, max_tokens)
+            return
+        stream = self.llm.chat_stream(
+            model=model,
+            messages=messages,
+            temperature=temperature,
+            max_tokens=max_tokens,
+        )
+        try:
+            async for chunk in stream:
+                yield chunk
+        finally:
+            await stream.aclose()
+    
     def _build_system_prompt(self, template: str, **kwargs) -> str:
         """
         Build a system prompt from a template.
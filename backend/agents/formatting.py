@@ -26,6 +26,11 @@ class FormattingAgent(BaseAgent):
     agent_id = "formatting"
     display_name = "Formatting Agent"
     default_model = "large"  # Use large model for better code generation
+    pure = True
+    reads = frozenset({
+        "supervisor_guidance", "input_content", "final_answer",
+        "search_results", "synthesis_content", "context_snippets",
+    })
     
     SYSTEM_PROMPT = """You are an Expert Code Generator and Formatter. You create production-quality, visually stunning code outputs.
 
@@ -8,7 +8,7 @@ about which tools are needed to answer the query.
 import json
 import re
 import logging
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Dict, List, Optional, Tuple
 
 from agents.base import BaseAgent, AgentResult
 from models import LLMClientProtocol
@@ -16,6 +16,44 @@ from models import LLMClientProtocol
 # Get workflow logger
 logger = logging.getLogger("workflow")
 
+# First flat JSON object in the LLM's tool-selection reply
+_JSON_OBJECT_RE = re.compile(r'\{[^}]+\}', re.DOTALL)
+
+# Decision fields, matched in the partial reply while it streams in
+_TOOLS_FIELD_RE = re.compile(r'"tools_to_execute"\s*:\s*(\[[^\]]*\])')
+_IMAGE_PROMPT_FIELD_RE = re.compile(r'"image_prompt"\s*:\s*("(?:[^"\\]|\\.)*")')
+_IMAGE_TYPE_FIELD_RE = re.compile(r'"image_type"\s*:\s*("(?:[^"\\]|\\.)*")')
+
+
+def _early_decision(partial_response: str, user_message: str) -> Optional[Dict[str, Any]]:
+    """
+    Extract the routing decision from a partially streamed reply.
+    
+    Returns the decision once every field downstream nodes depend on is
+    complete (tools, plus prompt and type when an image is requested),
+    or None while they are still being generated.
+    """
+    tools_match = _TOOLS_FIELD_RE.search(partial_response)
+    if not tools_match:
+        return None
+    try:
+        tools = json.loads(tools_match.group(1))
+    except json.JSONDecodeError:
+        return None
+    
+    decision = {"tools_to_execute": tools, "image_prompt": user_message, "image_type": "photo"}
+    if "image_generator" in tools:
+        prompt_match = _IMAGE_PROMPT_FIELD_RE.search(partial_response)
+        type_match = _IMAGE_TYPE_FIELD_RE.search(partial_response)
+        if not (prompt_match and type_match):
+            return None
+        try:
+            decision["image_prompt"] = json.loads(prompt_match.group(1))
+            decision["image_type"] = json.loads(type_match.group(1))
+        except json.JSONDecodeError:
+            return None
+    return decision
+
 
 class OrchestratorAgent(BaseAgent):
     """
@@ -63,6 +101,7 @@ Output a JSON object with:
         context: Dict[str, Any],
         settings: Optional[Dict[str, Any]] = None,
         model: Optional[str] = None,
+        on_decision: Optional[Callable[[Dict[str, Any]], None]] = None,
     ) -> AgentResult:
         """
         Decide which tools to execute based on context.
@@ -72,6 +111,8 @@ Output a JSON object with:
             context: Contains 'semantic_results' from semantic search
             settings: Contains 'toolSelectionStrategy' and 'maxTools'
             model: Model to use
+            on_decision: Called with the routing decision as soon as it has
+                streamed in, before the reasoning is finished
             
         Returns:
             AgentResult with tool decisions
@@ -131,18 +172,24 @@ Decide which tools to execute (if any) and provide instructions."""
         
         logger.debug("Sending request to LLM for tool selection...")
         
-        response = await self._chat(
-            messages=messages,
-            model=model or "gpt-4o-mini",
-            temperature=0.3,
-            max_tokens=300,
-        )
+        early = None
+        if on_decision is not None:
+            response, early = await self._stream_decision(
+                messages, model or "gpt-4o-mini", user_message, on_decision
+            )
+        else:
+            response = await self._chat(
+                messages=messages,
+                model=model or "gpt-4o-mini",
+                temperature=0.3,
+                max_tokens=300,
+            )
         
         logger.debug(f"LLM Response: {response[:500]}...")
         
         # Parse JSON response
         try:
-            json_match = re.search(r'\{[^}]+\}', response, re.DOTALL)
+            json_match = _JSON_OBJECT_RE.search(response)
             if json_match:
                 parsed = json.loads(json_match.group())
                 logger.debug(f"Parsed JSON: {parsed}")
@@ -162,6 +209,33 @@ Decide which tools to execute (if any) and provide instructions."""
         image_prompt = parsed.get("image_prompt", user_message)
         image_type = parsed.get("image_type", "photo")
         
+        # Downstream nodes may already be running on the streamed decision, so
+        # it stands; a differing final parse is kept in the metadata for the trace
+        final_decision = None
+        if early is not None:
+            if early["tools_to_execute"] != tools_to_execute:
+                logger.warning(f"Final parse {tools_to_execute} differs from streamed decision; keeping the streamed one")
+                final_decision = {
+                    "tools_to_execute": tools_to_execute,
+                    "image_prompt": image_prompt,
+                    "image_type": image_type,
+                }
+            tools_to_execute = early["tools_to_execute"]
+            image_prompt = early["image_prompt"]
+            image_type = early["image_type"]
+        
+        metadata = {
+            "tools_to_execute": tools_to_execute,
+            "reasoning": reasoning,
+            "image_prompt": image_prompt,
+            "image_type": image_type,
+            "tool_selection_strategy": tool_strategy,
+            "max_tools": max_tools,
+        }
+        if final_decision is not None:
+            metadata["streamed_decision"] = early
+            metadata["final_decision"] = final_decision
+        
         # Log the critical decision
         logger.info("=" * 50)
         logger.info(f"ORCHESTRATOR DECISION:")
@@ -182,14 +256,7 @@ Decide which tools to execute (if any) and provide instructions."""
             model=model or "gpt-4o-mini",
             action="orchestrate",
             content=f"Decided to use: {', '.join(tools_to_execute) or 'no additional tools'}",
-            metadata={
-                "tools_to_execute": tools_to_execute,
-                "reasoning": reasoning,
-                "image_prompt": image_prompt,
-                "image_type": image_type,
-                "tool_selection_strategy": tool_strategy,
-                "max_tools": max_tools,
-            },
+            metadata=metadata,
             context_updates={
                 "tools_to_execute": tools_to_execute,
                 "orchestrator_result": {
@@ -200,5 +267,27 @@ Decide which tools to execute (if any) and provide instructions."""
                 },
             },
         )
+    
+    async def _stream_decision(
+        self,
+        messages: List[Dict[str, str]],
+        model: str,
+        user_message: str,
+        on_decision: Callable[[Dict[str, Any]], None],
+    ) -> Tuple[str, Optional[Dict[str, Any]]]:
+        """
+        Stream the reply, reporting the decision through on_decision as soon
+        as it can be parsed. Returns the full reply and the reported decision.
+        """
+        chunks: List[str] = []
+        early = None
+        async for chunk in self._chat_stream(messages, model, temperature=0.3, max_tokens=300):
+            chunks.append(chunk)
+            if early is None:
+                early = _early_decision("".join(chunks), user_message)
+                if early is not None:
+                    logger.info(f"ORCHESTRATOR: Decision streamed early: {early['tools_to_execute']}")
+                    on_decision(early)
+        return "".join(chunks), early
 
 
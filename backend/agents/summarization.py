@@ -25,6 +25,8 @@ class SummarizationAgent(BaseAgent):
     agent_id = "summarization"
     display_name = "Summarization Agent"
     default_model = "small"
+    pure = True
+    reads = frozenset({"input_content", "final_answer", "context_snippets"})
     
     SYSTEM_PROMPT_TEMPLATE = """You are a Summarization Agent. Your task is to create a concise summary of the provided content.
 
@@ -26,6 +26,11 @@ class TransformerAgent(BaseAgent):
     agent_id = "transformer"
     display_name = "Transformer Agent"
     default_model = "large"
+    pure = True
+    reads = frozenset({
+        "spreadsheet_settings", "supervisor_guidance", "input_content",
+        "uploaded_file_content", "final_answer", "context_snippets", "user_message",
+    })
     
     SYSTEM_PROMPT = """You are an Expert GRC (Governance, Risk, and Compliance) Analyst specializing in regulatory document extraction and risk assessment. You extract structured compliance data from regulatory documents with professional risk analysis.
 
@@ -58,6 +58,41 @@ class Config:
     LEGAL_EMBEDDINGS_CACHE: Path = BASE_DIR / "embeddings_cache_legal.json"
     AUDIT_EMBEDDINGS_CACHE: Path = BASE_DIR / "embeddings_cache_audit.json"
     
+    # Workflow Builder Cache (SQLite, shared across worker processes)
+    WORKFLOW_CACHE_ENABLED: bool = os.getenv("WORKFLOW_CACHE_ENABLED", "true").lower() == "true"
+    WORKFLOW_CACHE_DB: Path = Path(os.getenv("WORKFLOW_CACHE_DB", str(BASE_DIR / "workflow_cache.db")))
+    
+    # Opt-in: build workflows with schema-constrained JSON output plus a second,
+    # short explanation call (needs a provider with response_format support)
+    WORKFLOW_BUILDER_JSON_MODE: bool = os.getenv("WORKFLOW_BUILDER_JSON_MODE", "false").lower() == "true"
+    
+    # Max concurrent workflow builder LLM calls (backpressure on the provider)
+    MAX_CONCURRENT_LLM: int = int(os.getenv("MAX_CONCURRENT_LLM", "8"))
+    
+    # Max concurrent workflow agent calls per model, and an optional per-model
+    # token budget (tokens/minute, 0 = unlimited) to stay under provider rate limits
+    MAX_CONCURRENT_LARGE_MODEL: int = int(os.getenv("MAX_CONCURRENT_LARGE_MODEL", "4"))
+    MAX_CONCURRENT_SMALL_MODEL: int = int(os.getenv("MAX_CONCURRENT_SMALL_MODEL", "16"))
+    MODEL_TOKENS_PER_MINUTE: int = int(os.getenv("MODEL_TOKENS_PER_MINUTE", "0"))
+    
+    # Start nodes downstream of an orchestrator as soon as its tool choice has
+    # streamed in; that streamed choice is then binding for the run
+    ORCHESTRATOR_EARLY_DECISION: bool = os.getenv("ORCHESTRATOR_EARLY_DECISION", "true").lower() == "true"
+    
+    # Memoized results of pure workflow agents (formatting, summarization, ...); 0 disables
+    AGENT_CACHE_SIZE: int = int(os.getenv("AGENT_CACHE_SIZE", "1024"))
+    
+    # Compiled workflow graphs (reachability, topological order) kept for reuse; 0 disables
+    PLAN_CACHE_SIZE: int = int(os.getenv("PLAN_CACHE_SIZE", "128"))
+    
+    # Max characters of text kept per uploaded file
+    UPLOAD_TEXT_LIMIT: int = int(os.getenv("UPLOAD_TEXT_LIMIT", "100000"))
+    
+    # Text extracted from uploaded PDF/DOCX files, keyed by content hash, so
+    # re-running a workflow with the same file skips parsing and OCR
+    UPLOAD_CACHE_ENABLED: bool = os.getenv("UPLOAD_CACHE_ENABLED", "true").lower() == "true"
+    UPLOAD_CACHE_DIR: Path = Path(os.getenv("UPLOAD_CACHE_DIR", str(BASE_DIR / "upload_cache")))
+    
     @classmethod
     def get_documents_dir(cls, knowledge_base: str = "legal") -> Path:
         """Get the documents directory for the specified knowledge base."""
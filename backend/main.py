@@ -8,7 +8,6 @@ FastAPI application providing endpoints for:
 - Document management
 """
 
-import json
 from pathlib import Path
 from typing import Any, Dict, List, Optional
 
@@ -18,7 +17,8 @@ from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
 
 from config import config
-from workflow_executor import execute_workflow
+from models import close_llm_clients
+from workflow_executor import execute_workflow, sse_event
 from workflows import (
     create_workflow,
     get_workflow,
@@ -27,11 +27,15 @@ from workflows import (
     delete_workflow,
 )
 from workflow_builder_llm import (
+    build_and_suggest,
     build_workflow_from_chat,
+    build_workflow_from_chat_stream,
     suggest_workflow_improvements,
     get_example_workflow,
+    invalidate_response_cache,
     list_example_workflows,
 )
+from workflow_cache import get_workflow_cache
 import os
 
 # Use pgvector if DATABASE_URL is set, otherwise fallback to file-based
@@ -95,6 +99,16 @@ async def startup_event():
         traceback.print_exc()
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    """Release shared resources on shutdown."""
+    # Close the pooled LLM connections and the workflow cache's database connections
+    await close_llm_clients()
+    cache = get_workflow_cache()
+    if cache is not None:
+        cache.close()
+
+
 # =============================================================================
 # Request/Response Models
 # =============================================================================
@@ -120,11 +134,18 @@ class WorkflowSaveRequest(BaseModel):
 class WorkflowBuildRequest(BaseModel):
     message: str
     conversation_history: Optional[List[Dict[str, str]]] = None
+    include_raw: bool = False
+
+
+class WorkflowBuildAndImproveRequest(BaseModel):
+    message: str
+    conversation_history: Optional[List[Dict[str, str]]] = None
 
 
 class WorkflowImproveRequest(BaseModel):
     workflow: Dict[str, Any]
     feedback: Optional[str] = None
+    include_raw: bool = False
 
 
 class DocumentUploadRequest(BaseModel):
@@ -248,10 +269,38 @@ async def api_build_workflow(req: WorkflowBuildRequest):
     result = await build_workflow_from_chat(
         user_message=req.message,
         conversation_history=req.conversation_history,
+        include_raw=req.include_raw,
     )
     return result
 
 
+@app.post("/api/workflow/build/stream")
+async def api_build_workflow_stream(req: WorkflowBuildRequest):
+    """
+    Streaming variant of /api/workflow/build.
+    
+    Sends the explanation as 'token' events while the AI writes it,
+    followed by a single 'result' event with the explanation and workflow.
+    """
+    async def events():
+        async for event in build_workflow_from_chat_stream(
+            user_message=req.message,
+            conversation_history=req.conversation_history,
+        ):
+            event_type = event.pop("type")
+            yield sse_event(event_type, event)
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={
+            "Cache-Control": "no-cache",
+            "Connection": "keep-alive",
+            "X-Accel-Buffering": "no",
+        },
+    )
+
+
 @app.post("/api/workflow/improve")
 async def api_improve_workflow(req: WorkflowImproveRequest):
     """
@@ -260,10 +309,32 @@ async def api_improve_workflow(req: WorkflowImproveRequest):
     result = await suggest_workflow_improvements(
         current_workflow=req.workflow,
         user_feedback=req.feedback,
+        include_raw=req.include_raw,
     )
     return result
 
 
+@app.post("/api/workflow/build-and-improve")
+async def api_build_and_improve_workflow(req: WorkflowBuildAndImproveRequest):
+    """
+    Build a workflow and get improvement suggestions for it in one request.
+    """
+    return await build_and_suggest(
+        user_message=req.message,
+        conversation_history=req.conversation_history,
+    )
+
+
+@app.delete("/api/workflow/cache")
+async def api_clear_workflow_cache():
+    """Clear cached AI-built workflows (in-process and persistent)."""
+    invalidate_response_cache()
+    cache = get_workflow_cache()
+    if cache is not None:
+        await cache.clear()
+    return {"success": True}
+
+
 @app.get("/api/workflow/examples")
 async def api_list_examples():
     """List available example workflows."""
@@ -4,13 +4,36 @@ Provides a Protocol for type compatibility across different LLM providers.
 """
 
 import asyncio
+import json
 import os
-from typing import Any, Dict, List, Protocol, runtime_checkable
+from typing import Any, AsyncIterator, Dict, List, Protocol, runtime_checkable
 
 import httpx
 
 from config import config
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+_JSON_HEADERS = {"Content-Type": "application/json"}
+
+# Use longer timeout for complex extraction tasks (5 minutes)
+_CHAT_TIMEOUT = httpx.Timeout(300.0, connect=30.0)
+
+
+def _encode_body(payload: Dict[str, Any]) -> bytes:
+    """
+    Serialize a request body once, with orjson when available. Chat payloads
+    carry multi-KB system prompts; encoding them up front also avoids
+    re-encoding on every retry.
+    """
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload).encode("utf-8")
+
 
 @runtime_checkable
 class LLMClientProtocol(Protocol):
@@ -20,11 +43,17 @@ class LLMClientProtocol(Protocol):
         self,
         *,
         model: str,
-        messages: List[Dict[str, str]],
+        messages: List[Dict[str, Any]],
         temperature: float = 0.2,
         max_tokens: int = 512,
+        response_format: Dict[str, Any] | None = None,
     ) -> str:
-        """Send a chat completion request and return the response content."""
+        """Send a chat completion request and return the response content.
+
+        Messages are sent as given.
+        response_format is an OpenAI-style structured output spec
+        ({"type": "json_object"} or {"type": "json_schema", ...}).
+        """
         ...
 
 
@@ -119,6 +148,45 @@ class OpenAIKeyManager:
             del self.rate_limited_keys[key]
 
 
+class _PooledHTTPClient:
+    """
+    A long-lived httpx.AsyncClient, so requests reuse pooled (already
+    TLS-negotiated) connections. Connections belong to the event loop that
+    opened them, so a new client is made if the running loop changes.
+    """
+
+    def __init__(self, timeout: httpx.Timeout | float) -> None:
+        self._timeout = timeout
+        self._client: httpx.AsyncClient | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+
+    def get(self) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._client is None or self._client.is_closed or self._loop is not loop:
+            self._discard()
+            self._client = httpx.AsyncClient(timeout=self._timeout)
+            self._loop = loop
+        return self._client
+
+    def _discard(self) -> None:
+        """Close a client opened on another event loop, on that loop if it still runs."""
+        client, loop = self._client, self._loop
+        self._client = self._loop = None
+        if client is None or client.is_closed or loop is None:
+            return
+        if loop.is_running():
+            asyncio.run_coroutine_threadsafe(client.aclose(), loop)
+        # A stopped loop can no longer drive the close; its sockets went with it
+
+    async def aclose(self) -> None:
+        """Close the pooled client (e.g. on application shutdown)."""
+        if self._client is not None and self._loop is asyncio.get_running_loop():
+            client, self._client, self._loop = self._client, None, None
+            await client.aclose()
+        else:
+            self._discard()
+
+
 class OpenAILLMClient:
     """OpenAI-compatible LLM client with automatic API key rotation."""
 
@@ -126,6 +194,7 @@ class OpenAILLMClient:
         # If explicit key provided, use it. Otherwise use key manager for rotation.
         self._explicit_key = api_key
         self.base_url = base_url or config.OPENAI_BASE_URL
+        self._http = _PooledHTTPClient(_CHAT_TIMEOUT)
         
         if api_key:
             self._key_manager = None
@@ -142,83 +211,140 @@ class OpenAILLMClient:
         self,
         *,
         model: str,
-        messages: List[Dict[str, str]],
+        messages: List[Dict[str, Any]],
         temperature: float = 0.2,
         max_tokens: int = 512,
+        response_format: Dict[str, Any] | None = None,
     ) -> str:
+        body = self._chat_body(model, messages, temperature, max_tokens, response_format)
+        return await self._post_chat(self._http.get(), body)
+
+    @staticmethod
+    def _chat_body(
+        model: str,
+        messages: List[Dict[str, Any]],
+        temperature: float,
+        max_tokens: int,
+        response_format: Dict[str, Any] | None,
+    ) -> bytes:
         payload: Dict[str, Any] = {
             "model": model,
             "messages": messages,
             "temperature": temperature,
             "max_tokens": max_tokens,
         }
+        if response_format:
+            payload["response_format"] = response_format
+        return _encode_body(payload)
 
-        # Use longer timeout for complex extraction tasks (5 minutes)
-        timeout = httpx.Timeout(300.0, connect=30.0)
+    async def _post_chat(self, client: httpx.AsyncClient, body: bytes) -> str:
+        """POST a chat completion with retry, backoff and key rotation."""
+        response = await self._open_chat(client, body, stream=False)
+        data = response.json()
+        return data["choices"][0]["message"]["content"]
+
+    async def _open_chat(self, client: httpx.AsyncClient, body: bytes, stream: bool) -> httpx.Response:
+        """
+        Send a chat completion request and return the successful response.
         
+        429s rotate to another key, or back off exponentially when none is
+        available; RuntimeError once the attempts run out. With stream=True
+        the body is left unread (the caller must close the response), so
+        retries only ever happen before any content has been consumed.
+        """
         # Retry logic with exponential backoff + key rotation
         max_retries_per_key = 2  # Try each key twice before rotating
         base_delay = 3.0
         total_attempts = 0
-        max_total_attempts = len(config.OPENAI_API_KEYS) * max_retries_per_key * 2  # Safety limit
+        max_total_attempts = max(len(config.OPENAI_API_KEYS), 1) * max_retries_per_key * 2  # Safety limit
         
-        async with httpx.AsyncClient(timeout=timeout) as client:
-            while total_attempts < max_total_attempts:
-                api_key = self._get_api_key()
-                headers = {
-                    "Authorization": f"Bearer {api_key}",
-                    "Content-Type": "application/json",
-                }
+        while total_attempts < max_total_attempts:
+            api_key = self._get_api_key()
+            headers = {
+                "Authorization": f"Bearer {api_key}",
+                "Content-Type": "application/json",
+            }
+            request = client.build_request(
+                "POST", f"{self.base_url}/chat/completions", headers=headers, content=body
+            )
+            
+            try:
+                response = await client.send(request, stream=stream)
+            except httpx.ReadTimeout:
+                raise RuntimeError(
+                    f"OpenAI API request timed out after 300 seconds. "
+                    "The document may be too large. Try reducing the document size."
+                )
+            
+            if response.status_code == 429:
+                await response.aclose()
+                total_attempts += 1
                 
-                try:
-                    response = await client.post(
-                        f"{self.base_url}/chat/completions", headers=headers, json=payload
-                    )
-                    response.raise_for_status()
-                    data = response.json()
-                    choice = data["choices"][0]["message"]["content"]
-                    
-                    # Success - mark key as good
-                    if self._key_manager:
-                        self._key_manager.reset_key_status(api_key)
-                    
-                    return choice
-                    
-                except httpx.HTTPStatusError as e:
-                    if e.response.status_code == 429:
-                        total_attempts += 1
-                        
-                        # Try to rotate to another key first
-                        if self._key_manager and self._key_manager.rotate_key("429 rate limit"):
-                            # Successfully rotated - try immediately with new key
-                            continue
-                        
-                        # No rotation available (single key or all exhausted)
-                        # Wait with exponential backoff
-                        if total_attempts < max_total_attempts:
-                            delay = min(base_delay * (2 ** (total_attempts - 1)), 60)
-                            key_info = f" (key #{self._key_manager.current_index + 1})" if self._key_manager else ""
-                            print(f"[OpenAI] Rate limited{key_info}. Waiting {delay:.0f}s...")
-                            await asyncio.sleep(delay)
-                            continue
-                        else:
-                            num_keys = len(config.OPENAI_API_KEYS)
-                            raise RuntimeError(
-                                f"OpenAI API rate limit exceeded on all {num_keys} key(s). "
-                                "All API keys are rate-limited. Wait 5-10 minutes and try again, "
-                                "or add more API keys to .env (comma-separated)."
-                            )
-                    else:
-                        # Other HTTP errors - don't retry
-                        raise
-                        
-                except httpx.ReadTimeout:
-                    raise RuntimeError(
-                        f"OpenAI API request timed out after 300 seconds. "
-                        "The document may be too large. Try reducing the document size."
-                    )
+                # Try to rotate to another key first
+                if self._key_manager and self._key_manager.rotate_key("429 rate limit"):
+                    # Successfully rotated - try immediately with new key
+                    continue
+                
+                # No rotation available (single key or all exhausted)
+                # Wait with exponential backoff
+                if total_attempts < max_total_attempts:
+                    delay = min(base_delay * (2 ** (total_attempts - 1)), 60)
+                    key_info = f" (key #{self._key_manager.current_index + 1})" if self._key_manager else ""
+                    print(f"[OpenAI] Rate limited{key_info}. Waiting {delay:.0f}s...")
+                    await asyncio.sleep(delay)
+                    continue
+                break
+            
+            if response.is_error:
+                # Other HTTP errors - don't retry
+                if stream:
+                    await response.aread()
+                    await response.aclose()
+                response.raise_for_status()
+            
+            # Success - mark key as good
+            if self._key_manager:
+                self._key_manager.reset_key_status(api_key)
+            return response
         
-        raise RuntimeError("Failed to get response from OpenAI API after all retries")
+        num_keys = len(config.OPENAI_API_KEYS)
+        raise RuntimeError(
+            f"OpenAI API rate limit exceeded on all {num_keys} key(s). "
+            "All API keys are rate-limited. Wait 5-10 minutes and try again, "
+            "or add more API keys to .env (comma-separated)."
+        )
+
+    async def chat_stream(
+        self,
+        *,
+        model: str,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.2,
+        max_tokens: int = 512,
+    ) -> AsyncIterator[str]:
+        """Stream a chat completion, yielding content deltas as they arrive."""
+        payload: Dict[str, Any] = {
+            "model": model,
+            "messages": messages,
+            "temperature": temperature,
+            "max_tokens": max_tokens,
+            "stream": True,
+        }
+        response = await self._open_chat(self._http.get(), _encode_body(payload), stream=True)
+        try:
+            async for line in response.aiter_lines():
+                if not line.startswith("data: "):
+                    continue
+                data = line[6:]
+                if data == "[DONE]":
+                    break
+                delta = json.loads(data)["choices"][0].get("delta", {}).get("content")
+                if delta:
+                    yield delta
+        except httpx.ReadTimeout:
+            raise RuntimeError("OpenAI API stream timed out waiting for more content.")
+        finally:
+            await response.aclose()
 
 
 class OpenAIEmbeddingClient:
@@ -317,14 +443,16 @@ class OllamaLLMClient:
 
     def __init__(self, base_url: str | None = None) -> None:
         self.base_url = base_url or config.OLLAMA_BASE_URL
+        self._http = _PooledHTTPClient(120.0)
 
     async def chat(
         self,
         *,
         model: str,
-        messages: List[Dict[str, str]],
+        messages: List[Dict[str, Any]],
         temperature: float = 0.2,
         max_tokens: int = 512,
+        response_format: Dict[str, Any] | None = None,
     ) -> str:
         payload: Dict[str, Any] = {
             "model": model,
@@ -335,15 +463,19 @@ class OllamaLLMClient:
                 "num_predict": max_tokens,
             },
         }
+        if response_format:
+            # Ollama takes the JSON schema itself, or "json" for free-form JSON
+            schema = response_format.get("json_schema", {}).get("schema")
+            payload["format"] = schema or "json"
 
         try:
-            async with httpx.AsyncClient(timeout=120.0) as client:
-                response = await client.post(
-                    f"{self.base_url}/api/chat",
-                    json=payload,
-                )
-                response.raise_for_status()
-                data = response.json()
+            response = await self._http.get().post(
+                f"{self.base_url}/api/chat",
+                headers=_JSON_HEADERS,
+                content=_encode_body(payload),
+            )
+            response.raise_for_status()
+            data = response.json()
         except httpx.HTTPStatusError as e:
             if e.response.status_code == 404:
                 raise RuntimeError(
@@ -358,6 +490,51 @@ class OllamaLLMClient:
 
         return data["message"]["content"]
 
+    async def chat_stream(
+        self,
+        *,
+        model: str,
+        messages: List[Dict[str, Any]],
+        temperature: float = 0.2,
+        max_tokens: int = 512,
+    ) -> AsyncIterator[str]:
+        """Stream a chat completion, yielding content deltas as they arrive."""
+        payload: Dict[str, Any] = {
+            "model": model,
+            "messages": messages,
+            "stream": True,
+            "options": {
+                "temperature": temperature,
+                "num_predict": max_tokens,
+            },
+        }
+
+        try:
+            async with self._http.get().stream(
+                "POST", f"{self.base_url}/api/chat", headers=_JSON_HEADERS, content=_encode_body(payload)
+            ) as response:
+                response.raise_for_status()
+                async for line in response.aiter_lines():
+                    if not line:
+                        continue
+                    data = json.loads(line)
+                    delta = data.get("message", {}).get("content")
+                    if delta:
+                        yield delta
+                    if data.get("done"):
+                        break
+        except httpx.HTTPStatusError as e:
+            if e.response.status_code == 404:
+                raise RuntimeError(
+                    f"Ollama model '{model}' not found. Run: ollama pull {model}"
+                ) from e
+            raise
+        except httpx.ConnectError:
+            raise RuntimeError(
+                f"Cannot connect to Ollama at {self.base_url}. "
+                "Is Ollama running? Start with: ollama serve"
+            )
+
 
 class OllamaEmbeddingClient:
     """Ollama-compatible embedding client."""
@@ -412,16 +589,106 @@ class OllamaEmbeddingClient:
         return embeddings
 
 
+# =============================================================================
+# Embedding Batching
+# =============================================================================
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent single-text embedding requests into batched calls.
+
+    Each caller awaits `embed(text)`; a single background task drains the
+    queue in batches of up to `max_batch` texts (or whatever arrived within
+    `max_wait_ms` of the first one) and makes one `embed_texts` call per batch.
+    The blocking client call runs in a worker thread so the event loop stays free.
+    """
+
+    def __init__(
+        self,
+        embedding_client: EmbeddingClientProtocol,
+        max_batch: int = 32,
+        max_wait_ms: float = 5.0,
+    ) -> None:
+        self._client = embedding_client
+        self.max_batch = max_batch
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue: asyncio.Queue | None = None
+        self._worker: asyncio.Task | None = None
+
+    def _ensure_worker(self) -> asyncio.Queue:
+        """Start the background drain task on the running loop if needed."""
+        if self._worker is None or self._worker.done():
+            self._queue = asyncio.Queue()
+            self._worker = asyncio.get_running_loop().create_task(self._drain())
+        return self._queue
+
+    async def embed(self, text: str) -> List[float]:
+        """Embed a single text, sharing the upstream call with concurrent callers."""
+        queue = self._ensure_worker()
+        future = asyncio.get_running_loop().create_future()
+        await queue.put((text, future))
+        return await future
+
+    async def _drain(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), remaining))
+                except asyncio.TimeoutError:
+                    break
+
+            texts = [text for text, _ in batch]
+            try:
+                embeddings = await asyncio.to_thread(self._client.embed_texts, texts)
+            except Exception as e:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            if len(embeddings) != len(batch):
+                error = RuntimeError(
+                    f"Embedding API returned {len(embeddings)} embeddings for {len(batch)} texts"
+                )
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(error)
+                continue
+
+            for (_, future), embedding in zip(batch, embeddings):
+                if not future.done():
+                    future.set_result(embedding)
+
+
 # =============================================================================
 # Factory Functions
 # =============================================================================
 
+_llm_clients: Dict[str, LLMClientProtocol] = {}
+
+
 def get_llm_client() -> LLMClientProtocol:
-    """Create and return the appropriate LLM client based on LLM_PROVIDER."""
-    if config.LLM_PROVIDER == "ollama":
-        return OllamaLLMClient()
-    else:
-        return OpenAILLMClient()
+    """Return the process-wide LLM client for LLM_PROVIDER (created on first use)."""
+    client = _llm_clients.get(config.LLM_PROVIDER)
+    if client is None:
+        if config.LLM_PROVIDER == "ollama":
+            client = OllamaLLMClient()
+        else:
+            client = OpenAILLMClient()
+        _llm_clients[config.LLM_PROVIDER] = client
+    return client
+
+
+async def close_llm_clients() -> None:
+    """Close the connection pools of every process-wide LLM client."""
+    for client in _llm_clients.values():
+        await client._http.aclose()
 
 
 def get_embedding_client() -> EmbeddingClientProtocol:
@@ -432,5 +699,16 @@ def get_embedding_client() -> EmbeddingClientProtocol:
         return OpenAIEmbeddingClient()
 
 
+_embedding_batcher: EmbeddingBatcher | None = None
+
+
+def get_embedding_batcher() -> EmbeddingBatcher:
+    """Return the process-wide embedding batcher for single-text query embeddings."""
+    global _embedding_batcher
+    if _embedding_batcher is None:
+        _embedding_batcher = EmbeddingBatcher(get_embedding_client())
+    return _embedding_batcher
+
+
 
 
@@ -19,7 +19,7 @@ from typing import Any, Dict, List, Optional
 import numpy as np
 
 from config import config
-from models import get_llm_client, get_embedding_client
+from models import get_llm_client, get_embedding_client, get_embedding_batcher
 
 # Database URL from environment
 DATABASE_URL = os.environ.get("DATABASE_URL", "")
@@ -216,9 +216,8 @@ async def semantic_search_pg(
     kb = knowledge_base or _active_knowledge_base
     pool = await get_pool()
     
-    # Generate query embedding
-    embedding_client = get_embedding_client()
-    query_embedding = embedding_client.embed_texts([query])[0]
+    # Generate query embedding (batched with concurrent searches)
+    query_embedding = await get_embedding_batcher().embed(query)
     query_embedding_str = "[" + ",".join(str(x) for x in query_embedding) + "]"
     
     # Fetch initial candidates (get more if reranking)
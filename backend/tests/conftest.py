@@ -0,0 +1,33 @@
+"""
+Shared pytest setup for the backend tests.
+
+The backend uses flat imports (``import workflow_executor``), so the backend
+directory goes on sys.path, and settings that config reads at import time
+are pinned before any backend module is imported.
+"""
+import os
+import sys
+from pathlib import Path
+
+import pytest
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BACKEND_DIR))
+
+# No real keys, and never read or write the app's own cache files
+os.environ.setdefault("OPENAI_API_KEY", "test-key")
+os.environ["WORKFLOW_CACHE_ENABLED"] = "false"
+os.environ["UPLOAD_CACHE_ENABLED"] = "false"
+
+
+@pytest.fixture(autouse=True)
+def _reset_shared_state():
+    """Clear module-level caches so tests don't see each other's results."""
+    import workflow_builder_llm
+    import workflow_executor
+
+    workflow_executor._AGENT_CACHE.clear()
+    workflow_builder_llm.invalidate_response_cache()
+    yield
+    workflow_executor._AGENT_CACHE.clear()
+    workflow_builder_llm.invalidate_response_cache()
@@ -0,0 +1,121 @@
+"""Tests for workflow_builder_llm: JSON repair, template routing and the response cache."""
+import asyncio
+from typing import Any, List
+
+import pytest
+
+import workflow_builder_llm as wb
+
+NODES = '{"nodes":[{"id":"prompt-1","data":{"nodeType":"prompt"}},{"id":"supervisor-1","data":{"nodeType":"supervisor"}}],'
+EDGE = '{"id":"e1","source":"prompt-1","target":"supervisor-1"}'
+
+
+@pytest.fixture
+def stored(monkeypatch) -> List[Any]:
+    """Record what _finalize_build would cache instead of caching it."""
+    calls: List[Any] = []
+
+    async def fake_store(*args):
+        calls.append(args)
+
+    monkeypatch.setattr(wb, "_cache_store", fake_store)
+    return calls
+
+
+def _finalize(response: str):
+    explanation, workflow, repaired = wb._split_fenced_json(response)
+    return asyncio.run(wb._finalize_build(
+        "key", "hi", None, response, explanation, workflow, None, repaired
+    ))
+
+
+def test_split_fenced_json_parses_complete_block():
+    explanation, workflow, repaired = wb._split_fenced_json(
+        f"Here it is\n```json\n{NODES}\"edges\":[{EDGE}]}}\n```"
+    )
+
+    assert explanation == "Here it is"
+    assert workflow["edges"][0]["target"] == "supervisor-1"
+    assert repaired is False
+
+
+def test_complete_workflow_is_cached(stored):
+    result = _finalize(f"Explanation\n```json\n{NODES}\"edges\":[{EDGE}]}}\n```")
+
+    assert result["workflow"] is not None
+    assert "repaired" not in result
+    assert len(stored) == 1
+
+
+def test_truncated_workflow_is_repaired_but_not_cached(stored):
+    # Cut off by max_tokens: no closing brackets or fence
+    result = _finalize(f"Explanation\n```json\n{NODES}\"edges\":[{EDGE},")
+
+    assert result["repaired"] is True
+    assert [e["target"] for e in result["workflow"]["edges"]] == ["supervisor-1"]
+    assert stored == []
+
+
+def test_repair_with_dangling_edge_is_rejected(stored):
+    dangling = '{"id":"e1","source":"prompt-1","target":"agent-9"}'
+    result = _finalize(f"Explanation\n```json\n{NODES}\"edges\":[{dangling}")
+
+    assert result["workflow"] is None
+    assert result["error"] == "json_parse_failed"
+    assert stored == []
+
+
+def test_repair_outcomes_are_logged(caplog, stored):
+    with caplog.at_level("INFO", logger="workflow"):
+        _finalize(f"Explanation\n```json\n{NODES}\"edges\":[{EDGE},")
+        _finalize("Explanation\n```json\n{\"nodes\": [}\n```")
+
+    levels = {record.getMessage().split(":")[0]: record.levelname for record in caplog.records}
+    assert levels["[WORKFLOW_BUILDER] Repaired malformed workflow JSON"] == "INFO"
+    assert levels["[WORKFLOW_BUILDER] Failed to parse workflow JSON"] == "WARNING"
+
+
+def test_template_request_skips_llm(monkeypatch):
+    class NoLLM:
+        async def chat(self, **kwargs):
+            raise AssertionError("template hits must not call the LLM")
+
+        async def chat_stream(self, **kwargs):
+            raise AssertionError("template hits must not call the LLM")
+            yield
+
+    monkeypatch.setattr(wb, "_LLM_CLIENT", NoLLM())
+    monkeypatch.setattr(wb, "_MODEL_CONFIG", {"small": "small", "large": "large"})
+
+    result = asyncio.run(wb.build_workflow_from_chat("Turn PDF documents into an Excel spreadsheet"))
+
+    assert result["template_hit"] == "pdf_to_excel"
+    assert result["workflow"]["nodes"]
+    # Handed out as a copy: editing it leaves the shared template alone
+    result["workflow"]["nodes"].clear()
+    assert wb.get_example_workflow("pdf_to_excel")["nodes"]
+
+
+def test_memory_cache_returns_copies():
+    wb._memory_cache_put("key", "hist", [1.0, 0.0], {"explanation": "e", "workflow": {"nodes": [1]}})
+
+    first = wb._memory_cache_get("key", "hist", None)
+    first["workflow"]["nodes"].append(2)
+
+    assert wb._memory_cache_get("key", "hist", None)["workflow"]["nodes"] == [1]
+
+
+def test_memory_cache_semantic_hit_requires_same_history():
+    wb._memory_cache_put("key", "hist", [1.0, 0.0], {"explanation": "e", "workflow": {"nodes": []}})
+    near = wb._normalize([0.99, 0.05])
+
+    assert wb._memory_cache_get("other", "hist", near)["explanation"] == "e"
+    assert wb._memory_cache_get("other", "another-hist", near) is None
+    assert wb._memory_cache_get("other", "hist", wb._normalize([0.0, 1.0])) is None
+
+
+def test_list_example_workflows_returns_fresh_dicts():
+    listed = wb.list_example_workflows()
+    listed[0]["name"] = "changed"
+
+    assert wb.list_example_workflows()[0]["name"] != "changed"
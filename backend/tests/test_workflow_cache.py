@@ -0,0 +1,74 @@
+"""Tests for the SQLite-backed WorkflowCache."""
+import asyncio
+import sqlite3
+
+import pytest
+
+from workflow_cache import WorkflowCache
+
+
+@pytest.fixture
+def cache(tmp_path):
+    cache = WorkflowCache(tmp_path / "workflow_cache.db")
+    yield cache
+    cache.close()
+
+
+def _result(i: int):
+    return {"workflow": {"i": i}, "explanation": f"workflow {i}"}
+
+
+def test_exact_and_semantic_lookup(cache):
+    async def run():
+        await cache.put("k1", "make a chart", _result(1), [1.0, 0.0, 0.0])
+        await cache.put("k2", "draw a cat", _result(2), [0.0, 1.0, 0.0])
+        return (
+            await cache.get("k1"),
+            await cache.get("missing"),
+            await cache.search([0.05, 0.99, 0.0]),
+            await cache.search([0.0, 0.0, 1.0]),
+        )
+
+    exact, missing, near, far = asyncio.run(run())
+
+    assert exact == {"workflow": {"i": 1}, "explanation": "workflow 1"}
+    assert missing is None
+    assert near["workflow"] == {"i": 2}
+    assert far is None
+
+
+def test_concurrent_operations_reuse_thread_connections(cache):
+    async def run():
+        await asyncio.gather(*(cache.put(f"k{i}", "m", _result(i), [1.0, float(i)]) for i in range(20)))
+        return await asyncio.gather(*(cache.get(f"k{i}") for i in range(20)))
+
+    results = asyncio.run(run())
+
+    assert [r["workflow"]["i"] for r in results] == list(range(20))
+    # At most one connection per worker thread, not one per operation
+    assert 0 < len(cache._connections) < 20
+
+
+def test_database_is_in_wal_mode(cache):
+    asyncio.run(cache.get("k"))
+
+    conn = sqlite3.connect(cache.db_path)
+    try:
+        assert conn.execute("PRAGMA journal_mode").fetchone() == ("wal",)
+    finally:
+        conn.close()
+
+
+def test_clear_and_reuse_after_close(cache):
+    async def run():
+        await cache.put("k", "m", _result(1))
+        await cache.clear()
+        cleared = await cache.get("k")
+        cache.close()
+        await cache.put("k", "m", _result(2))
+        return cleared, await cache.get("k")
+
+    cleared, reopened = asyncio.run(run())
+
+    assert cleared is None
+    assert reopened["workflow"] == {"i": 2}
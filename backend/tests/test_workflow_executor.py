@@ -0,0 +1,270 @@
+"""Scheduling tests for workflow_executor, run against fake agents and a fake LLM."""
+import asyncio
+import json
+from typing import Any, Dict, List, Tuple
+
+import pytest
+
+import workflow_executor as we
+from agents.base import AgentResult
+from agents.orchestrator import OrchestratorAgent
+from config import config
+
+
+def _node(node_id: str) -> Dict[str, Any]:
+    return {"id": node_id, "data": {"nodeType": node_id.split("-")[0]}}
+
+
+def _edge(source: str, target: str) -> Dict[str, str]:
+    return {"source": source, "target": target}
+
+
+def _run(nodes: List[str], edges: List[Tuple[str, str]]) -> List[Tuple[str, Dict[str, Any]]]:
+    """Execute a workflow and return its SSE events as (event type, data) pairs."""
+    async def collect() -> bytes:
+        out = b""
+        async for chunk in we.execute_workflow(
+            "hi", [_node(n) for n in nodes], [_edge(s, t) for s, t in edges]
+        ):
+            out += chunk
+        return out
+
+    events = []
+    for frame in asyncio.run(collect()).split(b"\n\n"):
+        if not frame:
+            continue
+        header, data = frame.split(b"\n", 1)
+        events.append((header[len(b"event: "):].decode(), json.loads(data[len(b"data: "):])))
+    return events
+
+
+def _completed(events: List[Tuple[str, Dict[str, Any]]]) -> Dict[str, Dict[str, Any]]:
+    """Trace step of every agent_complete event, by node id."""
+    return {data["agent"]: data["step"] for event, data in events if event == "agent_complete"}
+
+
+class FakeLLM:
+    """Orchestrator replies: the decision streams first, then slow reasoning."""
+
+    REPLY = [
+        '{"tools_to_execute": ["image_',
+        'generator"], "image_prompt": "a cat",',
+        ' "image_type": "photo",',
+        ' "reasoning": "long',
+        ' reasoning text"}',
+    ]
+
+    def __init__(self, log: List[str]) -> None:
+        self.log = log
+
+    async def chat(self, **kwargs) -> str:
+        await asyncio.sleep(0.05)
+        return "".join(self.REPLY)
+
+    async def chat_stream(self, **kwargs):
+        for part in self.REPLY:
+            await asyncio.sleep(0.05)
+            self.log.append(f"chunk {part[:12]}")
+            yield part
+
+
+@pytest.fixture
+def fake_llm(monkeypatch):
+    log: List[str] = []
+    monkeypatch.setattr(we, "_LLM_CLIENT", FakeLLM(log))
+    monkeypatch.setattr(we, "_MODEL_FOR_DEFAULT", {"small": "small", "large": "large", "embedding": None})
+    return log
+
+
+def test_parallel_merge_matches_sequential_order(monkeypatch):
+    # Branches finish in reverse declaration order; the merge must not
+    async def fake_agent(node_type, user_message, context, settings, **kwargs):
+        await asyncio.sleep({"semantic_search": 0.06, "sampler": 0.04, "translator": 0.02}.get(node_type, 0))
+        updates = {"context_snippets": [node_type]}
+        if node_type == "synthesis":
+            updates["final_answer"] = "|".join(context["context_snippets"])
+        return AgentResult(agent=node_type, model="m", action="a", content=node_type, context_updates=updates)
+
+    monkeypatch.setattr(we, "_execute_agent", fake_agent)
+
+    events = _run(
+        ["prompt-1", "semantic_search-1", "sampler-1", "translator-1", "synthesis-1", "response-1"],
+        [
+            ("prompt-1", "semantic_search-1"), ("prompt-1", "sampler-1"), ("prompt-1", "translator-1"),
+            ("semantic_search-1", "synthesis-1"), ("sampler-1", "synthesis-1"),
+            ("translator-1", "synthesis-1"), ("synthesis-1", "response-1"),
+        ],
+    )
+
+    completions = [data["agent"] for event, data in events if event == "agent_complete"]
+    assert completions.index("translator-1") < completions.index("semantic_search-1")
+    assert events[-1][0] == "done"
+    assert events[-1][1]["answer"] == "semantic_search|sampler|translator"
+
+
+def test_supervisor_excludes_unselected_branch(monkeypatch):
+    async def fake_agent(node_type, user_message, context, settings, **kwargs):
+        updates = {"supervisor_guidance": "WORKFLOW PATH: IMAGE_GENERATOR"} if node_type == "supervisor" else {}
+        return AgentResult(agent=node_type, model="m", action="a", content=node_type, context_updates=updates)
+
+    monkeypatch.setattr(we, "_execute_agent", fake_agent)
+
+    steps = _completed(_run(
+        ["prompt-1", "supervisor-1", "semantic_search-1", "image_generator-1", "response-1"],
+        [
+            ("prompt-1", "supervisor-1"), ("supervisor-1", "semantic_search-1"),
+            ("supervisor-1", "image_generator-1"), ("semantic_search-1", "response-1"),
+            ("image_generator-1", "response-1"),
+        ],
+    ))
+
+    assert steps["semantic_search-1"]["action"] == "exclude"
+    assert steps["image_generator-1"]["action"] == "a"
+
+
+def test_orchestrator_excludes_unselected_branch(monkeypatch):
+    started: List[str] = []
+
+    async def fake_agent(node_type, user_message, context, settings, **kwargs):
+        started.append(node_type)
+        updates = {}
+        if node_type == "orchestrator":
+            updates["orchestrator_result"] = {"tools_to_execute": ["image_generator"]}
+        return AgentResult(agent=node_type, model="m", action="a", content=node_type, context_updates=updates)
+
+    monkeypatch.setattr(we, "_execute_agent", fake_agent)
+
+    steps = _completed(_run(
+        ["prompt-1", "orchestrator-1", "image_generator-1", "sampler-1", "synthesis-1", "response-1"],
+        [
+            ("prompt-1", "orchestrator-1"), ("orchestrator-1", "image_generator-1"),
+            ("orchestrator-1", "sampler-1"), ("sampler-1", "synthesis-1"),
+            ("synthesis-1", "response-1"), ("image_generator-1", "response-1"),
+        ],
+    ))
+
+    assert "sampler" not in started and "synthesis" not in started
+    assert steps["sampler-1"]["action"] == "exclude"
+    assert steps["image_generator-1"]["action"] == "a"
+
+
+def test_failed_node_cancels_running_siblings(monkeypatch):
+    cancelled: List[str] = []
+
+    async def fake_agent(node_type, user_message, context, settings, **kwargs):
+        if node_type == "translator":
+            await asyncio.sleep(0.01)
+            raise RuntimeError("translator failed")
+        try:
+            await asyncio.sleep(5)
+        except asyncio.CancelledError:
+            cancelled.append(node_type)
+            raise
+        return AgentResult(agent=node_type, model="m", action="a", content=node_type)
+
+    monkeypatch.setattr(we, "_execute_agent", fake_agent)
+
+    async def run() -> Tuple[bytes, List[str]]:
+        chunks = [
+            chunk async for chunk in we.execute_workflow(
+                "hi",
+                [_node(n) for n in ("prompt-1", "semantic_search-1", "translator-1", "response-1")],
+                [
+                    _edge("prompt-1", "semantic_search-1"), _edge("prompt-1", "translator-1"),
+                    _edge("semantic_search-1", "response-1"), _edge("translator-1", "response-1"),
+                ],
+            )
+        ]
+        # Let the cancellation reach the sibling; checked here, since shutting
+        # the loop down would cancel a leftover task anyway
+        await asyncio.sleep(0)
+        return b"".join(chunks), list(cancelled)
+
+    output, cancelled_before_shutdown = asyncio.run(asyncio.wait_for(run(), timeout=2))
+
+    assert b"event: error" in output and b"translator failed" in output
+    assert cancelled_before_shutdown == ["semantic_search"]
+
+
+def test_early_decision_releases_branch_before_orchestrator_finishes(monkeypatch, fake_llm):
+    execute_agent = we._execute_agent
+
+    async def traced_agent(node_type, user_message, context, settings, **kwargs):
+        if node_type == "orchestrator":
+            result = await execute_agent(node_type, user_message, context, settings, **kwargs)
+            fake_llm.append("end orchestrator")
+            return result
+        fake_llm.append(f"start {node_type}")
+        return AgentResult(agent=node_type, model="m", action="a", content=node_type)
+
+    monkeypatch.setattr(we, "_execute_agent", traced_agent)
+    monkeypatch.setattr(config, "ORCHESTRATOR_EARLY_DECISION", True)
+
+    steps = _completed(_run(
+        ["prompt-1", "orchestrator-1", "image_generator-1", "sampler-1", "response-1"],
+        [
+            ("prompt-1", "orchestrator-1"), ("orchestrator-1", "image_generator-1"),
+            ("orchestrator-1", "sampler-1"), ("image_generator-1", "response-1"),
+            ("sampler-1", "response-1"),
+        ],
+    ))
+
+    # Released once the image fields streamed in, while the reasoning was still arriving
+    assert fake_llm.index("start image_generator") < fake_llm.index("chunk  \"reasoning\"")
+    assert fake_llm.index("start image_generator") < fake_llm.index("end orchestrator")
+    assert "start sampler" not in fake_llm
+    assert steps["sampler-1"]["action"] == "exclude"
+    assert steps["orchestrator-1"]["content"] == "Decided to use: image_generator"
+
+
+def test_early_decision_disabled_waits_for_orchestrator(monkeypatch, fake_llm):
+    execute_agent = we._execute_agent
+
+    async def traced_agent(node_type, user_message, context, settings, **kwargs):
+        if node_type == "orchestrator":
+            assert kwargs.get("on_decision") is None
+            result = await execute_agent(node_type, user_message, context, settings, **kwargs)
+            fake_llm.append("end orchestrator")
+            return result
+        fake_llm.append(f"start {node_type}")
+        return AgentResult(agent=node_type, model="m", action="a", content=node_type)
+
+    monkeypatch.setattr(we, "_execute_agent", traced_agent)
+    monkeypatch.setattr(config, "ORCHESTRATOR_EARLY_DECISION", False)
+
+    _run(
+        ["prompt-1", "orchestrator-1", "image_generator-1", "response-1"],
+        [("prompt-1", "orchestrator-1"), ("orchestrator-1", "image_generator-1"), ("image_generator-1", "response-1")],
+    )
+
+    assert fake_llm == ["end orchestrator", "start image_generator"]
+
+
+def test_orchestrator_records_disagreement_with_streamed_decision():
+    class DisagreeingLLM:
+        # The tools list is first seen outside the JSON object the final parse reads
+        async def chat_stream(self, **kwargs):
+            yield 'Draft: "tools_to_execute": ["web_search"]\n'
+            yield '{"tools_to_execute": [], "reasoning": "search results suffice"}'
+
+    decisions: List[Dict[str, Any]] = []
+    result = asyncio.run(OrchestratorAgent(DisagreeingLLM()).execute(
+        "hi", {"available_tools": ["web_search"]}, model="m", on_decision=decisions.append,
+    ))
+
+    assert [d["tools_to_execute"] for d in decisions] == [["web_search"]]
+    # The streamed decision stands (downstream may already be running on it)
+    assert result.context_updates["tools_to_execute"] == ["web_search"]
+    assert result.metadata["streamed_decision"]["tools_to_execute"] == ["web_search"]
+    assert result.metadata["final_decision"]["tools_to_execute"] == []
+
+
+def test_orchestrator_agreement_adds_no_disagreement_metadata():
+    decisions: List[Dict[str, Any]] = []
+    result = asyncio.run(OrchestratorAgent(FakeLLM([])).execute(
+        "hi", {"available_tools": ["image_generator"]}, model="m", on_decision=decisions.append,
+    ))
+
+    assert decisions[0]["image_prompt"] == "a cat"
+    assert result.context_updates["orchestrator_result"]["reasoning"] == "long reasoning text"
+    assert "final_decision" not in result.metadata
@@ -5,16 +5,48 @@ This LLM understands the available node types and can suggest/build
 workflows based on natural language descriptions.
 """
 
+import asyncio
+import copy
+import hashlib
+import io
 import json
+import logging
 import re
-from typing import Any, Dict, List, Optional
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Final, List, Mapping, Optional, Tuple
+
+import numpy as np
 
 from config import config
-from models import get_llm_client
+from models import get_embedding_batcher, get_llm_client
+from workflow_cache import get_workflow_cache
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Get workflow logger
+logger = logging.getLogger("workflow")
+
+
+def _json_loads(text: str) -> Any:
+    """Parse JSON with orjson when available (raises json.JSONDecodeError either way)."""
+    if orjson is not None:
+        return orjson.loads(text)
+    return json.loads(text)
+
+
+def _json_dumps_compact(obj: Any) -> str:
+    """Compact, key-sorted JSON; non-JSON values are stringified."""
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=orjson.OPT_SORT_KEYS).decode()
+    return json.dumps(obj, separators=(",", ":"), sort_keys=True, ensure_ascii=False, default=str)
 
 
 # Node type definitions for the LLM
-NODE_DEFINITIONS = """
+NODE_DEFINITIONS: Final[str] = """
 === AVAILABLE NODE TYPES ===
 
 ## INPUT NODES (Start workflows with ONE of these)
@@ -167,7 +199,7 @@ Pattern 8: React Component Generation
 prompt → supervisor → formatting (outputFormat: tsx) → code_viewer
 """
 
-SYSTEM_PROMPT = f"""You are a Workflow Builder Assistant. You help users create AI agent workflows by understanding their needs and generating workflow configurations.
+SYSTEM_PROMPT: Final[str] = f"""You are a Workflow Builder Assistant. You help users create AI agent workflows by understanding their needs and generating workflow configurations.
 
 {NODE_DEFINITIONS}
 
@@ -264,188 +296,957 @@ Response Format:
 """
 
 
+# Node types described in NODE_DEFINITIONS
+_NODE_TYPES = (
+    "prompt", "upload", "supervisor", "orchestrator",
+    "semantic_search", "sampler", "synthesis", "summarization",
+    "formatting", "transformer", "image_generator", "translator",
+    "response", "spreadsheet", "code_viewer",
+)
+
+# Critique doesn't need the full node catalogue or output-format rules the
+# builder prompt carries; just the node names and the structural rules
+SUGGESTION_SYSTEM_PROMPT: Final[str] = f"""You are a workflow critique assistant. Review the JSON workflow for missing nodes, bad ordering, and suboptimal settings.
+
+Node types: {", ".join(_NODE_TYPES)}
+
+Rules a good workflow follows:
+- Starts with exactly one input node: 'upload' for files, 'prompt' for text queries
+- Has a 'supervisor' right after the input node
+- Prompt workflows include 'semantic_search' after the supervisor; upload workflows don't need it
+- Ends with 'spreadsheet' for structured data, otherwise 'response'
+
+Respond with plain-language suggestions (no markdown formatting), followed by an optional improved workflow in a ```json block using the same format as the input."""
+
+
+# Structured-output schema for JSON-mode builds. Settings differ per node
+# type, so they stay an open object and the schema is not strict.
+WORKFLOW_JSON_SCHEMA: Dict[str, Any] = {
+    "type": "object",
+    "properties": {
+        "name": {"type": "string"},
+        "description": {"type": "string"},
+        "nodes": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "string"},
+                    "type": {"type": "string", "enum": ["workflow"]},
+                    "position": {
+                        "type": "object",
+                        "properties": {"x": {"type": "number"}, "y": {"type": "number"}},
+                        "required": ["x", "y"],
+                    },
+                    "data": {
+                        "type": "object",
+                        "properties": {
+                            "nodeType": {
+                                "type": "string",
+                                "enum": list(_NODE_TYPES),
+                            },
+                            "label": {"type": "string"},
+                            "settings": {"type": "object"},
+                        },
+                        "required": ["nodeType", "label", "settings"],
+                    },
+                },
+                "required": ["id", "type", "position", "data"],
+            },
+        },
+        "edges": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "id": {"type": "string"},
+                    "source": {"type": "string"},
+                    "target": {"type": "string"},
+                },
+                "required": ["id", "source", "target"],
+            },
+        },
+    },
+    "required": ["name", "nodes", "edges"],
+}
+
+_WORKFLOW_RESPONSE_FORMAT: Dict[str, Any] = {
+    "type": "json_schema",
+    "json_schema": {"name": "workflow", "schema": WORKFLOW_JSON_SCHEMA, "strict": False},
+}
+
+# Appended to the user turn (not the system prompt, which stays cacheable)
+_JSON_ONLY_INSTRUCTION = "\n\nRespond with only the workflow JSON object, no explanation."
+
+_EXPLANATION_SYSTEM_PROMPT = (
+    "You explain AI agent workflows to users. Write plain, natural language "
+    "with no markdown formatting."
+)
+
+
+# Built once and shared by reference across requests (never mutated), so the
+# serialized prefix is byte-identical on every call
+_SYSTEM_MESSAGE = {"role": "system", "content": SYSTEM_PROMPT}
+_SUGGESTION_SYSTEM_MESSAGE = {"role": "system", "content": SUGGESTION_SYSTEM_PROMPT}
+
+
+# Nodes injected into LLM-built workflows that lack an input node or supervisor.
+# Deep-copied on use so callers never share nested dicts with the template.
+_UPLOAD_NODE_TEMPLATE: Dict[str, Any] = {
+    "id": "upload-1",
+    "type": "workflow",
+    "position": {"x": 100, "y": 100},
+    "data": {
+        "nodeType": "upload",
+        "label": "Upload",
+        "settings": {},
+        "uploadedFiles": []
+    }
+}
+
+_PROMPT_NODE_TEMPLATE: Dict[str, Any] = {
+    "id": "prompt-1",
+    "type": "workflow",
+    "position": {"x": 100, "y": 100},
+    "data": {
+        "nodeType": "prompt",
+        "label": "Prompt",
+        "settings": {},
+        "promptText": ""
+    }
+}
+
+_SUPERVISOR_NODE_TEMPLATE: Dict[str, Any] = {
+    "id": "supervisor-1",
+    "type": "workflow",
+    "position": {"x": 350, "y": 100},
+    "data": {
+        "nodeType": "supervisor",
+        "label": "Supervisor Agent",
+        "settings": {
+            "planningStyle": "optimized",
+            "optimizationLevel": "basic",
+            "supervisorPrompt": ""
+        }
+    }
+}
+
+
+# Messages mentioning files get an upload input node. Substring match on
+# purpose so that "pdfs" or "uploaded" count as well.
+_UPLOAD_KEYWORDS_RE = re.compile(
+    r'upload|file|pdf|document|csv|excel|spreadsheet', re.IGNORECASE
+)
+
+
+# Markdown cleanup for explanations, fused into one alternation so the text
+# is scanned once: code blocks, headers, bold, italic, horizontal rules
+_MD_ALL_RE = re.compile(
+    r'(```[a-z]*\n.*?```)'
+    r'|(^#{1,6}\s+)'
+    r'|\*\*([^*]+)\*\*'
+    r'|\*([^*]+)\*'
+    r'|(^---+$)',
+    re.MULTILINE | re.DOTALL,
+)
+_WS_RE = re.compile(r'\n{3,}')
+
+
+def _md_replace(match: re.Match) -> str:
+    """Keep the inner text of emphasis; drop every other markdown construct."""
+    return match.group(3) or match.group(4) or ""
+
+
+def _clean_markdown(text: str) -> str:
+    """Strip markdown formatting from an LLM explanation in one scan."""
+    text = _MD_ALL_RE.sub(_md_replace, text)
+    # Whitespace runs can only be collapsed after removals; skip the second
+    # pass entirely when there is nothing to collapse
+    if "\n\n\n" in text:
+        text = _WS_RE.sub('\n\n', text)
+    return text.strip()
+
+
+# Output token budget: explanation overhead plus a per-node JSON allowance
+_MAX_OUTPUT_TOKENS = 2000
+_BASE_OUTPUT_TOKENS = 400
+_TOKENS_PER_NODE = 120
+
+# Workflows at or below this size are critiqued with the small model
+_SMALL_MODEL_MAX_NODES = 6
+
+
+# Conversation history window sent with build requests
+_MAX_HISTORY_TURNS = 6
+_MAX_HISTORY_CHARS = 8000
+
+# JSON-mode builds get their explanation from a separate short call
+_EXPLANATION_MAX_TOKENS = 300
+
+
+def _estimate_max_tokens(expected_node_count: int) -> int:
+    """Size max_tokens to the workflow we expect back instead of a flat 2000."""
+    return min(_MAX_OUTPUT_TOKENS, _BASE_OUTPUT_TOKENS + _TOKENS_PER_NODE * expected_node_count)
+
+
+def _expected_node_count(user_message: str) -> int:
+    """Rough node count for a requested workflow: a 5-node baseline that grows with the description."""
+    return 5 + len(user_message) // 80
+
+
+# How much new streamed text to accumulate between fence checks
+_STREAM_SCAN_INTERVAL = 256
+
+
+async def _collect_response(llm_client, **chat_kwargs) -> str:
+    """
+    Get the LLM response, streaming it when the client supports it.
+    
+    The explanation precedes the ```json block, so once its closing fence
+    has arrived everything we parse is available and the rest of the
+    stream is dropped instead of waiting for trailing tokens.
+    Falls back to a blocking `chat()` call for non-streaming clients.
+    """
+    if not hasattr(llm_client, "chat_stream"):
+        return await llm_client.chat(**chat_kwargs)
+    
+    buffer = io.StringIO()
+    fence_start = -1
+    last_scan = 0
+    stream = llm_client.chat_stream(**chat_kwargs)
+    try:
+        async for chunk in stream:
+            buffer.write(chunk)
+            if buffer.tell() - last_scan < _STREAM_SCAN_INTERVAL:
+                continue
+            
+            text = buffer.getvalue()
+            # Re-scan a few chars back so a fence split across chunks is found
+            scan_from = max(last_scan - 7, 0)
+            last_scan = len(text)
+            if fence_start < 0:
+                fence_start = text.find("```json", scan_from)
+                if fence_start < 0:
+                    continue
+            fence_end = text.find("```", max(scan_from, fence_start + 7))
+            if fence_end >= 0:
+                return text[:fence_end + 3]
+    finally:
+        await stream.aclose()
+    
+    return buffer.getvalue()
+
+
+# Trailing commas before a closing bracket, the most common LLM JSON slip
+_TRAILING_COMMA_RE = re.compile(r',(\s*[}\]])')
+
+
+def _try_repair_json(text: str) -> Optional[Any]:
+    """
+    Best-effort repair of almost-valid JSON from an LLM: drop trailing commas
+    and close any strings/brackets left open by a truncated reply.
+    Returns the parsed value, or None if it still doesn't parse.
+    """
+    text = _TRAILING_COMMA_RE.sub(r'\1', text.strip())
+    
+    closers = []
+    in_string = False
+    escaped = False
+    for ch in text:
+        if in_string:
+            if escaped:
+                escaped = False
+            elif ch == "\\":
+                escaped = True
+            elif ch == '"':
+                in_string = False
+        elif ch == '"':
+            in_string = True
+        elif ch in "{[":
+            closers.append("}" if ch == "{" else "]")
+        elif ch in "}]" and closers:
+            closers.pop()
+    
+    if in_string:
+        text += '"'
+    text = text.rstrip().rstrip(",")
+    text += "".join(reversed(closers))
+    
+    try:
+        return _json_loads(text)
+    except json.JSONDecodeError:
+        return None
+
+
+def _parse_json_block(text: str) -> Tuple[Optional[Any], bool]:
+    """
+    Parse a JSON block, falling back to a local repair instead of a new LLM call.
+    Returns (parsed value or None, whether the repair was needed).
+    """
+    try:
+        return _json_loads(text), False
+    except json.JSONDecodeError as e:
+        repaired = _try_repair_json(text)
+        if repaired is None:
+            logger.warning("[WORKFLOW_BUILDER] Failed to parse workflow JSON: %s", e)
+            return None, False
+        logger.info("[WORKFLOW_BUILDER] Repaired malformed workflow JSON: %s", e)
+        return repaired, True
+
+
+def _split_fenced_json(response: str) -> Tuple[str, Optional[Dict[str, Any]], bool]:
+    """
+    Split an LLM response into (text before the fence, parsed JSON block, repaired).
+    
+    Prefers a ```json fence and falls back to a bare ```. Each fence is
+    located with a single forward scan. A block cut off before its closing
+    fence (max_tokens reached) is repaired if possible, and flagged as such.
+    If nothing parses, the whole response is returned as text with None.
+    """
+    idx = response.find("```json")
+    fence_len = 7
+    if idx < 0:
+        idx = response.find("```")
+        fence_len = 3
+    if idx < 0:
+        return response, None, False
+    
+    end = response.find("```", idx + fence_len)
+    parsed, repaired = _parse_json_block(response[idx + fence_len:end if end >= 0 else None])
+    if parsed is None:
+        return response, None, False
+    return response[:idx].strip(), parsed, repaired
+
+
+def _has_dangling_edges(workflow: Dict[str, Any]) -> bool:
+    """True if any edge points at a node id the workflow doesn't define."""
+    node_ids = {node.get("id") for node in workflow.get("nodes") or [] if isinstance(node, dict)}
+    for edge in workflow.get("edges") or []:
+        if not isinstance(edge, dict):
+            return True
+        if edge.get("source") not in node_ids or edge.get("target") not in node_ids:
+            return True
+    return False
+
+
+# LLM client and model ids, resolved on first use and reused across requests
+_LLM_CLIENT = None
+_MODEL_CONFIG: Optional[Dict[str, str]] = None
+
+
+def _get_cached_client() -> Tuple[Any, Dict[str, str]]:
+    """Return the shared (LLM client, model config) pair."""
+    global _LLM_CLIENT, _MODEL_CONFIG
+    if _LLM_CLIENT is None:
+        _LLM_CLIENT = get_llm_client()
+        _MODEL_CONFIG = config.get_model_config()
+    return _LLM_CLIENT, _MODEL_CONFIG
+
+
+# Caps concurrent builder LLM calls so combined/parallel requests don't swamp the provider
+_LLM_SEM = asyncio.Semaphore(config.MAX_CONCURRENT_LLM)
+
+
+# Single-flight registry: identical requests already in flight share one LLM call
+_inflight: Dict[str, asyncio.Future] = {}
+_inflight_lock = asyncio.Lock()
+
+
+def _request_key(kind: str, *parts: Any) -> str:
+    """Stable SHA-256 key for a request's inputs."""
+    payload = _json_dumps_compact([kind, *parts])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+async def _single_flight(key: str, call: Callable[[], Awaitable[Dict[str, Any]]]) -> Dict[str, Any]:
+    """
+    Run `call` once per key among concurrent callers.
+    
+    The first caller performs the work; later callers with the same key
+    await its future and receive their own copy of the result.
+    """
+    async with _inflight_lock:
+        future = _inflight.get(key)
+        is_leader = future is None
+        if is_leader:
+            future = asyncio.get_running_loop().create_future()
+            _inflight[key] = future
+    
+    if not is_leader:
+        return copy.deepcopy(await future)
+    
+    try:
+        result = await call()
+        future.set_result(result)
+        return result
+    except BaseException as e:
+        future.set_exception(e)
+        future.exception()  # Mark retrieved when no follower is waiting
+        raise
+    finally:
+        _inflight.pop(key, None)
+
+
+def _without_raw(result: Dict[str, Any]) -> Dict[str, Any]:
+    """Copy of a builder result without the (often large) raw LLM completion."""
+    # Build a new dict: the original may be shared with coalesced callers
+    return {k: v for k, v in result.items() if k != "raw_response"}
+
+
 async def build_workflow_from_chat(
     user_message: str,
     conversation_history: List[Dict[str, str]] = None,
+    include_raw: bool = False,
 ) -> Dict[str, Any]:
     """
     Use LLM to build a workflow based on user's natural language description.
     
+    Concurrent identical requests are coalesced into a single LLM call.
+    
     Args:
         user_message: User's description of what they want
         conversation_history: Previous messages for context
+        include_raw: Also return the full LLM completion as 'raw_response'
         
     Returns:
         Dict with 'explanation' and 'workflow' (the JSON config)
     """
-    llm_client = get_llm_client()
-    model = config.get_model_config()["large"]
+    key = _request_key("build", user_message, conversation_history)
+    result = await _single_flight(
+        key, lambda: _build_workflow_from_chat(key, user_message, conversation_history)
+    )
+    return result if include_raw else _without_raw(result)
+
+
+# In-process LRU tier in front of the SQLite cache:
+# request key -> (normalized embedding or None, history key, {explanation, workflow})
+_RESPONSE_CACHE: "OrderedDict[str, Tuple[Optional[np.ndarray], str, Dict[str, Any]]]" = OrderedDict()
+_RESPONSE_CACHE_MAX = 256
+_SIMILARITY_THRESHOLD = 0.92
+
+
+def _history_key(conversation_history: Optional[List[Dict[str, str]]]) -> str:
+    """Short digest of the conversation so far; semantic hits must share it."""
+    return hashlib.blake2b(
+        repr(conversation_history or "").encode("utf-8"), digest_size=8
+    ).hexdigest()
+
+
+def _normalize(embedding: Optional[List[float]]) -> Optional[np.ndarray]:
+    if not embedding:
+        return None
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else None
+
+
+def _memory_cache_get(key: str, hist_key: str, query: Optional[np.ndarray]) -> Optional[Dict[str, Any]]:
+    """Exact hit by request key, else the most similar message with the same history."""
+    entry = _RESPONSE_CACHE.get(key)
+    if entry is None and query is not None:
+        best_sim = _SIMILARITY_THRESHOLD
+        for candidate_key, (vector, candidate_hist, _) in _RESPONSE_CACHE.items():
+            if candidate_hist != hist_key or vector is None or vector.shape != query.shape:
+                continue
+            sim = float(np.dot(query, vector))
+            if sim >= best_sim:
+                best_sim, key = sim, candidate_key
+                entry = _RESPONSE_CACHE[candidate_key]
+    if entry is None:
+        return None
+    _RESPONSE_CACHE.move_to_end(key)
+    return copy.deepcopy(entry[2])
+
+
+def _memory_cache_put(
+    key: str,
+    hist_key: str,
+    embedding: Optional[List[float]],
+    result: Dict[str, Any],
+) -> None:
+    payload = {"explanation": result["explanation"], "workflow": copy.deepcopy(result["workflow"])}
+    _RESPONSE_CACHE[key] = (_normalize(embedding), hist_key, payload)
+    _RESPONSE_CACHE.move_to_end(key)
+    while len(_RESPONSE_CACHE) > _RESPONSE_CACHE_MAX:
+        _RESPONSE_CACHE.popitem(last=False)
+
+
+def invalidate_response_cache() -> None:
+    """Drop all in-process cached build results (the SQLite cache is untouched)."""
+    _RESPONSE_CACHE.clear()
+
+
+async def _cache_lookup(
+    key: str,
+    user_message: str,
+    conversation_history: Optional[List[Dict[str, str]]],
+) -> Tuple[Optional[Dict[str, Any]], Optional[List[float]]]:
+    """
+    Look up a previously built workflow, in-process first, then SQLite:
+    exact request hash first, then the nearest cached message by embedding.
+    Returns (cached result, embedding); the embedding is reused when
+    storing a fresh result.
+    """
+    hist_key = _history_key(conversation_history)
+    cached = _memory_cache_get(key, hist_key, None)
+    if cached:
+        return cached, None
+    
+    cache = get_workflow_cache()
+    embedding = None
+    try:
+        if cache is not None:
+            cached = await cache.get(key)
+        if cached is None:
+            embedding = await get_embedding_batcher().embed(user_message)
+            cached = _memory_cache_get(key, hist_key, _normalize(embedding))
+            # The persistent cache has no notion of history, so semantic
+            # matches there are only safe for a fresh conversation
+            if cached is None and cache is not None and not conversation_history:
+                cached = await cache.search(embedding)
+    except Exception as e:
+        print(f"[WORKFLOW_BUILDER] Cache lookup failed: {e}")
+        return None, embedding
+    
+    if cached:
+        _memory_cache_put(key, hist_key, embedding, cached)
+    return cached, embedding
+
+
+async def _cache_store(
+    key: str,
+    user_message: str,
+    conversation_history: Optional[List[Dict[str, str]]],
+    result: Dict[str, Any],
+    embedding: Optional[List[float]],
+) -> None:
+    """Remember a freshly built workflow in both cache tiers."""
+    _memory_cache_put(key, _history_key(conversation_history), embedding, result)
+    
+    cache = get_workflow_cache()
+    if cache is None:
+        return
+    try:
+        await cache.put(key, user_message, result, embedding)
+    except Exception as e:
+        print(f"[WORKFLOW_BUILDER] Failed to cache workflow: {e}")
+
+
+async def _build_without_llm(
+    key: str,
+    user_message: str,
+    conversation_history: Optional[List[Dict[str, str]]],
+) -> Tuple[Optional[Dict[str, Any]], Optional[List[float]]]:
+    """
+    Answer a build request from a template or the cache when possible.
+    Returns (result or None, embedding of the message if one was computed).
+    """
+    # Fresh, common requests are served straight from an example template
+    if not conversation_history:
+        template_key = _match_template(user_message)
+        if template_key:
+            template = EXAMPLE_WORKFLOWS[template_key]
+            workflow = _thaw(template)
+            _ensure_input_and_supervisor(workflow, user_message)
+            return {
+                "explanation": template["description"],
+                "workflow": workflow,
+                "raw_response": "",
+                "template_hit": template_key,
+            }, None
     
-    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    cached, embedding = await _cache_lookup(key, user_message, conversation_history)
+    if cached:
+        return {**cached, "raw_response": "", "cache_hit": True}, embedding
+    return None, embedding
+
+
+def _trim_history(conversation_history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """
+    Keep the most recent turns only, so prefill cost stays bounded however
+    long the conversation gets: at most _MAX_HISTORY_TURNS messages and,
+    dropping from the oldest, at most _MAX_HISTORY_CHARS of content.
+    """
+    recent = conversation_history[-_MAX_HISTORY_TURNS:]
+    total = sum(len(m.get("content") or "") for m in recent)
+    start = 0
+    while total > _MAX_HISTORY_CHARS and start < len(recent):
+        total -= len(recent[start].get("content") or "")
+        start += 1
+    return recent[start:]
+
+
+def _build_chat_kwargs(
+    user_message: str,
+    conversation_history: Optional[List[Dict[str, str]]],
+    json_only: bool = False,
+) -> Dict[str, Any]:
+    """
+    Chat arguments for a workflow build request. With json_only the model
+    is constrained to the workflow schema and writes no explanation.
+    """
+    # History goes after the system block so the cached prefix stays byte-identical
+    messages = [_SYSTEM_MESSAGE]
     
     # Add conversation history if provided
     if conversation_history:
-        messages.extend(conversation_history)
+        messages.extend(_trim_history(conversation_history))
+    
+    if json_only:
+        messages.append({"role": "user", "content": user_message + _JSON_ONLY_INSTRUCTION})
+    else:
+        messages.append({"role": "user", "content": user_message})
+    
+    chat_kwargs = {
+        "model": _get_cached_client()[1]["large"],
+        "messages": messages,
+        "temperature": 0.3,
+        "max_tokens": _estimate_max_tokens(_expected_node_count(user_message)),
+    }
+    if json_only:
+        chat_kwargs["response_format"] = _WORKFLOW_RESPONSE_FORMAT
+    return chat_kwargs
+
+
+async def _build_workflow_from_chat(
+    key: str,
+    user_message: str,
+    conversation_history: Optional[List[Dict[str, str]]],
+) -> Dict[str, Any]:
+    """Build a workflow for one (de-duplicated) request."""
+    result, embedding = await _build_without_llm(key, user_message, conversation_history)
+    if result:
+        return result
+    
+    llm_client, _ = _get_cached_client()
+    
+    if not config.WORKFLOW_BUILDER_JSON_MODE:
+        async with _LLM_SEM:
+            response = await _collect_response(
+                llm_client, **_build_chat_kwargs(user_message, conversation_history)
+            )
+        explanation, workflow, repaired = _split_fenced_json(response)
+        return await _finalize_build(
+            key, user_message, conversation_history, response, explanation, workflow, embedding,
+            repaired,
+        )
+    
+    async with _LLM_SEM:
+        response = await llm_client.chat(
+            **_build_chat_kwargs(user_message, conversation_history, json_only=True)
+        )
+    
+    explanation = None
+    if response.lstrip().startswith("{"):
+        workflow, repaired = _parse_json_block(response)
+    else:
+        # Provider ignored response_format; the reply may still hold a fenced block
+        explanation, workflow, repaired = _split_fenced_json(response)
+    
+    return await _finalize_build(
+        key, user_message, conversation_history, response, explanation, workflow, embedding,
+        repaired,
+    )
+
+
+async def _explain_workflow(llm_client, user_message: str, workflow: Dict[str, Any]) -> str:
+    """Short plain-language explanation of a built workflow (small model, small budget)."""
+    steps = " -> ".join(
+        f"{node.get('data', {}).get('label', node.get('id'))} ({_node_type(node)})"
+        for node in workflow.get("nodes", [])
+    )
+    prompt = (
+        f"The user asked for: {user_message}\n\n"
+        f"This workflow was built for it: {steps}\n\n"
+        "In one short paragraph, explain what the workflow does and why each node is there."
+    )
+    async with _LLM_SEM:
+        return await llm_client.chat(
+            model=_get_cached_client()[1]["small"],
+            messages=[
+                {"role": "system", "content": _EXPLANATION_SYSTEM_PROMPT},
+                {"role": "user", "content": prompt},
+            ],
+            temperature=0.3,
+            max_tokens=_EXPLANATION_MAX_TOKENS,
+        )
+
+
+async def _read_build_stream(llm_client, chat_kwargs: Dict[str, Any], tokens: asyncio.Queue) -> str:
+    """
+    Read a build response, putting the explanation text on `tokens` as it
+    arrives, and return the response up to the closing fence.
+    
+    The builder LLM slot is held only while the provider is producing, not
+    while a slow client drains the tokens. Each chunk is scanned for fences
+    together with the two characters before it, so the work stays linear in
+    the response length. A None on `tokens` marks the end.
+    """
+    try:
+        async with _LLM_SEM:
+            if not hasattr(llm_client, "chat_stream"):
+                response = await llm_client.chat(**chat_kwargs)
+                tokens.put_nowait(_split_fenced_json(response)[0])
+                return response
+            
+            parts = []
+            # Explanation text not yet emitted; ends with a possible partial fence
+            pending = ""
+            # Set once the opening fence is seen: the last two chars after it
+            tail = None
+            stream = llm_client.chat_stream(**chat_kwargs)
+            try:
+                async for chunk in stream:
+                    parts.append(chunk)
+                    if tail is not None:
+                        window = tail + chunk
+                        # Same early exit as _collect_response: done at the closing fence
+                        if "```" in window:
+                            break
+                        tail = window[-2:]
+                        continue
+                    
+                    pending += chunk
+                    fence_start = pending.find("```")
+                    if fence_start < 0:
+                        if len(pending) > 2:
+                            tokens.put_nowait(pending[:-2])
+                            pending = pending[-2:]
+                        continue
+                    if fence_start:
+                        tokens.put_nowait(pending[:fence_start])
+                    after_fence = pending[fence_start + 3:]
+                    pending = ""
+                    if "```" in after_fence:
+                        break
+                    tail = after_fence[-2:]
+            finally:
+                await stream.aclose()
+            
+            if pending:
+                tokens.put_nowait(pending)
+            return "".join(parts)
+    finally:
+        tokens.put_nowait(None)
+
+
+async def build_workflow_from_chat_stream(
+    user_message: str,
+    conversation_history: List[Dict[str, str]] = None,
+) -> AsyncIterator[Dict[str, Any]]:
+    """
+    Streaming variant of build_workflow_from_chat.
     
-    messages.append({"role": "user", "content": user_message})
+    Yields {"type": "token", "content": ...} events with the explanation text
+    as the LLM produces it, then one {"type": "result", ...} event holding
+    the cleaned explanation and the parsed workflow. Tokens stop at the
+    opening fence of the JSON block; the raw text is not markdown-cleaned.
     
-    response = await llm_client.chat(
-        model=model,
-        messages=messages,
-        temperature=0.3,
-        max_tokens=2000,
+    Args:
+        user_message: User's description of what they want
+        conversation_history: Previous messages for context
+    """
+    key = _request_key("build", user_message, conversation_history)
+    result, embedding = await _build_without_llm(key, user_message, conversation_history)
+    if result:
+        yield {"type": "result", **_without_raw(result)}
+        return
+    
+    llm_client, _ = _get_cached_client()
+    chat_kwargs = _build_chat_kwargs(user_message, conversation_history)
+    
+    tokens: asyncio.Queue = asyncio.Queue()
+    reader = asyncio.create_task(_read_build_stream(llm_client, chat_kwargs, tokens))
+    try:
+        while (token := await tokens.get()) is not None:
+            yield {"type": "token", "content": token}
+        response = await reader
+    finally:
+        # Client went away mid-stream: stop reading from the provider
+        reader.cancel()
+    
+    explanation, workflow, repaired = _split_fenced_json(response)
+    result = await _finalize_build(
+        key, user_message, conversation_history, response, explanation, workflow, embedding,
+        repaired,
     )
+    yield {"type": "result", **_without_raw(result)}
+
+
+def _node_type(node: Dict[str, Any]) -> Optional[str]:
+    """nodeType of an LLM-built node; direct indexing since it is almost always present."""
+    try:
+        return node["data"]["nodeType"]
+    except (KeyError, TypeError):
+        return None
+
+
+def _ensure_input_and_supervisor(workflow: Dict[str, Any], user_message: str) -> None:
+    """
+    Give a workflow the input node the request calls for (upload for file
+    requests, prompt otherwise) and a supervisor right after it, in place.
+    """
+    node_types = {_node_type(node) for node in workflow["nodes"]}
     
-    # Parse the response to extract JSON
-    explanation = response
-    workflow = None
+    # Detect if user wants file uploads
+    has_upload_keywords = bool(_UPLOAD_KEYWORDS_RE.search(user_message))
     
-    # Extract JSON from response
-    if "```json" in response:
-        try:
-            json_start = response.index("```json") + 7
-            json_end = response.index("```", json_start)
-            json_str = response[json_start:json_end].strip()
-            workflow = json.loads(json_str)
-            explanation = response[:response.index("```json")].strip()
-        except (ValueError, json.JSONDecodeError) as e:
-            print(f"[WORKFLOW_BUILDER] Failed to parse workflow JSON: {e}")
-    elif "```" in response:
-        try:
-            json_start = response.index("```") + 3
-            json_end = response.index("```", json_start)
-            json_str = response[json_start:json_end].strip()
-            workflow = json.loads(json_str)
-            explanation = response[:response.index("```")].strip()
-        except (ValueError, json.JSONDecodeError) as e:
-            print(f"[WORKFLOW_BUILDER] Failed to parse workflow JSON: {e}")
+    # Determine which input node to use
+    needs_upload = has_upload_keywords and "upload" not in node_types
+    needs_prompt = not has_upload_keywords and "prompt" not in node_types and "upload" not in node_types
     
-    # Clean up explanation: remove markdown formatting
-    if explanation:
-        # Remove markdown headers
-        import re
-        explanation = re.sub(r'^#{1,6}\s+', '', explanation, flags=re.MULTILINE)
-        # Remove bold/italic
-        explanation = re.sub(r'\*\*([^*]+)\*\*', r'\1', explanation)
-        explanation = re.sub(r'\*([^*]+)\*', r'\1', explanation)
-        # Remove horizontal rules
-        explanation = re.sub(r'^---+$', '', explanation, flags=re.MULTILINE)
-        # Remove code blocks
-        explanation = re.sub(r'```[a-z]*\n.*?```', '', explanation, flags=re.DOTALL)
-        # Clean up extra whitespace
-        explanation = re.sub(r'\n{3,}', '\n\n', explanation)
-        explanation = explanation.strip()
+    # Index of the input node; known without a scan when we insert it
+    input_idx = None
     
-    # Ensure workflow always includes supervisor and appropriate input node
-    if workflow and workflow.get("nodes"):
-        node_types = [node.get("data", {}).get("nodeType") for node in workflow["nodes"]]
-        
-        # Detect if user wants file uploads
-        user_message_lower = user_message.lower()
-        has_upload_keywords = any(keyword in user_message_lower for keyword in [
-            "upload", "file", "pdf", "document", "csv", "excel", "spreadsheet", 
-            "convert pdf", "pdf to", "document to", "file to"
-        ])
-        
-        # Determine which input node to use
-        needs_upload = has_upload_keywords and "upload" not in node_types
-        needs_prompt = not has_upload_keywords and "prompt" not in node_types and "upload" not in node_types
-        
-        # Add upload node if needed (for file processing workflows)
-        if needs_upload:
-            upload_node = {
-                "id": "upload-1",
-                "type": "workflow",
-                "position": {"x": 100, "y": 100},
-                "data": {
-                    "nodeType": "upload",
-                    "label": "Upload",
-                    "settings": {},
-                    "uploadedFiles": []
-                }
-            }
+    # Add upload node if needed (for file processing workflows)
+    if needs_upload:
+        upload_node = copy.deepcopy(_UPLOAD_NODE_TEMPLATE)
+        prompt_idx = next((i for i, n in enumerate(workflow["nodes"])
+                           if _node_type(n) == "prompt"), None)
+        if prompt_idx is not None:
+            # Swap the prompt input for the upload node instead of orphaning it
+            prompt_id = workflow["nodes"][prompt_idx].get("id")
+            workflow["nodes"][prompt_idx] = upload_node
+            input_idx = prompt_idx
+            for edge in workflow.get("edges") or []:
+                if edge.get("source") == prompt_id:
+                    edge["source"] = "upload-1"
+        else:
             workflow["nodes"].insert(0, upload_node)
+            input_idx = 0
             # Update first edge source if edges exist
             if workflow.get("edges"):
                 workflow["edges"][0]["source"] = "upload-1"
-        
-        # Add prompt node if needed (for text-based workflows)
-        elif needs_prompt:
-            prompt_node = {
-                "id": "prompt-1",
-                "type": "workflow",
-                "position": {"x": 100, "y": 100},
-                "data": {
-                    "nodeType": "prompt",
-                    "label": "Prompt",
-                    "settings": {},
-                    "promptText": ""
-                }
-            }
-            workflow["nodes"].insert(0, prompt_node)
-            # Update first edge source if edges exist
-            if workflow.get("edges"):
-                workflow["edges"][0]["source"] = "prompt-1"
-        
-        # Add supervisor node if missing (after input node)
-        if "supervisor" not in node_types:
-            supervisor_node = {
-                "id": "supervisor-1",
-                "type": "workflow",
-                "position": {"x": 350, "y": 100},
-                "data": {
-                    "nodeType": "supervisor",
-                    "label": "Supervisor Agent",
-                    "settings": {
-                        "planningStyle": "optimized",
-                        "optimizationLevel": "basic",
-                        "supervisorPrompt": ""
-                    }
-                }
-            }
-            # Insert after input node (prompt or upload)
+    
+    # Add prompt node if needed (for text-based workflows)
+    elif needs_prompt:
+        prompt_node = copy.deepcopy(_PROMPT_NODE_TEMPLATE)
+        workflow["nodes"].insert(0, prompt_node)
+        input_idx = 0
+        # Update first edge source if edges exist
+        if workflow.get("edges"):
+            workflow["edges"][0]["source"] = "prompt-1"
+    
+    # Add supervisor node if missing (after input node)
+    if "supervisor" not in node_types:
+        supervisor_node = copy.deepcopy(_SUPERVISOR_NODE_TEMPLATE)
+        # Insert after input node (prompt or upload)
+        if input_idx is None:
             input_idx = next((i for i, n in enumerate(workflow["nodes"]) 
-                            if n.get("data", {}).get("nodeType") in ["prompt", "upload"]), 0)
-            workflow["nodes"].insert(input_idx + 1, supervisor_node)
-            
-            # Update edges to connect input -> supervisor -> next node
-            if workflow.get("edges"):
-                first_edge = workflow["edges"][0]
-                old_source = first_edge["source"]
-                first_edge["source"] = "supervisor-1"
-                # Add edge from input to supervisor
-                input_node_id = workflow["nodes"][input_idx]["id"]
-                workflow["edges"].insert(0, {
-                    "id": f"edge-input-supervisor",
-                    "source": input_node_id,
-                    "target": "supervisor-1"
-                })
+                            if _node_type(n) in ("prompt", "upload")), 0)
+        workflow["nodes"].insert(input_idx + 1, supervisor_node)
+        
+        # Update edges to connect input -> supervisor -> next node
+        if workflow.get("edges"):
+            first_edge = workflow["edges"][0]
+            old_source = first_edge["source"]
+            first_edge["source"] = "supervisor-1"
+            # Add edge from input to supervisor
+            input_node_id = workflow["nodes"][input_idx]["id"]
+            workflow["edges"].insert(0, {
+                "id": f"edge-input-supervisor",
+                "source": input_node_id,
+                "target": "supervisor-1"
+            })
+
+
+async def _finalize_build(
+    key: str,
+    user_message: str,
+    conversation_history: Optional[List[Dict[str, str]]],
+    response: str,
+    explanation: Optional[str],
+    workflow: Optional[Dict[str, Any]],
+    embedding: Optional[List[float]],
+    repaired: bool = False,
+) -> Dict[str, Any]:
+    """
+    Clean and post-process a parsed build response, then cache it.
+    A None explanation (JSON-mode build) is generated once the workflow is final.
+    A repaired (truncated) workflow is only accepted if every edge still
+    connects existing nodes, and is never cached.
+    """
+    if repaired and isinstance(workflow, dict) and _has_dangling_edges(workflow):
+        logger.warning("[WORKFLOW_BUILDER] Rejected repaired workflow JSON with dangling edges")
+        workflow = None
+    if not isinstance(workflow, dict):
+        workflow = None
+        if explanation is None:
+            explanation = response
     
-    return {
+    # Clean up explanation: remove markdown formatting
+    if explanation:
+        explanation = _clean_markdown(explanation)
+    
+    # Ensure workflow always includes supervisor and appropriate input node
+    if workflow and workflow.get("nodes"):
+        _ensure_input_and_supervisor(workflow, user_message)
+    
+    if explanation is None:
+        try:
+            explanation = _clean_markdown(
+                await _explain_workflow(_get_cached_client()[0], user_message, workflow)
+            )
+        except Exception as e:
+            print(f"[WORKFLOW_BUILDER] Failed to generate explanation: {e}")
+            explanation = workflow.get("description", "")
+    
+    result = {
         "explanation": explanation,
         "workflow": workflow,
         "raw_response": response,
     }
+    if workflow is None:
+        # Lets callers tell a bad generation apart and skip an automatic retry
+        result["error"] = "json_parse_failed"
+    elif repaired:
+        # The reply was cut short; let callers know the workflow may be incomplete
+        result["repaired"] = True
+    
+    if workflow and not repaired:
+        await _cache_store(key, user_message, conversation_history, result, embedding)
+    
+    return result
 
 
 async def suggest_workflow_improvements(
     current_workflow: Dict[str, Any],
     user_feedback: str = None,
+    include_raw: bool = False,
 ) -> Dict[str, Any]:
     """
     Analyze a workflow and suggest improvements.
     
+    Concurrent identical requests are coalesced into a single LLM call.
+    
     Args:
         current_workflow: The current workflow configuration
         user_feedback: Optional user feedback about issues
+        include_raw: Also return the full LLM completion as 'raw_response'
         
     Returns:
         Dict with 'suggestions' and optionally 'improved_workflow'
     """
-    llm_client = get_llm_client()
-    model = config.get_model_config()["large"]
+    key = _request_key("suggest", current_workflow, user_feedback)
+    result = await _single_flight(
+        key, lambda: _suggest_workflow_improvements(current_workflow, user_feedback)
+    )
+    return result if include_raw else _without_raw(result)
+
+
+async def _suggest_workflow_improvements(
+    current_workflow: Dict[str, Any],
+    user_feedback: Optional[str],
+) -> Dict[str, Any]:
+    """Critique a workflow for one (de-duplicated) request."""
+    llm_client, models = _get_cached_client()
+    node_count = len(current_workflow.get("nodes", []))
+    model_size = "small" if node_count <= _SMALL_MODEL_MAX_NODES else "large"
+    model = models[model_size]
     
-    workflow_json = json.dumps(current_workflow, indent=2)
+    # Compact, key-sorted form: fewer input tokens, and identical workflows
+    # produce an identical prompt prefix for provider-side caching
+    workflow_json = _json_dumps_compact(current_workflow)
     
     prompt = f"""Analyze this workflow and suggest improvements:
 
@@ -469,30 +1270,21 @@ Consider:
 """
     
     messages = [
-        {"role": "system", "content": SYSTEM_PROMPT},
+        _SUGGESTION_SYSTEM_MESSAGE,
         {"role": "user", "content": prompt},
     ]
     
-    response = await llm_client.chat(
-        model=model,
-        messages=messages,
-        temperature=0.3,
-        max_tokens=2000,
-    )
-    
-    # Parse response similar to build_workflow_from_chat
-    suggestions = response
-    improved_workflow = None
+    async with _LLM_SEM:
+        response = await llm_client.chat(
+            model=model,
+            messages=messages,
+            temperature=0.3,
+            max_tokens=_estimate_max_tokens(node_count),
+        )
     
-    if "```json" in response:
-        try:
-            json_start = response.index("```json") + 7
-            json_end = response.index("```", json_start)
-            json_str = response[json_start:json_end].strip()
-            improved_workflow = json.loads(json_str)
-            suggestions = response[:response.index("```json")].strip()
-        except (ValueError, json.JSONDecodeError):
-            pass
+    suggestions, improved_workflow, repaired = _split_fenced_json(response)
+    if repaired and isinstance(improved_workflow, dict) and _has_dangling_edges(improved_workflow):
+        improved_workflow = None
     
     return {
         "suggestions": suggestions,
@@ -501,6 +1293,32 @@ Consider:
     }
 
 
+async def build_and_suggest(
+    user_message: str,
+    conversation_history: List[Dict[str, str]] = None,
+) -> Dict[str, Any]:
+    """
+    Build a workflow and critique it in one call.
+    
+    The critique is of the freshly built workflow, so it runs after the
+    build. Both calls share the builder's LLM concurrency limit.
+    
+    Args:
+        user_message: User's description of what they want
+        conversation_history: Previous messages for context
+        
+    Returns:
+        Dict with 'build' and 'suggestions' results ('suggestions' is None
+        when the build produced no workflow)
+    """
+    build = await build_workflow_from_chat(user_message, conversation_history)
+    suggestions = None
+    if build.get("workflow"):
+        suggestions = await suggest_workflow_improvements(build["workflow"])
+    
+    return {"build": build, "suggestions": suggestions}
+
+
 # Example workflows for common use cases
 EXAMPLE_WORKFLOWS = {
     "basic_qa": {
@@ -570,18 +1388,93 @@ EXAMPLE_WORKFLOWS = {
             {"id": "e3", "source": "summarization-1", "target": "response-1"},
         ],
     },
+    "pdf_to_excel": {
+        "name": "PDF to Excel",
+        "description": "Extract structured data from an uploaded document into a spreadsheet",
+        "nodes": [
+            {"id": "upload-1", "type": "workflow", "position": {"x": 100, "y": 100},
+             "data": {"nodeType": "upload", "label": "Upload", "settings": {}, "uploadedFiles": []}},
+            {"id": "supervisor-1", "type": "workflow", "position": {"x": 350, "y": 100},
+             "data": {"nodeType": "supervisor", "label": "Supervisor Agent", "settings": {"planningStyle": "optimized", "optimizationLevel": "basic", "supervisorPrompt": ""}}},
+            {"id": "transformer-1", "type": "workflow", "position": {"x": 600, "y": 100},
+             "data": {"nodeType": "transformer", "label": "Transformer", "settings": {"fromFormat": "pdf", "toFormat": "excel", "useAdvancedModel": True}}},
+            {"id": "spreadsheet-1", "type": "workflow", "position": {"x": 850, "y": 100},
+             "data": {"nodeType": "spreadsheet", "label": "Spreadsheet", "settings": {"extractionDepth": "detailed"}}},
+        ],
+        "edges": [
+            {"id": "e1", "source": "upload-1", "target": "supervisor-1"},
+            {"id": "e2", "source": "supervisor-1", "target": "transformer-1"},
+            {"id": "e3", "source": "transformer-1", "target": "spreadsheet-1"},
+        ],
+    },
 }
 
 
-def get_example_workflow(workflow_type: str) -> Optional[Dict[str, Any]]:
-    """Get an example workflow by type."""
+def _freeze(value: Any) -> Any:
+    """Recursively make a JSON-like value read-only (dicts -> mapping proxies, lists -> tuples)."""
+    if isinstance(value, dict):
+        return MappingProxyType({k: _freeze(v) for k, v in value.items()})
+    if isinstance(value, list):
+        return tuple(_freeze(v) for v in value)
+    return value
+
+
+def _thaw(value: Any) -> Any:
+    """Mutable deep copy of a frozen value."""
+    if isinstance(value, MappingProxyType):
+        return {k: _thaw(v) for k, v in value.items()}
+    if isinstance(value, tuple):
+        return [_thaw(v) for v in value]
+    return value
+
+
+# Shared by every request, so frozen: a caller mutating a returned example
+# can't corrupt the template for everyone else
+EXAMPLE_WORKFLOWS = _freeze(EXAMPLE_WORKFLOWS)
+
+# Static, so the listing is built once rather than on every request (and frozen,
+# like the templates it summarizes)
+_EXAMPLE_WORKFLOW_SUMMARIES = tuple(
+    MappingProxyType({"id": key, "name": val["name"], "description": val["description"]})
+    for key, val in EXAMPLE_WORKFLOWS.items()
+)
+
+
+# Short, common requests that map deterministically onto an example workflow.
+# These are answered from the template without calling the LLM.
+ROUTER_PATTERNS = [
+    (re.compile(r"\b(pdf|document)s?\b.*\b(excel|csv|spreadsheet|xlsx)\b", re.IGNORECASE), "pdf_to_excel"),
+    (re.compile(r"\bbasic\b.*\bq\s*(&|and)\s*a\b|\bsimple\s+(question|q\s*(&|and)\s*a)\b", re.IGNORECASE), "basic_qa"),
+    (re.compile(r"\badvanced\s+research\b", re.IGNORECASE), "advanced_research"),
+    (re.compile(r"\bsummari[sz](ation|e)\s+(workflow|pipeline|documents?)\b", re.IGNORECASE), "summarization"),
+]
+
+# Longer messages usually carry specific requirements the templates can't satisfy
+_ROUTER_MAX_MESSAGE_CHARS = 120
+
+
+def _match_template(user_message: str) -> Optional[str]:
+    """Return the example workflow key for a pattern-matched request, if any."""
+    if len(user_message) > _ROUTER_MAX_MESSAGE_CHARS:
+        return None
+    for pattern, key in ROUTER_PATTERNS:
+        if pattern.search(user_message):
+            return key
+    return None
+
+
+def get_example_workflow(workflow_type: str) -> Optional[Mapping[str, Any]]:
+    """Get an example workflow by type (read-only view, no copy)."""
     return EXAMPLE_WORKFLOWS.get(workflow_type)
 
 
+def get_example_workflow_copy(workflow_type: str) -> Optional[Dict[str, Any]]:
+    """Get a mutable deep copy of an example workflow, for callers that edit it."""
+    template = EXAMPLE_WORKFLOWS.get(workflow_type)
+    return _thaw(template) if template is not None else None
+
+
 def list_example_workflows() -> List[Dict[str, str]]:
-    """List available example workflows."""
-    return [
-        {"id": key, "name": val["name"], "description": val["description"]}
-        for key, val in EXAMPLE_WORKFLOWS.items()
-    ]
+    """List available example workflows (fresh dicts, safe for callers to edit)."""
+    return [dict(summary) for summary in _EXAMPLE_WORKFLOW_SUMMARIES]
 
@@ -0,0 +1,270 @@
+"""
+Persistent cache for AI-built workflows.
+
+Stores explanation/workflow pairs produced by the workflow builder in a
+SQLite database so results survive restarts and are shared between worker
+processes. Lookups are exact (request hash) first, then semantic (nearest
+cached user message by embedding).
+
+Semantic search uses the `sqlite-vec` extension when it can be loaded and
+falls back to a brute-force cosine scan over stored embeddings otherwise.
+"""
+
+import asyncio
+import json
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from config import config
+
+try:
+    import sqlite_vec
+except ImportError:
+    sqlite_vec = None
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def _dumps(obj: Any) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj).encode("utf-8")
+
+
+def _loads(data: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    hash TEXT PRIMARY KEY,
+    user_msg TEXT,
+    workflow BLOB,
+    explanation TEXT,
+    embedding BLOB,
+    created_at INT
+)
+"""
+
+
+class WorkflowCache:
+    """SQLite-backed exact + semantic cache for workflow builder results."""
+
+    def __init__(self, db_path: Path, similarity_threshold: float = 0.92) -> None:
+        self.db_path = db_path
+        self.similarity_threshold = similarity_threshold
+        self._vec_available: Optional[bool] = None
+        self._initialized = False
+        self._init_lock = threading.Lock()
+        # One connection per worker thread, opened and prepared on first use
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+
+    # -------------------------------------------------------------------------
+    # Connection management (all sqlite work runs in worker threads)
+    # -------------------------------------------------------------------------
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        """This thread's connection; commits on success, rolls back on error."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = self._open()
+        try:
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+
+    def _open(self) -> sqlite3.Connection:
+        # Only ever used by the thread that opened it; close() runs elsewhere
+        conn = sqlite3.connect(self.db_path, timeout=10.0, check_same_thread=False)
+        self._prepare(conn)
+        with self._init_lock:
+            self._connections.append(conn)
+        self._local.conn = conn
+        return conn
+
+    def _prepare(self, conn: sqlite3.Connection) -> None:
+        with self._init_lock:
+            if not self._initialized:
+                # WAL mode is persistent in the database file: set it once
+                conn.execute("PRAGMA journal_mode=WAL")
+                conn.execute(_SCHEMA)
+                conn.commit()
+                self._initialized = True
+
+        if self._vec_available is not False and sqlite_vec is not None:
+            try:
+                conn.enable_load_extension(True)
+                sqlite_vec.load(conn)
+                conn.enable_load_extension(False)
+                self._vec_available = True
+            except (AttributeError, sqlite3.Error) as e:
+                print(f"[WORKFLOW_CACHE] sqlite-vec unavailable, using brute-force search: {e}")
+                self._vec_available = False
+        elif sqlite_vec is None:
+            self._vec_available = False
+
+    def close(self) -> None:
+        """Close every per-thread connection (e.g. on application shutdown)."""
+        with self._init_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+    def _ensure_vec_table(self, conn: sqlite3.Connection, dim: int) -> None:
+        conn.execute(
+            f"CREATE VIRTUAL TABLE IF NOT EXISTS vec_entries "
+            f"USING vec0(embedding FLOAT[{dim}] distance_metric=cosine)"
+        )
+
+    # -------------------------------------------------------------------------
+    # Synchronous operations
+    # -------------------------------------------------------------------------
+
+    def _get_sync(self, key: str) -> Optional[Dict[str, Any]]:
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT workflow, explanation FROM entries WHERE hash = ?", (key,)
+            ).fetchone()
+        if not row:
+            return None
+        return {"workflow": _loads(row[0]), "explanation": row[1]}
+
+    def _search_sync(self, embedding: List[float]) -> Optional[Dict[str, Any]]:
+        query = np.asarray(embedding, dtype=np.float32)
+
+        with self._connect() as conn:
+            if self._vec_available:
+                try:
+                    row = conn.execute(
+                        """
+                        SELECT e.workflow, e.explanation, v.distance
+                        FROM vec_entries v JOIN entries e ON e.rowid = v.rowid
+                        WHERE v.embedding MATCH ? AND k = 1
+                        ORDER BY v.distance
+                        """,
+                        (query.tobytes(),),
+                    ).fetchone()
+                except sqlite3.OperationalError:
+                    # vec table not created yet (empty cache)
+                    return None
+                if row and 1.0 - row[2] >= self.similarity_threshold:
+                    return {"workflow": _loads(row[0]), "explanation": row[1]}
+                return None
+
+            # Brute-force fallback: cosine similarity against every stored embedding
+            best: Tuple[float, Optional[Tuple[bytes, str]]] = (-1.0, None)
+            query_norm = np.linalg.norm(query)
+            for workflow, explanation, blob in conn.execute(
+                "SELECT workflow, explanation, embedding FROM entries WHERE embedding IS NOT NULL"
+            ):
+                cached = np.frombuffer(blob, dtype=np.float32)
+                if cached.shape != query.shape:
+                    continue
+                sim = float(np.dot(query, cached) / (query_norm * np.linalg.norm(cached)))
+                if sim > best[0]:
+                    best = (sim, (workflow, explanation))
+
+        if best[1] and best[0] >= self.similarity_threshold:
+            return {"workflow": _loads(best[1][0]), "explanation": best[1][1]}
+        return None
+
+    def _put_sync(
+        self,
+        key: str,
+        user_message: str,
+        result: Dict[str, Any],
+        embedding: Optional[List[float]],
+    ) -> None:
+        blob = np.asarray(embedding, dtype=np.float32).tobytes() if embedding else None
+
+        with self._connect() as conn:
+            if self._vec_available:
+                # REPLACE assigns a new rowid, so drop the old vector row first
+                previous = conn.execute("SELECT rowid FROM entries WHERE hash = ?", (key,)).fetchone()
+                if previous:
+                    try:
+                        conn.execute("DELETE FROM vec_entries WHERE rowid = ?", previous)
+                    except sqlite3.OperationalError:
+                        pass
+
+            cursor = conn.execute(
+                """
+                INSERT OR REPLACE INTO entries (hash, user_msg, workflow, explanation, embedding, created_at)
+                VALUES (?, ?, ?, ?, ?, ?)
+                """,
+                (
+                    key,
+                    user_message,
+                    _dumps(result["workflow"]),
+                    result["explanation"],
+                    blob,
+                    int(time.time()),
+                ),
+            )
+            if blob and self._vec_available:
+                self._ensure_vec_table(conn, len(embedding))
+                conn.execute(
+                    "INSERT INTO vec_entries (rowid, embedding) VALUES (?, ?)",
+                    (cursor.lastrowid, blob),
+                )
+
+    def _clear_sync(self) -> None:
+        with self._connect() as conn:
+            conn.execute("DELETE FROM entries")
+            if self._vec_available:
+                conn.execute("DROP TABLE IF EXISTS vec_entries")
+
+    # -------------------------------------------------------------------------
+    # Async API
+    # -------------------------------------------------------------------------
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Exact lookup by request hash."""
+        return await asyncio.to_thread(self._get_sync, key)
+
+    async def search(self, embedding: List[float]) -> Optional[Dict[str, Any]]:
+        """Nearest cached entry whose cosine similarity meets the threshold."""
+        return await asyncio.to_thread(self._search_sync, embedding)
+
+    async def put(
+        self,
+        key: str,
+        user_message: str,
+        result: Dict[str, Any],
+        embedding: Optional[List[float]] = None,
+    ) -> None:
+        """Store an explanation/workflow pair (and its embedding) in one transaction."""
+        await asyncio.to_thread(self._put_sync, key, user_message, result, embedding)
+
+    async def clear(self) -> None:
+        """Remove all cached entries."""
+        await asyncio.to_thread(self._clear_sync)
+
+
+_workflow_cache: Optional[WorkflowCache] = None
+
+
+def get_workflow_cache() -> Optional[WorkflowCache]:
+    """Return the shared workflow cache, or None when caching is disabled."""
+    global _workflow_cache
+    if not config.WORKFLOW_CACHE_ENABLED:
+        return None
+    if _workflow_cache is None:
+        _workflow_cache = WorkflowCache(config.WORKFLOW_CACHE_DB)
+    return _workflow_cache
@@ -6,11 +6,25 @@ Only executes nodes that are reachable from input nodes,
 following strict dependency order using topological sort.
 """
 
+import asyncio
+import base64
+import bisect
+import copy
+import hashlib
+import heapq
+import itertools
 import json
+import threading
 import time
 import uuid
-from collections import deque
-from typing import Any, AsyncGenerator, Dict, List, Optional, Set, Tuple
+from array import array
+from collections import OrderedDict, deque
+from collections.abc import Collection, Mapping
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from io import BytesIO
+from pathlib import Path
+from typing import Any, AsyncGenerator, Awaitable, Callable, Dict, FrozenSet, Iterable, Iterator, List, Optional, Set, Tuple
 
 from config import config
 from models import get_llm_client, LLMClientProtocol
@@ -27,16 +41,40 @@ from agents.image_generator import ImageGeneratorAgent
 from agents.translator import TranslatorAgent
 import os
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Upload parsers; a missing one only fails the files that need it
+try:
+    from pypdf import PdfReader
+except ImportError:
+    PdfReader = None
+
+try:
+    from docx import Document
+except ImportError:
+    Document = None
+
+# OCR for scanned PDFs (also needs the tesseract and poppler binaries)
+try:
+    from pdf2image import convert_from_bytes
+    import pytesseract
+except ImportError:
+    convert_from_bytes = None
+    pytesseract = None
+
+from workflow_logger import debugger, workflow_logger
+
 # Use pgvector if DATABASE_URL is set, otherwise fallback to file-based
 DATABASE_URL = os.environ.get("DATABASE_URL", "")
 if DATABASE_URL:
     import retrieval_pgvector as retrieval
-    print("[WORKFLOW] Using pgvector for semantic search")
+    workflow_logger.info("[WORKFLOW] Using pgvector for semantic search")
 else:
     import retrieval
-    print("[WORKFLOW] Using file-based retrieval")
-
-from workflow_logger import debugger, workflow_logger
+    workflow_logger.info("[WORKFLOW] Using file-based retrieval")
 
 
 # Agent registry - maps node types to agent classes
@@ -53,47 +91,266 @@ AGENT_REGISTRY = {
     "translator": TranslatorAgent,
 }
 
+# Constructor arguments beyond the LLM client, per node type
+_AGENT_EXTRA_ARGS: Dict[str, Tuple[Any, ...]] = {
+    "semantic_search": (retrieval,),
+}
+
+# Shared LLM client and default_model -> model name map (see _get_cached_client)
+_LLM_CLIENT: Optional[LLMClientProtocol] = None
+_MODEL_FOR_DEFAULT: Dict[str, Optional[str]] = {}
+
+# One (client, agent) per node type; agents keep no per-call state, so concurrent
+# nodes of the same type can share an instance
+_AGENT_INSTANCES: Dict[str, Tuple[LLMClientProtocol, Any]] = {}
+
+
+def _get_cached_client() -> Tuple[LLMClientProtocol, Dict[str, Optional[str]]]:
+    """Return the shared (LLM client, default_model -> model name) pair."""
+    global _LLM_CLIENT, _MODEL_FOR_DEFAULT
+    if _LLM_CLIENT is None:
+        models = config.get_model_config()
+        _LLM_CLIENT = get_llm_client()
+        _MODEL_FOR_DEFAULT = {
+            "large": models["large"],
+            "small": models["small"],
+            "embedding": None,  # Semantic search uses embeddings
+        }
+    return _LLM_CLIENT, _MODEL_FOR_DEFAULT
+
+
+def _get_agent(node_type: str, llm_client: LLMClientProtocol) -> Optional[Any]:
+    """Return the agent for a node type, creating it on first use for this client."""
+    cached = _AGENT_INSTANCES.get(node_type)
+    if cached is not None and cached[0] is llm_client:
+        return cached[1]
+    
+    agent_class = AGENT_REGISTRY.get(node_type)
+    if not agent_class:
+        return None
+    
+    agent = agent_class(llm_client, *_AGENT_EXTRA_ARGS.get(node_type, ()))
+    _AGENT_INSTANCES[node_type] = (llm_client, agent)
+    return agent
+
+
+class TokenBucket:
+    """Async token bucket: `acquire(n)` waits until n tokens have accrued at `tokens_per_minute`."""
+    
+    def __init__(self, tokens_per_minute: int):
+        self.capacity = float(tokens_per_minute)
+        self.rate = tokens_per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+    
+    async def acquire(self, tokens: int) -> None:
+        # A request larger than the whole bucket waits for a full bucket rather than forever
+        needed = min(float(tokens), self.capacity)
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= needed:
+                    self.tokens -= needed
+                    return
+                await asyncio.sleep((needed - self.tokens) / self.rate)
+
+
+# Per-model concurrency gates and token budgets for agent calls (see _model_limits)
+_MODEL_SEMAPHORES: Dict[str, asyncio.Semaphore] = {}
+_MODEL_BUCKETS: Dict[str, TokenBucket] = {}
+
+# Rough completion budget added to the prompt estimate when reserving tokens
+_ESTIMATED_OUTPUT_TOKENS = 1024
+
+
+def _model_limits(model: str, large_model: Optional[str]) -> Tuple[asyncio.Semaphore, Optional[TokenBucket]]:
+    """Return the (semaphore, token bucket) pair for a model, creating them on first use."""
+    semaphore = _MODEL_SEMAPHORES.get(model)
+    if semaphore is None:
+        limit = config.MAX_CONCURRENT_LARGE_MODEL if model == large_model else config.MAX_CONCURRENT_SMALL_MODEL
+        semaphore = _MODEL_SEMAPHORES[model] = asyncio.Semaphore(max(1, limit))
+        if config.MODEL_TOKENS_PER_MINUTE > 0:
+            _MODEL_BUCKETS[model] = TokenBucket(config.MODEL_TOKENS_PER_MINUTE)
+    return semaphore, _MODEL_BUCKETS.get(model)
+
+
+def _estimate_tokens(user_message: str, context: Mapping) -> int:
+    """Cheap prompt+completion token estimate (~4 characters per token)."""
+    chars = len(user_message or "")
+    for value in context.values():
+        if isinstance(value, str):
+            chars += len(value)
+        elif isinstance(value, list):
+            chars += sum(len(item) for item in value if isinstance(item, str))
+    return chars // 4 + _ESTIMATED_OUTPUT_TOKENS
+
+
+async def _run_limited(
+    call: Any,
+    model: str,
+    large_model: Optional[str],
+    estimated_tokens: int,
+) -> Any:
+    """Await an agent call under its model's concurrency gate and token budget."""
+    semaphore, bucket = _model_limits(model, large_model)
+    if bucket is not None:
+        await bucket.acquire(estimated_tokens)
+    async with semaphore:
+        return await call
+
+
+# Memoized results of pure agents, keyed by _agent_cache_key (LRU)
+_AGENT_CACHE: "OrderedDict[str, AgentResult]" = OrderedDict()
+
+
+def _agent_cache_key(
+    node_type: str,
+    model: Optional[str],
+    settings: Dict[str, Any],
+    user_message: str,
+    context: Dict[str, Any],
+    reads: Set[str],
+) -> str:
+    """Stable hash of everything a pure agent's result depends on."""
+    payload = json.dumps(
+        {
+            "t": node_type,
+            "model": model,
+            "s": settings,
+            "m": user_message,
+            "ctx": {key: context.get(key) for key in sorted(reads)},
+        },
+        sort_keys=True,
+        default=str,
+    )
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def _agent_cache_get(key: str) -> Optional[AgentResult]:
+    result = _AGENT_CACHE.get(key)
+    if result is None:
+        return None
+    _AGENT_CACHE.move_to_end(key)
+    # Callers merge context_updates into the live context; never hand out the cached objects
+    return copy.deepcopy(result)
+
+
+def _agent_cache_put(key: str, result: AgentResult) -> None:
+    _AGENT_CACHE[key] = copy.deepcopy(result)
+    _AGENT_CACHE.move_to_end(key)
+    while len(_AGENT_CACHE) > config.AGENT_CACHE_SIZE:
+        _AGENT_CACHE.popitem(last=False)
+
+
 # Input node types (don't require agents)
 INPUT_NODE_TYPES = {"prompt", "upload"}
 
 # Output node types (don't require agents)
 OUTPUT_NODE_TYPES = {"response", "spreadsheet", "code_viewer"}
 
+# Routing node types (their decisions can exclude nodes later in the workflow)
+ROUTING_NODE_TYPES = {"supervisor", "orchestrator"}
+
+# Node types on each path a supervisor can choose (workflows without an orchestrator)
+IMAGE_PATH_NODE_TYPES = {"image_generator"}
+TEXT_PATH_NODE_TYPES = {"semantic_search", "sampler", "synthesis", "summarization"}
 
-def topological_sort(nodes: List[str], edges: List[Dict[str, str]]) -> List[str]:
+
+def _iter_topological(
+    nodes: List[str],
+    successors: Mapping[str, List[str]],
+    predecessors: Mapping[str, List[str]],
+) -> Iterator[str]:
+    """
+    Yield nodes in execution order (dependencies first) from prebuilt
+    adjacency maps, which must be restricted to `nodes` (as a WorkflowPlan's
+    are). Each node is yielded as soon as its in-degree drops to zero; nodes
+    on a cycle follow at the end in their original order.
+    """
+    # Work on integer ids; in-degrees come straight from the predecessor lists
+    index = {node: i for i, node in enumerate(nodes)}
+    in_degree = array("i", (len(predecessors[node]) for node in nodes))
+    placed = bytearray(len(nodes))
+    
+    # Kahn's algorithm
+    queue = deque(i for i, degree in enumerate(in_degree) if degree == 0)
+    emitted = 0
+    while queue:
+        position = queue.popleft()
+        placed[position] = 1
+        emitted += 1
+        yield nodes[position]
+        for neighbor in successors[nodes[position]]:
+            target = index[neighbor]
+            in_degree[target] -= 1
+            if in_degree[target] == 0:
+                queue.append(target)
+    
+    # Anything never placed still has unresolved dependencies (cycles)
+    if emitted < len(nodes):
+        for position, done in enumerate(placed):
+            if not done:
+                yield nodes[position]
+
+
+def topological_sort(nodes: Iterable[str], edges: List[Dict[str, str]]) -> List[str]:
     """
     Topologically sort nodes based on edges.
     Returns nodes in execution order (dependencies first).
     """
-    # Build in-degree count
-    in_degree: Dict[str, int] = {node: 0 for node in nodes}
-    adjacency: Dict[str, List[str]] = {node: [] for node in nodes}
-    
+    nodes = list(nodes)
+    # Edges touching unknown nodes are ignored
+    successors: Dict[str, List[str]] = {node: [] for node in nodes}
+    predecessors: Dict[str, List[str]] = {node: [] for node in nodes}
     for edge in edges:
-        source = edge["source"]
-        target = edge["target"]
-        if source in nodes and target in nodes:
-            adjacency[source].append(target)
-            in_degree[target] = in_degree.get(target, 0) + 1
-    
-    # Kahn's algorithm
-    queue = deque([node for node in nodes if in_degree[node] == 0])
-    result = []
+        if edge["source"] in successors and edge["target"] in successors:
+            successors[edge["source"]].append(edge["target"])
+            predecessors[edge["target"]].append(edge["source"])
+    return list(_iter_topological(nodes, successors, predecessors))
+
+
+def _to_csr(
+    index: Dict[str, int],
+    successors: Mapping[str, List[str]],
+) -> Tuple[List[int], List[int]]:
+    """
+    Flatten successor lists into CSR layout over integer node ids.
     
-    while queue:
-        node = queue.popleft()
-        result.append(node)
+    Args:
+        index: Node -> id, numbered 0..n-1 in insertion order
+        successors: Node -> successor nodes
         
-        for neighbor in adjacency.get(node, []):
-            in_degree[neighbor] -= 1
-            if in_degree[neighbor] == 0:
+    Returns:
+        Tuple of (offsets, neighbors); the successors of id i are
+        neighbors[offsets[i]:offsets[i + 1]]
+    """
+    offsets = [0]
+    neighbors: List[int] = []
+    for node in index:
+        neighbors.extend(index[target] for target in successors[node])
+        offsets.append(len(neighbors))
+    return offsets, neighbors
+
+
+def _reachable_csr(starts: List[int], offsets: List[int], neighbors: List[int]) -> bytearray:
+    """BFS over a CSR graph; returns a bitmap with 1 for every id reachable from `starts`."""
+    reached = bytearray(len(offsets) - 1)
+    queue = deque()
+    for start in starts:
+        if not reached[start]:
+            reached[start] = 1
+            queue.append(start)
+    while queue:
+        position = queue.popleft()
+        for k in range(offsets[position], offsets[position + 1]):
+            neighbor = neighbors[k]
+            if not reached[neighbor]:
+                reached[neighbor] = 1
                 queue.append(neighbor)
-    
-    # Add any remaining nodes (cycles or disconnected)
-    remaining = [node for node in nodes if node not in result]
-    result.extend(remaining)
-    
-    return result
+    return reached
 
 
 def find_reachable_nodes(
@@ -105,41 +362,775 @@ def find_reachable_nodes(
     Find all nodes reachable from start nodes via BFS.
     This ensures only connected nodes are executed.
     """
-    # Build adjacency list (forward direction)
-    adjacency: Dict[str, Set[str]] = {node: set() for node in all_nodes}
+    # Same CSR walk as compile_workflow; edges touching unknown nodes are ignored
+    index = {node: i for i, node in enumerate(all_nodes)}
+    successors: Dict[str, List[str]] = {node: [] for node in index}
     for edge in edges:
-        if edge["source"] in all_nodes and edge["target"] in all_nodes:
-            adjacency[edge["source"]].add(edge["target"])
+        if edge["source"] in index and edge["target"] in index:
+            successors[edge["source"]].append(edge["target"])
+    offsets, neighbors = _to_csr(index, successors)
+    reached = _reachable_csr([index[node] for node in start_nodes if node in index], offsets, neighbors)
+    return {node for node, i in index.items() if reached[i]}
+
+
+def descendants(node: str, succs: Mapping[str, Collection[str]]) -> Iterator[str]:
+    """Lazily yield every node reachable from `node` (excluding it), depth-first."""
+    seen = {node}
+    stack = list(succs.get(node, ()))
+    while stack:
+        current = stack.pop()
+        if current in seen:
+            continue
+        seen.add(current)
+        yield current
+        stack.extend(succs.get(current, ()))
+
+
+def has_path(src: str, dst: str, succs: Mapping[str, Collection[str]]) -> bool:
+    """True if `dst` is downstream of `src`; stops at the first hit."""
+    return any(node == dst for node in descendants(src, succs))
+
+
+def _label_components(nodes: List[str], successors: Mapping[str, List[str]]) -> Dict[str, int]:
+    """
+    Label weakly-connected components (edges treated as undirected) via union-find.
+    Component ids are numbered in order of each component's first node in `nodes`.
+    """
+    parent = {node: node for node in nodes}
     
-    # BFS from start nodes
-    reachable = set(start_nodes)
-    queue = deque(start_nodes)
+    def find(node: str) -> str:
+        while parent[node] != node:
+            parent[node] = parent[parent[node]]
+            node = parent[node]
+        return node
     
-    while queue:
-        node = queue.popleft()
-        for neighbor in adjacency.get(node, set()):
-            if neighbor not in reachable:
-                reachable.add(neighbor)
-                queue.append(neighbor)
+    for source in nodes:
+        for target in successors.get(source, ()):
+            source_root = find(source)
+            target_root = find(target)
+            if source_root != target_root:
+                parent[target_root] = source_root
+    
+    component_ids: Dict[str, int] = {}
+    return {node: component_ids.setdefault(find(node), len(component_ids)) for node in nodes}
+
+
+def _merge_component_contexts(contexts: List[Dict[str, Any]]) -> Dict[str, Any]:
+    """Combine the final contexts of independent subgraphs for the 'done' event."""
+    if len(contexts) == 1:
+        return contexts[0]
+    
+    merged = dict(contexts[0])
+    merged["final_answer"] = "\n\n".join(c["final_answer"] for c in contexts if c.get("final_answer"))
+    merged["context_snippets"] = [s for c in contexts for s in c["context_snippets"]]
+    merged["docs"] = [doc for c in contexts for doc in c["docs"]]
+    merged["tool_outputs"] = {
+        key: [item for c in contexts for item in c["tool_outputs"].get(key, [])]
+        for key in contexts[0]["tool_outputs"]
+    }
+    output_formats = [c["output_format"] for c in contexts if "output_format" in c]
+    if output_formats:
+        merged["output_format"] = output_formats[0]
+    return merged
+
+
+@dataclass(slots=True)
+class NodeSpec:
+    """A workflow node with its type and settings resolved once at ingest."""
+    type: str
+    settings: Dict[str, Any]
+    data: Dict[str, Any]
+    
+    @classmethod
+    def from_node(cls, node: Dict[str, Any]) -> "NodeSpec":
+        data = node.get("data", {})
+        # The ID prefix ("semantic_search-3" -> "semantic_search") is the fallback type
+        return cls(
+            type=data.get("nodeType") or node["id"].partition("-")[0],
+            settings=data.get("settings", {}),
+            data=data,
+        )
+
+
+@dataclass(slots=True)
+class Step:
+    """One entry of the execution trace; `extras` carries agent metadata, flattened on output."""
+    agent: str
+    model: str
+    action: str
+    content: str
+    extras: Dict[str, Any] = field(default_factory=dict)
+    
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "agent": self.agent,
+            "model": self.model,
+            "action": self.action,
+            "content": self.content,
+            **self.extras,
+        }
+
+
+@dataclass(frozen=True, slots=True)
+class WorkflowPlan:
+    """
+    Everything about a workflow that depends only on its graph (node IDs,
+    node types and edges), computed once and shared by every run of it.
+    """
+    input_nodes: FrozenSet[str]
+    reachable_nodes: FrozenSet[str]
+    valid_edges: List[Dict[str, str]]
+    nodes_by_type: Dict[str, Set[str]]
+    predecessors: Dict[str, List[str]]
+    successors: Dict[str, List[str]]
+    execution_order: List[str]
+    order_index: Dict[str, int]
+    component_of: Dict[str, int]
+    component_count: int
+    # Topological positions of supervisor/orchestrator nodes, per component
+    router_positions: List[Tuple[int, ...]]
+    # Orchestrators in topological order
+    orchestrator_nodes: List[str]
+    # (excluded, selected) branch nodes per (orchestrator, selected tools), filled in on first use
+    orchestrator_exclusions: Dict[Tuple[str, FrozenSet[str]], Tuple[Set[str], Set[str]]]
+
+
+def compile_workflow(node_types: Dict[str, str], workflow_edges: List[Dict[str, str]]) -> WorkflowPlan:
+    """
+    Resolve reachability, topology and subgraphs for a workflow graph.
+    
+    Args:
+        node_types: Node ID -> node type for every node on the canvas
+        workflow_edges: List of edges defining connections
+        
+    Returns:
+        The workflow's execution plan
+    """
+    # Relabel nodes as integers in canvas order, so per-node flags are bitmaps
+    node_ids = list(node_types)
+    index = {node_id: i for i, node_id in enumerate(node_ids)}
+    
+    # The only pass over the edge list: adjacency in both directions (edges
+    # touching unknown nodes are dropped) plus which nodes have an incoming edge
+    all_successors: Dict[str, List[str]] = {node_id: [] for node_id in node_types}
+    all_predecessors: Dict[str, List[str]] = {node_id: [] for node_id in node_types}
+    has_incoming = bytearray(len(node_ids))
+    for edge in workflow_edges:
+        source, target = edge["source"], edge["target"]
+        target_id = index.get(target)
+        if target_id is None:
+            continue
+        has_incoming[target_id] = 1
+        if source in index:
+            all_successors[source].append(target)
+            all_predecessors[target].append(source)
+    
+    # Find input nodes (nodes with no incoming edges or input types)
+    input_ids = [
+        i for i, node_type in enumerate(node_types.values())
+        if node_type in INPUT_NODE_TYPES or not has_incoming[i]
+    ]
+    input_nodes = {node_ids[i] for i in input_ids}
+    
+    # Find all nodes reachable from inputs: BFS over the CSR form, marking a
+    # bitmap instead of hashing node ids
+    offsets, neighbors = _to_csr(index, all_successors)
+    reached = _reachable_csr(input_ids, offsets, neighbors)
+    # Kept in canvas order, so the topological sort breaks ties the same way every run
+    reachable_order = [node_id for node_id, hit in zip(node_ids, reached) if hit]
+    reachable_nodes = set(reachable_order)
+    
+    # Restrict adjacency to reachable nodes; successors of a reachable node are
+    # reachable themselves, so only predecessor lists need filtering
+    successors = {node_id: all_successors[node_id] for node_id in reachable_nodes}
+    predecessors = {
+        node_id: [source for source in all_predecessors[node_id] if source in reachable_nodes]
+        for node_id in reachable_nodes
+    }
+    valid_edges = [
+        {"source": source, "target": target}
+        for source, targets in successors.items()
+        for target in targets
+    ]
+    
+    # Reachable nodes grouped by type
+    nodes_by_type: Dict[str, Set[str]] = {}
+    for node_id in reachable_nodes:
+        nodes_by_type.setdefault(node_types[node_id], set()).add(node_id)
+    
+    # Topologically sort reachable nodes
+    execution_order = list(_iter_topological(reachable_order, successors, predecessors))
+    order_index = {node_id: i for i, node_id in enumerate(execution_order)}
+    
+    # Disconnected subgraphs (e.g. several drafts on one canvas) are independent
+    component_of = _label_components(execution_order, successors)
+    component_count = max(component_of.values(), default=0) + 1
+    
+    router_positions: List[List[int]] = [[] for _ in range(component_count)]
+    for node_id in execution_order:
+        if node_types[node_id] in ROUTING_NODE_TYPES:
+            router_positions[component_of[node_id]].append(order_index[node_id])
+    
+    return WorkflowPlan(
+        input_nodes=frozenset(input_nodes),
+        reachable_nodes=frozenset(reachable_nodes),
+        valid_edges=valid_edges,
+        nodes_by_type=nodes_by_type,
+        predecessors=predecessors,
+        successors=successors,
+        execution_order=execution_order,
+        order_index=order_index,
+        component_of=component_of,
+        component_count=component_count,
+        router_positions=[tuple(positions) for positions in router_positions],
+        orchestrator_nodes=sorted(nodes_by_type.get("orchestrator", ()), key=order_index.__getitem__),
+        orchestrator_exclusions={},
+    )
+
+
+# Compiled plans keyed by _plan_key (LRU); repeat runs of a workflow skip compile_workflow
+_PLAN_CACHE: "OrderedDict[str, WorkflowPlan]" = OrderedDict()
+
+
+def _plan_key(node_types: Dict[str, str], workflow_edges: List[Dict[str, str]]) -> str:
+    """Stable hash of a workflow's graph structure (node IDs, types and edges)."""
+    payload = json.dumps(
+        {
+            "n": sorted(node_types.items()),
+            "e": sorted((edge["source"], edge["target"]) for edge in workflow_edges),
+        }
+    )
+    return hashlib.blake2b(payload.encode("utf-8"), digest_size=16).hexdigest()
+
+
+def get_workflow_plan(node_types: Dict[str, str], workflow_edges: List[Dict[str, str]]) -> WorkflowPlan:
+    """Return the cached plan for this graph, compiling it on first use."""
+    if config.PLAN_CACHE_SIZE <= 0:
+        return compile_workflow(node_types, workflow_edges)
+    
+    key = _plan_key(node_types, workflow_edges)
+    plan = _PLAN_CACHE.get(key)
+    if plan is not None:
+        _PLAN_CACHE.move_to_end(key)
+        return plan
+    
+    plan = _PLAN_CACHE[key] = compile_workflow(node_types, workflow_edges)
+    while len(_PLAN_CACHE) > config.PLAN_CACHE_SIZE:
+        _PLAN_CACHE.popitem(last=False)
+    return plan
+
+
+class ContextView(Mapping):
+    """
+    Read-only view of the execution context handed to one agent.
+    
+    Reads see the snapshot taken when the agent was launched plus the view's
+    own writes; writes (`set`) only land in `diff`, which the scheduler
+    commits together with the agent's context_updates once it finishes.
+    Concurrent agents therefore never observe each other's partial results.
+    """
+    
+    __slots__ = ("_base", "diff")
+    
+    def __init__(self, base: Dict[str, Any]) -> None:
+        self._base = base
+        self.diff: Dict[str, Any] = {}
+    
+    def __getitem__(self, key: str) -> Any:
+        if key in self.diff:
+            return self.diff[key]
+        return self._base[key]
+    
+    def __iter__(self) -> Iterator[str]:
+        yield from self.diff
+        yield from (key for key in self._base if key not in self.diff)
+    
+    def __len__(self) -> int:
+        return len(self._base.keys() | self.diff.keys())
+    
+    def set(self, key: str, value: Any) -> None:
+        self.diff[key] = value
+
+
+# Context keys that accumulate across agents, and where each one lives
+_LIST_CONTEXT_KEYS: Dict[str, Tuple[str, ...]] = {
+    "context_snippets": ("context_snippets",),
+    "docs": ("docs",),
+    "images": ("tool_outputs", "images"),
+}
+
+
+def _commit_updates(
+    context: Dict[str, Any],
+    updates: Dict[str, Any],
+    position: int,
+    merge_state: Dict[str, Any],
+) -> None:
+    """
+    Merge one agent's context updates as if agents had run one at a time in
+    topological order, whatever order they actually finished in.
+    
+    List contributions are kept ordered by node position, and a plain key
+    keeps the value from the latest node (by position) that wrote it. Values
+    are rebound rather than mutated, so snapshots held by running agents
+    stay stable.
+    """
+    for key, value in updates.items():
+        path = _LIST_CONTEXT_KEYS.get(key)
+        if path is None:
+            writers = merge_state.setdefault("writers", {})
+            if position >= writers.get(key, -1):
+                writers[key] = position
+                context[key] = value
+            continue
+        
+        parts = merge_state.setdefault(key, [])
+        bisect.insort(parts, (position, list(value)), key=lambda part: part[0])
+        merged = [item for _, items in parts for item in items]
+        if len(path) == 1:
+            context[key] = merged
+        else:
+            context[path[0]] = {**context[path[0]], path[1]: merged}
+
+
+# Encoded "event: ...\ndata: " prefixes, one per event type (others are added on first use)
+_SSE_PREFIXES: Dict[str, bytes] = {
+    event_type: f"event: {event_type}\ndata: ".encode("utf-8")
+    for event_type in ("agent_start", "agent_complete", "done", "error", "token", "result")
+}
+
+
+def _sse_default(obj: Any) -> Any:
+    """Serialize trace Steps as flat dicts (the shape the frontend reads)."""
+    if isinstance(obj, Step):
+        return obj.as_dict()
+    raise TypeError(f"Type is not JSON serializable: {type(obj).__name__}")
+
+
+def sse_event(event_type: str, data: Dict[str, Any]) -> bytes:
+    """
+    Format a Server-Sent Event as bytes, ready for the response stream.
+    
+    Shared by every streaming endpoint so events are framed and escaped
+    the same way.
+    """
+    prefix = _SSE_PREFIXES.get(event_type)
+    if prefix is None:
+        prefix = _SSE_PREFIXES[event_type] = f"event: {event_type}\ndata: ".encode("utf-8")
+    if orjson is not None:
+        body = orjson.dumps(
+            data,
+            default=_sse_default,
+            option=orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATACLASS,
+        )
+    else:
+        body = json.dumps(data, default=_sse_default).encode("utf-8")
+    return prefix + body + b"\n\n"
+
+
+# Max characters of text kept per uploaded file
+_UPLOAD_TEXT_LIMIT = config.UPLOAD_TEXT_LIMIT
+
+
+def _join_capped(parts: Iterable[str], sep: str, limit: int) -> str:
+    """
+    Join lazily produced parts, stopping as soon as the result exceeds
+    `limit` characters. The result overshoots by at most the last part, so
+    callers can still tell it was cut short with `len(text) > limit`.
+    """
+    taken: List[str] = []
+    total = -len(sep)
+    for part in parts:
+        taken.append(part)
+        total += len(sep) + len(part)
+        if total > limit:
+            break
+    return sep.join(taken)
+
+
+def _decode_upload(file_content: str, prefix: str) -> bytes:
+    """Decode a "<prefix><base64>" upload payload (blocking; run in a worker thread)."""
+    # b64decode re-encodes str input to ASCII bytes, so slicing the str first
+    # would copy the payload twice; encode once and slice a view instead
+    encoded = file_content.encode("ascii")
+    return base64.b64decode(memoryview(encoded)[len(prefix):])
+
+
+# Most recently used extracted upload texts, kept in memory in front of the
+# disk cache (accessed from worker threads, hence the lock)
+_EXTRACTION_MEMO: "OrderedDict[Path, str]" = OrderedDict()
+_EXTRACTION_MEMO_LOCK = threading.Lock()
+_EXTRACTION_MEMO_SIZE = 32
+
+
+def _remember_extraction(path: Path, text: str) -> None:
+    with _EXTRACTION_MEMO_LOCK:
+        _EXTRACTION_MEMO[path] = text
+        _EXTRACTION_MEMO.move_to_end(path)
+        if len(_EXTRACTION_MEMO) > _EXTRACTION_MEMO_SIZE:
+            _EXTRACTION_MEMO.popitem(last=False)
+
+
+def _load_extraction(file_content: str) -> Tuple[Optional[Path], Optional[str]]:
+    """
+    Look up previously extracted text for an upload (blocking; run in a worker thread).
+    
+    Returns:
+        Tuple of (cache path to store a fresh extraction at, cached text);
+        both None when the upload cache is disabled
+    """
+    if not config.UPLOAD_CACHE_ENABLED:
+        return None, None
+    # The stored text is truncated to the limit, so a new limit means a new entry
+    hasher = hashlib.blake2b(f"{_UPLOAD_TEXT_LIMIT}:".encode("utf-8"), digest_size=16)
+    hasher.update(file_content.encode("utf-8"))
+    key = hasher.hexdigest()
+    path = config.UPLOAD_CACHE_DIR / f"{key}.txt"
+    with _EXTRACTION_MEMO_LOCK:
+        text = _EXTRACTION_MEMO.get(path)
+        if text is not None:
+            _EXTRACTION_MEMO.move_to_end(path)
+            return path, text
+    try:
+        text = path.read_text(encoding="utf-8")
+    except OSError:
+        return path, None
+    _remember_extraction(path, text)
+    return path, text
+
+
+def _store_extraction(path: Optional[Path], text: str) -> None:
+    """Cache extracted upload text (blocking; run in a worker thread)."""
+    if path is None:
+        return
+    _remember_extraction(path, text)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write then rename, so concurrent workers never read a partial file
+        partial = path.with_name(f"{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        partial.write_text(text, encoding="utf-8")
+        os.replace(partial, path)
+    except OSError as e:
+        workflow_logger.warning("[UPLOAD] Could not cache extracted text at %s: %s", path, e)
+
+
+# Pages whose text layer is shorter than this are treated as scanned images
+_TEXTLESS_PAGE_CHARS = 50
+
+
+def _extract_pdf_text(pdf_bytes: bytes) -> Tuple[str, int, List[int]]:
+    """
+    Extract the text layer of a PDF (blocking; run in a worker thread).
+    
+    Returns:
+        Tuple of ("[Page N]"-labelled page texts, page count, indices of the
+        extracted pages with (almost) no text layer)
+    """
+    pdf_reader = PdfReader(BytesIO(pdf_bytes))
+    pages = pdf_reader.pages
+    textless_pages: List[int] = []
+    
+    def page_texts() -> Iterator[str]:
+        for i, page in enumerate(pages):
+            page_text = page.extract_text()
+            if len(page_text.strip()) < _TEXTLESS_PAGE_CHARS:
+                textless_pages.append(i)
+            if page_text:
+                yield f"[Page {i+1}]\n{page_text}"
+    
+    # Pages past the upload text limit are never extracted
+    text = _join_capped(page_texts(), "\n\n", _UPLOAD_TEXT_LIMIT)
+    return text, len(pages), textless_pages
+
+
+# Scanned PDF pages OCR'd at once
+_OCR_WORKERS = os.cpu_count() or 1
+
+# Pages are rasterized at the lower DPI first and retried at the higher one
+# only when OCR finds (almost) nothing
+_OCR_DPI = 200
+_OCR_RETRY_DPI = 300
+
+
+def _ocr_pdf_text(pdf_bytes: bytes, page_indices: List[int]) -> str:
+    """
+    OCR the given pages of a scanned PDF (blocking; run in a worker thread).
+    
+    Args:
+        pdf_bytes: The PDF file
+        page_indices: 0-based indices of the pages to OCR, in order
+    
+    Raises:
+        ImportError: pdf2image or pytesseract is not installed
+    """
+    if convert_from_bytes is None or pytesseract is None:
+        raise ImportError("pdf2image and pytesseract are required for OCR")
+    
+    workflow_logger.debug("[UPLOAD] OCR libraries found. Running OCR on %s pages...", len(page_indices))
+    
+    # Extract text from each page using OCR
+    # Use multiple languages: English + Arabic for best coverage
+    ocr_langs = 'eng+ara'  # Supports mixed English/Arabic documents
+    
+    def ocr_page(i: int) -> str:
+        page_ocr_text = ""
+        for dpi in (_OCR_DPI, _OCR_RETRY_DPI):
+            workflow_logger.debug("[UPLOAD] Running OCR on page %s at %s DPI (langs: %s)...", i+1, dpi, ocr_langs)
+            # Rasterize only this page
+            image = convert_from_bytes(pdf_bytes, dpi=dpi, first_page=i+1, last_page=i+1)[0]
+            page_ocr_text = pytesseract.image_to_string(image, lang=ocr_langs)
+            if len(page_ocr_text.strip()) >= 100:
+                break
+        return page_ocr_text
+    
+    def ocr_pages() -> Iterator[str]:
+        # Each page runs in its own tesseract process, so threads are enough to
+        # use every core; only a window of pages is in flight, so stopping at
+        # the text limit doesn't rasterize or OCR the rest
+        with ThreadPoolExecutor(max_workers=_OCR_WORKERS) as pool:
+            indices = iter(page_indices)
+            pending = deque((i, pool.submit(ocr_page, i)) for i in itertools.islice(indices, _OCR_WORKERS))
+            while pending:
+                i, future = pending.popleft()
+                for j in itertools.islice(indices, 1):
+                    pending.append((j, pool.submit(ocr_page, j)))
+                page_ocr_text = future.result()
+                if page_ocr_text.strip():
+                    workflow_logger.debug("[UPLOAD] Page %s: Extracted %s chars via OCR", i+1, len(page_ocr_text))
+                    yield f"[Page {i+1} - OCR]\n{page_ocr_text}"
+    
+    # OCR stops once the upload text limit is reached
+    return _join_capped(ocr_pages(), "\n\n", _UPLOAD_TEXT_LIMIT)
+
+
+def _extract_docx_text(docx_bytes: bytes) -> str:
+    """Extract paragraph and table text from a DOCX file (blocking; run in a worker thread)."""
+    doc = Document(BytesIO(docx_bytes))
+    
+    # Extract text from paragraphs, then tables (skipped once the limit is reached)
+    paragraphs = (para.text for para in doc.paragraphs if para.text.strip())
+    table_rows = (
+        " | ".join(cell.text for cell in row.cells)
+        for table in doc.tables
+        for row in table.rows
+    )
+    return _join_capped(itertools.chain(paragraphs, table_rows), "\n", _UPLOAD_TEXT_LIMIT)
+
+
+async def _parse_pdf_upload(file_name: str, file_content: str, prefix: str) -> Optional[str]:
+    """
+    Extract the text of an uploaded PDF, falling back to OCR for scanned pages.
+    
+    Returns:
+        The (possibly truncated) text, or None when no usable text could be extracted
+    """
+    if PdfReader is None:
+        raise ImportError("pypdf is not installed")
+    
+    pdf_bytes = await asyncio.to_thread(_decode_upload, file_content, prefix)
+    
+    # Step 1: Try to extract text directly (works for text-based PDFs).
+    # Parsing is CPU-bound, so it runs off the event loop.
+    extracted_text, page_count, textless_pages = await asyncio.to_thread(_extract_pdf_text, pdf_bytes)
+    
+    # Step 2: If very little text extracted, it's likely a scanned PDF - use OCR
+    if len(extracted_text.strip()) < 100:  # Threshold for scanned PDF detection
+        workflow_logger.debug("[UPLOAD] PDF appears to be scanned (only %s chars extracted), attempting OCR...", len(extracted_text))
+        ocr_success = False
+        # Pages that do have a text layer keep it instead of being rasterized
+        ocr_pages = textless_pages or list(range(page_count))
+        try:
+            ocr_text = await asyncio.to_thread(_ocr_pdf_text, pdf_bytes, ocr_pages)
+            
+            if ocr_text.strip():
+                if len(ocr_pages) < page_count:
+                    extracted_text = f"{extracted_text}\n\n{ocr_text}"
+                else:
+                    extracted_text = ocr_text
+                ocr_success = True
+                workflow_logger.debug("[UPLOAD] ✅ OCR SUCCESS: Extracted %s chars from scanned PDF", len(extracted_text))
+            else:
+                workflow_logger.debug("[UPLOAD] ⚠️ OCR completed but extracted no text")
+                
+        except ImportError as import_err:
+            workflow_logger.warning("[UPLOAD] ❌ OCR libraries not installed!")
+            workflow_logger.warning("[UPLOAD] Missing: %s", import_err)
+            workflow_logger.warning("[UPLOAD] Install with: pip install pdf2image pytesseract Pillow")
+            workflow_logger.warning("[UPLOAD] Also install Tesseract OCR engine:")
+            workflow_logger.warning("[UPLOAD]   macOS: brew install tesseract")
+            workflow_logger.warning("[UPLOAD]   Linux: sudo apt-get install tesseract-ocr")
+            workflow_logger.warning("[UPLOAD]   Windows: https://github.com/UB-Mannheim/tesseract/wiki")
+        except Exception as ocr_error:
+            workflow_logger.warning("[UPLOAD] ❌ OCR failed with error: %s", ocr_error)
+            workflow_logger.warning("[UPLOAD] Error type: %s", type(ocr_error).__name__)
+            workflow_logger.debug("[UPLOAD] OCR traceback", exc_info=True)
+        
+        if not ocr_success and len(extracted_text.strip()) < 100:
+            workflow_logger.warning("[UPLOAD] ❌ CRITICAL: OCR failed and no text extracted. PDF cannot be processed.")
+            workflow_logger.warning("[UPLOAD] This is a scanned PDF that requires OCR, but OCR is not working.")
+            return None
+    
+    if len(extracted_text.strip()) <= 50:
+        return None
     
-    return reachable
+    # Success: we have meaningful extracted text
+    final_text = extracted_text[:_UPLOAD_TEXT_LIMIT]
+    if len(extracted_text) > _UPLOAD_TEXT_LIMIT:
+        final_text += f"\n\n[Document truncated at {_UPLOAD_TEXT_LIMIT} chars ({page_count} pages total)]"
+    workflow_logger.debug("[UPLOAD] ✅ Final extracted %s chars from PDF: %s", len(final_text), file_name)
+    return final_text
 
 
-def get_node_dependencies(node_id: str, edges: List[Dict[str, str]]) -> List[str]:
-    """Get all nodes that must execute before this node."""
-    return [edge["source"] for edge in edges if edge["target"] == node_id]
+async def _parse_docx_upload(file_name: str, file_content: str, prefix: str) -> Optional[str]:
+    """Extract the (possibly truncated) paragraph and table text of an uploaded DOCX."""
+    if Document is None:
+        raise ImportError("python-docx is not installed")
+    
+    docx_bytes = await asyncio.to_thread(_decode_upload, file_content, prefix)
+    extracted_text = await asyncio.to_thread(_extract_docx_text, docx_bytes)
+    workflow_logger.debug("[UPLOAD] Extracted %s chars from DOCX: %s", len(extracted_text), file_name)
+    if len(extracted_text) > _UPLOAD_TEXT_LIMIT:
+        return f"{extracted_text[:_UPLOAD_TEXT_LIMIT]}\n\n[Document truncated at {_UPLOAD_TEXT_LIMIT} chars]"
+    return extracted_text
+
+
+# Encoded upload formats by payload prefix: (kind, block label, parser, note when no text was found)
+_UPLOAD_PARSERS: Dict[str, Tuple[str, str, Callable[[str, str, str], Awaitable[Optional[str]]], str]] = {
+    "__PDF_BASE64__": (
+        "PDF",
+        "PDF File",
+        _parse_pdf_upload,
+        "[ERROR: This is a scanned/image-based PDF. OCR text extraction failed. Please install OCR dependencies: pip install pdf2image pytesseract && brew install tesseract poppler]",
+    ),
+    "__DOCX_BASE64__": ("DOCX", "Word File", _parse_docx_upload, ""),
+}
 
 
-def _sse_event(event_type: str, data: Dict[str, Any]) -> str:
-    """Format a Server-Sent Event."""
-    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+async def _extract_upload(file_name: str, file_content: str) -> str:
+    """Turn one uploaded file into its labelled block of text for the workflow context."""
+    for prefix, (kind, label, parse, unreadable_note) in _UPLOAD_PARSERS.items():
+        if file_content.startswith(prefix):
+            break
+    else:
+        # Plain text content
+        return f"[File: {file_name}]\n{file_content[:_UPLOAD_TEXT_LIMIT]}"
+    
+    cache_path, text = await asyncio.to_thread(_load_extraction, file_content)
+    if text is not None:
+        workflow_logger.debug("[UPLOAD] Reused cached text for %s: %s", kind, file_name)
+        return f"[{label}: {file_name}]\n{text}"
+    
+    try:
+        text = await parse(file_name, file_content, prefix)
+    except Exception as e:
+        workflow_logger.warning("[UPLOAD] Failed to parse %s %s: %s", kind, file_name, e)
+        return f"[{label}: {file_name}]\n[Error parsing {kind}: {str(e)}]"
+    
+    if text is None:
+        # Tell the transformer a file was uploaded even though it couldn't be read
+        workflow_logger.warning("[UPLOAD] ❌ No text extracted from %s %s", kind, file_name)
+        return f"[{label}: {file_name}]\n{unreadable_note}"
+    
+    # Only successful extractions are cached, so fixing e.g. OCR takes effect
+    await asyncio.to_thread(_store_extraction, cache_path, text)
+    return f"[{label}: {file_name}]\n{text}"
+
+
+async def _run_upload_node(uploaded_files: List[Dict[str, Any]], user_message: str) -> AgentResult:
+    """
+    Extract every file of an upload node concurrently and return the
+    context updates the scheduler merges like an agent's.
+    """
+    for file_info in uploaded_files:
+        workflow_logger.debug(
+            "[UPLOAD] File: %s, content length: %s",
+            file_info.get("name", "unknown"), len(file_info.get("content") or ""),
+        )
+    file_contents = await asyncio.gather(*(
+        _extract_upload(file_info.get("name", "unknown"), file_info["content"])
+        for file_info in uploaded_files
+        if file_info.get("content")
+    ))
+    
+    if file_contents:
+        uploaded_file_content = "\n\n".join(file_contents)
+        effective_message = f"{user_message}\n\nUploaded files:\n{uploaded_file_content}"
+        workflow_logger.debug("[UPLOAD] Set uploaded_file_content with %s chars", len(uploaded_file_content))
+    else:
+        # No content extracted from any files - set error message
+        workflow_logger.warning("[UPLOAD] ⚠️ WARNING: %s files uploaded but no content extracted!", len(uploaded_files))
+        file_names = [f.get("name", "unknown") for f in uploaded_files]
+        uploaded_file_content = f"[UPLOAD ERROR: Files uploaded ({', '.join(file_names)}) but content extraction failed. If these are scanned PDFs, OCR may not be installed or working. Install: pip install pdf2image pytesseract && brew install tesseract poppler]"
+        effective_message = f"{user_message}\n\n{uploaded_file_content}"
+    
+    return AgentResult(
+        agent="upload",
+        model="none",
+        action="input",
+        content=f"Uploaded and parsed {len(uploaded_files)} file(s)",
+        context_updates={
+            "uploaded_file_content": uploaded_file_content,
+            "user_message": effective_message,
+        },
+    )
+
+
+# Seconds without an event before the stream sends a keep-alive comment
+_SSE_KEEPALIVE_INTERVAL = 15.0
+
+# Events buffered for a client that reads slower than the workflow produces
+_SSE_QUEUE_SIZE = 256
+
+
+async def _coalesce_events(events: AsyncGenerator[bytes, None]) -> AsyncGenerator[bytes, None]:
+    """
+    Forward SSE events, joining those produced within one event-loop tick
+    into a single chunk so a burst costs one response write, not one each.
+    
+    Events are produced by a separate task, so agents keep running while a
+    slow client reads; only a backlog of _SSE_QUEUE_SIZE events pauses them.
+    """
+    queue: "asyncio.Queue[Optional[bytes]]" = asyncio.Queue(maxsize=_SSE_QUEUE_SIZE)
+    
+    async def produce() -> None:
+        # None marks the end; a cancelled producer has no reader left to tell
+        try:
+            async for event in events:
+                await queue.put(event)
+        except Exception:
+            await queue.put(None)
+            raise
+        await queue.put(None)
+    
+    producer = asyncio.create_task(produce())
+    try:
+        finished = False
+        while not finished:
+            try:
+                burst = [await asyncio.wait_for(queue.get(), _SSE_KEEPALIVE_INTERVAL)]
+            except asyncio.TimeoutError:
+                # Long OCR or LLM calls can leave the stream silent for minutes;
+                # an SSE comment stops proxies from closing it as idle
+                yield b": keep-alive\n\n"
+                continue
+            while not queue.empty():
+                burst.append(queue.get_nowait())
+            if burst[-1] is None:
+                finished = True
+                burst.pop()
+            if burst:
+                yield b"".join(burst)
+        # Surface a failure of the event source
+        await producer
+    finally:
+        producer.cancel()
 
 
 async def execute_workflow(
     user_message: str,
     workflow_nodes: List[Dict[str, Any]],
     workflow_edges: List[Dict[str, str]],
-) -> AsyncGenerator[str, None]:
+) -> AsyncGenerator[bytes, None]:
     """
     Execute a custom workflow defined by nodes and edges.
     
@@ -154,71 +1145,66 @@ async def execute_workflow(
         workflow_edges: List of edges defining connections
         
     Yields:
-        SSE events for workflow execution
+        SSE events for workflow execution, batched per event-loop tick
     """
+    async for chunk in _coalesce_events(_workflow_events(user_message, workflow_nodes, workflow_edges)):
+        yield chunk
+
+
+async def _workflow_events(
+    user_message: str,
+    workflow_nodes: List[Dict[str, Any]],
+    workflow_edges: List[Dict[str, str]],
+) -> AsyncGenerator[bytes, None]:
+    """Run the workflow, yielding one SSE event at a time (see execute_workflow)."""
     # Initialize debugging session
     execution_id = str(uuid.uuid4())[:8]
     debugger.start_execution(execution_id)
     
     workflow_start = time.time()
-    steps: List[Dict[str, Any]] = []
+    steps: List[Step] = []
     
     # Get LLM client and models
-    llm_client = get_llm_client()
-    small_model = config.get_model_config()["small"]
-    large_model = config.get_model_config()["large"]
+    llm_client, models_for_default = _get_cached_client()
     
-    workflow_logger.debug(f"Using models - small: {small_model}, large: {large_model}")
+    workflow_logger.debug(
+        "Using models - small: %s, large: %s", models_for_default["small"], models_for_default["large"]
+    )
     
-    # Extract node IDs and types
-    node_map = {node["id"]: node for node in workflow_nodes}
-    all_node_ids = set(node_map.keys())
+    # Resolve each node's type, settings and data once
+    specs = {node["id"]: NodeSpec.from_node(node) for node in workflow_nodes}
     
     # Log node types for clarity
     workflow_logger.debug("Node registry:")
-    for nid, node in node_map.items():
-        ntype = node.get("data", {}).get("nodeType", "unknown")
-        workflow_logger.debug(f"  {nid} -> {ntype}")
+    for nid, spec in specs.items():
+        workflow_logger.debug("  %s -> %s", nid, spec.type)
     
-    # Find input nodes (nodes with no incoming edges or input types)
-    nodes_with_incoming = {edge["target"] for edge in workflow_edges}
-    input_nodes = set()
-    
-    for node_id, node in node_map.items():
-        node_type = node.get("data", {}).get("nodeType", node_id.split("-")[0])
-        if node_type in INPUT_NODE_TYPES or node_id not in nodes_with_incoming:
-            input_nodes.add(node_id)
-    
-    # Find all nodes reachable from inputs
-    reachable_nodes = find_reachable_nodes(input_nodes, workflow_edges, all_node_ids)
-    
-    # Filter edges to only include reachable nodes
-    valid_edges = [
-        edge for edge in workflow_edges
-        if edge["source"] in reachable_nodes and edge["target"] in reachable_nodes
-    ]
-    
-    # Topologically sort reachable nodes
-    execution_order = topological_sort(list(reachable_nodes), valid_edges)
+    # Reachability, topology and subgraphs depend only on the graph, so repeat
+    # runs of the same workflow reuse the compiled plan
+    plan = get_workflow_plan({node_id: spec.type for node_id, spec in specs.items()}, workflow_edges)
+    input_nodes = plan.input_nodes
+    reachable_nodes = plan.reachable_nodes
+    valid_edges = plan.valid_edges
+    nodes_by_type = plan.nodes_by_type
+    predecessors = plan.predecessors
+    successors = plan.successors
+    execution_order = plan.execution_order
+    order_index = plan.order_index
+    component_of = plan.component_of
     
     # Log workflow setup
     debugger.log_workflow_setup(input_nodes, reachable_nodes, execution_order, valid_edges)
     
     # Extract spreadsheet node settings if present (for transformer to use)
     spreadsheet_settings = {}
-    has_spreadsheet_output = False
-    for node_id in reachable_nodes:
-        node = node_map.get(node_id)
-        if node:
-            node_data = node.get("data", {})
-            if node_data.get("nodeType") == "spreadsheet":
-                spreadsheet_settings = node_data.get("settings", {})
-                has_spreadsheet_output = True
-                print(f"[WORKFLOW] Found spreadsheet settings: {spreadsheet_settings}")
-                break
+    spreadsheet_nodes = nodes_by_type.get("spreadsheet")
+    if spreadsheet_nodes:
+        # The first one in execution order, so the choice is stable across runs
+        spreadsheet_settings = specs[min(spreadsheet_nodes, key=order_index.__getitem__)].settings
+        workflow_logger.debug("[WORKFLOW] Found spreadsheet settings: %s", spreadsheet_settings)
     
     # Execution context - shared state between nodes
-    context: Dict[str, Any] = {
+    base_context: Dict[str, Any] = {
         "user_message": user_message,
         "context_snippets": [],
         "candidates": [],
@@ -234,559 +1220,512 @@ async def execute_workflow(
         "spreadsheet_settings": spreadsheet_settings,  # Pass to transformer
     }
     
+    # Disconnected subgraphs (e.g. several drafts on one canvas) are independent:
+    # each gets its own context and routing, and they run side by side
+    contexts = [copy.deepcopy(base_context) for _ in range(plan.component_count)]
+    context = contexts[0]
+    # Per-component bookkeeping for deterministic merges (see _commit_updates)
+    merge_states: List[Dict[str, Any]] = [{} for _ in contexts]
+    # Per-component (supervisor_guidance, supervisor_plan, selected path) of the
+    # last parse; the texts only change when a supervisor finishes
+    supervisor_paths: List[Tuple[Any, Any, Optional[str]]] = [("", "", None) for _ in contexts]
+    
     # Track executed and excluded nodes
     executed_nodes: Set[str] = set()
     excluded_nodes: Set[str] = set()
     
+    # Layered scheduling: a node becomes ready once every predecessor has
+    # finished, and all ready agents run concurrently. Ready nodes are taken
+    # in topological order so routing decisions and events stay deterministic.
+    unfinished_deps = {node_id: len(predecessors[node_id]) for node_id in reachable_nodes}
+    
+    ready: List[Tuple[int, str]] = [
+        (order_index[node_id], node_id) for node_id in execution_order if unfinished_deps[node_id] == 0
+    ]
+    heapq.heapify(ready)
+    running: Dict[asyncio.Task, Tuple[str, str, ContextView]] = {}
+    
+    # Supervisor/orchestrator decisions exclude later nodes, so nothing after a
+    # routing node in topological order (within its subgraph) starts until
+    # that node has finished.
+    pending_routers: List[List[int]] = [list(positions) for positions in plan.router_positions]
+    
+    def held_back(node_id: str) -> bool:
+        routers = pending_routers[component_of[node_id]]
+        return bool(routers) and routers[0] < order_index[node_id]
+    
+    orchestrator_nodes = plan.orchestrator_nodes
+    # Branch exclusions depend only on the graph, so they are shared across runs
+    orchestrator_exclusions = plan.orchestrator_exclusions
+    
+    # Tool calls issued during this run, shared by nodes making the identical call
+    tool_calls: Dict[Tuple[str, Tuple[Any, ...]], "asyncio.Future[AgentResult]"] = {}
+    
+    def release(finished_id: str) -> None:
+        """Mark a node finished and queue successors whose dependencies are all done."""
+        routers = pending_routers[component_of[finished_id]]
+        if order_index[finished_id] in routers:
+            routers.remove(order_index[finished_id])
+        for successor in successors[finished_id]:
+            unfinished_deps[successor] -= 1
+            if unfinished_deps[successor] == 0:
+                heapq.heappush(ready, (order_index[successor], successor))
+    
+    # Orchestrators report their routing decision while the reasoning is still
+    # streaming; downstream nodes start on it instead of waiting for the reply
+    early_decisions: List[Tuple[str, Dict[str, Any]]] = []
+    decision_ready = asyncio.Event()
+    decision_waiter: Optional["asyncio.Future[bool]"] = None
+    released_early: Set[str] = set()
+    
+    def decision_callback(orchestrator_id: str) -> Callable[[Dict[str, Any]], None]:
+        def on_decision(decision: Dict[str, Any]) -> None:
+            early_decisions.append((orchestrator_id, decision))
+            decision_ready.set()
+        return on_decision
+    
+    def apply_early_decisions() -> None:
+        """Record streamed orchestrator decisions and release their successors."""
+        while early_decisions:
+            orchestrator_id, decision = early_decisions.pop(0)
+            _commit_updates(
+                contexts[component_of[orchestrator_id]],
+                {
+                    "tools_to_execute": decision["tools_to_execute"],
+                    "orchestrator_result": {**decision, "reasoning": ""},
+                },
+                order_index[orchestrator_id],
+                merge_states[component_of[orchestrator_id]],
+            )
+            executed_nodes.add(orchestrator_id)
+            released_early.add(orchestrator_id)
+            workflow_logger.info(
+                "ORCHESTRATOR: %s chose %s - starting downstream nodes", orchestrator_id, decision["tools_to_execute"]
+            )
+            release(orchestrator_id)
+        decision_ready.clear()
+    
     try:
-        for node_id in execution_order:
-            node = node_map.get(node_id)
-            if not node:
-                workflow_logger.warning(f"Node {node_id} not found in node_map - skipping")
-                continue
-            
-            node_data = node.get("data", {})
-            node_type = node_data.get("nodeType", node_id.split("-")[0])
-            node_settings = node_data.get("settings", {})
-            
-            # Get dependencies for this node
-            dependencies = get_node_dependencies(node_id, valid_edges)
+        while ready or running:
+            apply_early_decisions()
             
-            # Log node evaluation start
-            debugger.log_node_start(node_id, node_type, dependencies)
-            debugger.log_dependency_check(node_id, dependencies, executed_nodes, excluded_nodes)
+            # Take the first ready node that no pending routing node holds back
+            node_id = None
+            deferred = []
+            while ready:
+                entry = heapq.heappop(ready)
+                if held_back(entry[1]):
+                    deferred.append(entry)
+                else:
+                    node_id = entry[1]
+                    break
+            for entry in deferred:
+                heapq.heappush(ready, entry)
             
-            # Handle input nodes
-            if node_type in INPUT_NODE_TYPES:
-                executed_nodes.add(node_id)
-                
-                # Extract content from input nodes
-                if node_type == "upload":
-                    # Get uploaded files from node data
-                    uploaded_files = node_data.get("uploadedFiles", [])
-                    print(f"[UPLOAD] ========================================")
-                    print(f"[UPLOAD] Processing upload node: {node_id}")
-                    print(f"[UPLOAD] Node data keys: {list(node_data.keys())}")
-                    print(f"[UPLOAD] Found {len(uploaded_files)} uploaded files")
-                    if uploaded_files:
-                        # Extract file content for context
-                        file_contents = []
-                        for file_info in uploaded_files:
-                            file_name = file_info.get("name", "unknown")
-                            file_content = file_info.get("content", "")
-                            
-                            print(f"[UPLOAD] File: {file_name}, content length: {len(file_content) if file_content else 0}")
-                            print(f"[UPLOAD] Content starts with: {file_content[:50] if file_content else 'NONE'}...")
+            if node_id is None and not running:
+                # The routing node can never become ready (dependency cycle)
+                pending_routers[component_of[deferred[0][1]]].pop(0)
+                continue
+            if node_id is None:
+                # Nothing else can start until a running agent finishes (or an orchestrator decides)
+                decision_waiter = asyncio.ensure_future(decision_ready.wait())
+                done, _ = await asyncio.wait([*running, decision_waiter], return_when=asyncio.FIRST_COMPLETED)
+                decision_waiter.cancel()
+                done.discard(decision_waiter)
+                apply_early_decisions()
+                for task in sorted(done, key=lambda t: order_index[running[t][0]]):
+                    node_id, node_type, agent_context = running.pop(task)
+                    context = contexts[component_of[node_id]]
+                    result = task.result()
+                    
+                    if result:
+                        # Update context with agent's results (and its view's writes)
+                        workflow_logger.debug("Context updates from %s:", node_id)
+                        for key, value in result.context_updates.items():
+                            debugger.log_context_update(key, value, node_id)
                             
-                            if file_content:
-                                # Parse PDF files
-                                if file_content.startswith("__PDF_BASE64__"):
-                                    try:
-                                        import base64
-                                        from io import BytesIO
-                                        from pypdf import PdfReader
-                                        
-                                        pdf_base64 = file_content[14:]  # Remove prefix
-                                        pdf_bytes = base64.b64decode(pdf_base64)
-                                        pdf_reader = PdfReader(BytesIO(pdf_bytes))
-                                        
-                                        # Step 1: Try to extract text directly (works for text-based PDFs)
-                                        text_parts = []
-                                        for i, page in enumerate(pdf_reader.pages):
-                                            page_text = page.extract_text()
-                                            if page_text:
-                                                text_parts.append(f"[Page {i+1}]\n{page_text}")
-                                        
-                                        extracted_text = "\n\n".join(text_parts)
-                                        
-                                        # Step 2: If very little text extracted, it's likely a scanned PDF - use OCR
-                                        if len(extracted_text.strip()) < 100:  # Threshold for scanned PDF detection
-                                            print(f"[UPLOAD] PDF appears to be scanned (only {len(extracted_text)} chars extracted), attempting OCR...")
-                                            ocr_success = False
-                                            try:
-                                                from pdf2image import convert_from_bytes
-                                                import pytesseract
-                                                
-                                                print(f"[UPLOAD] OCR libraries found. Converting PDF to images...")
-                                                # Convert PDF pages to images
-                                                images = convert_from_bytes(pdf_bytes, dpi=300)  # Higher DPI for better OCR
-                                                print(f"[UPLOAD] Converted to {len(images)} page images. Running OCR...")
-                                                
-                                                # Extract text from each page using OCR
-                                                # Use multiple languages: English + Arabic for best coverage
-                                                ocr_langs = 'eng+ara'  # Supports mixed English/Arabic documents
-                                                ocr_text_parts = []
-                                                for i, image in enumerate(images):
-                                                    print(f"[UPLOAD] Running OCR on page {i+1}/{len(images)} (langs: {ocr_langs})...")
-                                                    page_ocr_text = pytesseract.image_to_string(image, lang=ocr_langs)
-                                                    if page_ocr_text.strip():
-                                                        ocr_text_parts.append(f"[Page {i+1} - OCR]\n{page_ocr_text}")
-                                                        print(f"[UPLOAD] Page {i+1}: Extracted {len(page_ocr_text)} chars via OCR")
-                                                
-                                                ocr_text = "\n\n".join(ocr_text_parts)
-                                                
-                                                if ocr_text.strip():
-                                                    extracted_text = ocr_text
-                                                    ocr_success = True
-                                                    print(f"[UPLOAD] ✅ OCR SUCCESS: Extracted {len(extracted_text)} chars from scanned PDF")
-                                                else:
-                                                    print(f"[UPLOAD] ⚠️ OCR completed but extracted no text")
-                                                    
-                                            except ImportError as import_err:
-                                                print(f"[UPLOAD] ❌ OCR libraries not installed!")
-                                                print(f"[UPLOAD] Missing: {import_err}")
-                                                print(f"[UPLOAD] Install with: pip install pdf2image pytesseract Pillow")
-                                                print(f"[UPLOAD] Also install Tesseract OCR engine:")
-                                                print(f"[UPLOAD]   macOS: brew install tesseract")
-                                                print(f"[UPLOAD]   Linux: sudo apt-get install tesseract-ocr")
-                                                print(f"[UPLOAD]   Windows: https://github.com/UB-Mannheim/tesseract/wiki")
-                                                # Don't fail completely - will add error message below
-                                            except Exception as ocr_error:
-                                                print(f"[UPLOAD] ❌ OCR failed with error: {ocr_error}")
-                                                print(f"[UPLOAD] Error type: {type(ocr_error).__name__}")
-                                                import traceback
-                                                print(f"[UPLOAD] Traceback: {traceback.format_exc()}")
-                                            
-                                            # If OCR failed and we have no text, log error but don't add error message as content
-                                            if not ocr_success and len(extracted_text.strip()) < 100:
-                                                print(f"[UPLOAD] ❌ CRITICAL: OCR failed and no text extracted. PDF cannot be processed.")
-                                                print(f"[UPLOAD] This is a scanned PDF that requires OCR, but OCR is not working.")
-                                                # Don't add error message as content - it confuses the transformer
-                                                # Instead, skip this file or add a minimal placeholder
-                                                extracted_text = f"[SCANNED PDF - OCR FAILED]\n\nUnable to extract text from this scanned PDF. OCR processing failed.\n\nFilename: {file_name}\nPages: {len(pdf_reader.pages)}\n\nPlease check OCR installation and try again."
-                                        
-                                        # Add to file_contents - either the extracted text or an error
-                                        if extracted_text and len(extracted_text.strip()) > 50 and not extracted_text.startswith("[SCANNED PDF"):
-                                            # Success: we have meaningful extracted text
-                                            final_text = extracted_text[:100000]
-                                            if len(extracted_text) > 100000:
-                                                final_text += f"\n\n[Document truncated - {len(extracted_text)} total chars]"
-                                            
-                                            file_contents.append(f"[PDF File: {file_name}]\n{final_text}")
-                                            print(f"[UPLOAD] ✅ Final extracted {len(final_text)} chars from PDF: {file_name}")
-                                        else:
-                                            # OCR failed - add error so transformer knows a file was uploaded but failed
-                                            print(f"[UPLOAD] ❌ OCR failed for PDF {file_name}")
-                                            file_contents.append(f"[PDF File: {file_name}]\n[ERROR: This is a scanned/image-based PDF. OCR text extraction failed. Please install OCR dependencies: pip install pdf2image pytesseract && brew install tesseract poppler]")
-                                        
-                                    except Exception as e:
-                                        print(f"[UPLOAD] Failed to parse PDF {file_name}: {e}")
-                                        file_contents.append(f"[PDF File: {file_name}]\n[Error parsing PDF: {str(e)}]")
-                                
-                                # Parse DOCX files
-                                elif file_content.startswith("__DOCX_BASE64__"):
-                                    try:
-                                        import base64
-                                        from io import BytesIO
-                                        from docx import Document
-                                        
-                                        docx_base64 = file_content[15:]  # Remove prefix
-                                        docx_bytes = base64.b64decode(docx_base64)
-                                        doc = Document(BytesIO(docx_bytes))
-                                        
-                                        # Extract text from paragraphs and tables
-                                        text_parts = []
-                                        for para in doc.paragraphs:
-                                            if para.text.strip():
-                                                text_parts.append(para.text)
-                                        
-                                        for table in doc.tables:
-                                            for row in table.rows:
-                                                row_text = " | ".join(cell.text for cell in row.cells)
-                                                text_parts.append(row_text)
-                                        
-                                        extracted_text = "\n".join(text_parts)
-                                        file_contents.append(f"[Word File: {file_name}]\n{extracted_text[:100000]}")
-                                        print(f"[UPLOAD] Extracted {len(extracted_text)} chars from DOCX: {file_name}")
-                                    except Exception as e:
-                                        print(f"[UPLOAD] Failed to parse DOCX {file_name}: {e}")
-                                        file_contents.append(f"[Word File: {file_name}]\n[Error parsing DOCX: {str(e)}]")
-                                
-                                # Plain text content
-                                else:
-                                    file_contents.append(f"[File: {file_name}]\n{file_content[:100000]}")
+                            # Special logging for orchestrator decisions
+                            if key == "orchestrator_result":
+                                tools = value.get("tools_to_execute", [])
+                                reasoning = value.get("reasoning", "")
+                                debugger.log_orchestrator_decision(
+                                    tools,
+                                    agent_context.get("available_tools", []),
+                                    reasoning
+                                )
+                        _commit_updates(
+                            context,
+                            {**agent_context.diff, **result.context_updates},
+                            order_index[node_id],
+                            merge_states[component_of[node_id]],
+                        )
                         
-                        if file_contents:
-                            context["uploaded_file_content"] = "\n\n".join(file_contents)
-                            context["user_message"] = f"{user_message}\n\nUploaded files:\n{context['uploaded_file_content']}"
-                            print(f"[UPLOAD] Set uploaded_file_content with {len(context['uploaded_file_content'])} chars")
-                            print(f"[UPLOAD] Content preview: {context['uploaded_file_content'][:500]}...")
-                        else:
-                            # No content extracted from any files - set error message
-                            print(f"[UPLOAD] ⚠️ WARNING: {len(uploaded_files)} files uploaded but no content extracted!")
-                            file_names = [f.get("name", "unknown") for f in uploaded_files]
-                            context["uploaded_file_content"] = f"[UPLOAD ERROR: Files uploaded ({', '.join(file_names)}) but content extraction failed. If these are scanned PDFs, OCR may not be installed or working. Install: pip install pdf2image pytesseract && brew install tesseract poppler]"
-                            context["user_message"] = f"{user_message}\n\n{context['uploaded_file_content']}"
+                        # Record step
+                        step = Step(result.agent, result.model, result.action, result.content, result.metadata)
+                        if node_type not in INPUT_NODE_TYPES:
+                            steps.append(step)
+                        executed_nodes.add(node_id)
+                        
+                        debugger.log_node_execution(node_id, node_type, result.action, result.content)
+                        
+                        yield sse_event("agent_complete", {"agent": node_id, "step": step})
                     else:
-                        print(f"[UPLOAD] No files in uploadedFiles array")
-                    
-                    yield _sse_event("agent_complete", {
-                        "agent": node_id,
-                        "step": {
-                            "agent": node_type,
-                            "model": "none",
-                            "action": "input",
-                            "content": f"Uploaded and parsed {len(uploaded_files)} file(s)",
-                        }
-                    })
-                else:
-                    # Prompt node - use promptText if available, otherwise user_message
-                    prompt_text = node_data.get("promptText", user_message)
-                    if prompt_text:
-                        context["user_message"] = prompt_text
-                    
-                    yield _sse_event("agent_complete", {
-                        "agent": node_id,
-                        "step": {
-                            "agent": node_type,
-                            "model": "none",
-                            "action": "input",
-                            "content": prompt_text or user_message,
-                        }
-                    })
-                continue
-            
-            if node_type in OUTPUT_NODE_TYPES:
-                executed_nodes.add(node_id)
-                final_content = context.get("final_answer", "")
-                
-                # For spreadsheet output, format as CSV/table data
-                if node_type == "spreadsheet":
-                    # Store spreadsheet flag for final output
-                    context["output_format"] = "spreadsheet"
-                    yield _sse_event("agent_complete", {
-                        "agent": node_id,
-                        "step": {
-                            "agent": node_type,
-                            "model": "none",
-                            "action": "spreadsheet_output",
-                            "content": final_content,
-                            "format": "spreadsheet",
-                        }
-                    })
-                elif node_type == "code_viewer":
-                    # Get code content and language from formatting agent
-                    code_content = context.get("code_content") or context.get("formatted_content") or final_content
-                    code_language = context.get("code_language", "html")
-                    output_format = context.get("output_format", code_language)
-                    
-                    context["output_format"] = output_format
-                    yield _sse_event("agent_complete", {
-                        "agent": node_id,
-                        "step": {
-                            "agent": node_type,
-                            "model": "none",
-                            "action": "code_output",
-                            "content": code_content,
-                            "format": output_format,
-                            "language": code_language,
-                        }
-                    })
-                else:
-                    yield _sse_event("agent_complete", {
-                        "agent": node_id,
-                        "step": {
-                            "agent": node_type,
-                            "model": "none",
-                            "action": "output",
-                            "content": final_content,
-                        }
-                    })
-                continue
-            
-            # Check dependencies (already computed above)
-            missing_deps = [
-                dep for dep in dependencies
-                if dep not in executed_nodes and dep not in excluded_nodes
-            ]
-            
-            if missing_deps:
-                debugger.log_node_skipped(node_id, f"Missing dependencies: {missing_deps}")
+                        executed_nodes.add(node_id)
+                        yield sse_event("agent_complete", {
+                            "agent": node_id,
+                            "step": Step(
+                                agent=node_type,
+                                model="none",
+                                action="skip",
+                                content="Skipped",
+                            )
+                        })
+                    if node_id not in released_early:
+                        release(node_id)
                 continue
             
-            # === BRANCH ROUTING LOGIC ===
-            # A node should only execute if at least one of its upstream dependencies was executed
-            # If ALL dependencies were excluded, this node should also be excluded
-            should_execute = True
-            
-            workflow_logger.debug(f"Branch routing check for {node_id}:")
-            workflow_logger.debug(f"  Dependencies: {dependencies}")
-            workflow_logger.debug(f"  Executed nodes: {executed_nodes}")
-            workflow_logger.debug(f"  Excluded nodes: {excluded_nodes}")
-            
-            if dependencies:
-                # Check if any dependency was actually executed (not excluded)
-                executed_deps = [dep for dep in dependencies if dep in executed_nodes and dep not in excluded_nodes]
-                excluded_deps = [dep for dep in dependencies if dep in excluded_nodes]
+            context = contexts[component_of[node_id]]
+            launched = False
+            try:
+                spec = specs[node_id]
+                node_data = spec.data
+                node_type = spec.type
+                node_settings = spec.settings
                 
-                workflow_logger.debug(f"  Executed dependencies: {executed_deps}")
-                workflow_logger.debug(f"  Excluded dependencies: {excluded_deps}")
+                # Get dependencies for this node
+                dependencies = predecessors[node_id]
                 
-                has_executed_dependency = len(executed_deps) > 0
+                # Log node evaluation start
+                debugger.log_node_start(node_id, node_type, dependencies)
+                debugger.log_dependency_check(node_id, dependencies, executed_nodes, excluded_nodes)
                 
-                if not has_executed_dependency:
-                    # All our dependencies were excluded - we should be excluded too
-                    should_execute = False
-                    excluded_nodes.add(node_id)
+                # Handle input nodes
+                if node_type in INPUT_NODE_TYPES:
+                    executed_nodes.add(node_id)
                     
-                    debugger.log_branch_decision(
-                        node_id, node_type, "EXCLUDE",
-                        f"All dependencies excluded: {excluded_deps}",
-                        {"executed_deps": executed_deps, "excluded_deps": excluded_deps}
-                    )
-                    debugger.log_node_excluded(node_id, node_type, "All upstream dependencies were excluded")
-                    
-                    yield _sse_event("agent_complete", {
-                        "agent": node_id,
-                        "step": {
-                            "agent": node_type,
-                            "model": "none",
-                            "action": "exclude",
-                            "content": "Excluded (upstream path not taken)",
-                            "excluded": True,
-                        }
-                    })
+                    # Extract content from input nodes
+                    if node_type == "upload":
+                        # Get uploaded files from node data
+                        uploaded_files = node_data.get("uploadedFiles", [])
+                        workflow_logger.debug("[UPLOAD] Processing upload node %s: %s files", node_id, len(uploaded_files))
+                        if uploaded_files:
+                            # Parsing (and OCR) runs alongside the agents; successors wait for it
+                            task = asyncio.create_task(_run_upload_node(uploaded_files, user_message))
+                            running[task] = (node_id, node_type, ContextView({}))
+                            launched = True
+                            continue
+                        
+                        workflow_logger.debug("[UPLOAD] No files in uploadedFiles array")
+                        yield sse_event("agent_complete", {
+                            "agent": node_id,
+                            "step": Step(
+                                agent=node_type,
+                                model="none",
+                                action="input",
+                                content="Uploaded and parsed 0 file(s)",
+                            )
+                        })
+                    else:
+                        # Prompt node - use promptText if available, otherwise user_message
+                        prompt_text = node_data.get("promptText", user_message)
+                        if prompt_text:
+                            # Merged by position, like an upload node finishing later
+                            _commit_updates(
+                                context,
+                                {"user_message": prompt_text},
+                                order_index[node_id],
+                                merge_states[component_of[node_id]],
+                            )
+                        
+                        yield sse_event("agent_complete", {
+                            "agent": node_id,
+                            "step": Step(
+                                agent=node_type,
+                                model="none",
+                                action="input",
+                                content=prompt_text or user_message,
+                            )
+                        })
                     continue
-                else:
-                    debugger.log_branch_decision(
-                        node_id, node_type, "EXECUTE",
-                        f"Has executed dependencies: {executed_deps}",
-                        {"executed_deps": executed_deps, "excluded_deps": excluded_deps}
-                    )
-            
-            # === ORCHESTRATOR BRANCH ROUTING (GRAPH-BASED) ===
-            # When orchestrator selects specific tools, trace the graph to find which paths to exclude.
-            # This properly handles ALL nodes downstream of non-selected branches.
-            
-            # Find any orchestrator in the workflow that has already executed
-            orchestrator_node_id = None
-            for exec_node_id in executed_nodes:
-                exec_node = node_map.get(exec_node_id, {})
-                exec_node_type = exec_node.get("data", {}).get("nodeType", "")
-                if exec_node_type == "orchestrator":
-                    orchestrator_node_id = exec_node_id
-                    break
-            
-            if orchestrator_node_id:
-                tools_to_execute = context.get("orchestrator_result", {}).get("tools_to_execute", [])
-                
-                # Find all direct children of the orchestrator (the branch points)
-                orchestrator_children = [
-                    edge["target"] for edge in valid_edges 
-                    if edge["source"] == orchestrator_node_id
-                ]
                 
-                # Get the node types of direct children
-                orchestrator_child_types = {}
-                for child_id in orchestrator_children:
-                    child_node = node_map.get(child_id, {})
-                    child_type = child_node.get("data", {}).get("nodeType", "")
-                    orchestrator_child_types[child_id] = child_type
+                if node_type in OUTPUT_NODE_TYPES:
+                    executed_nodes.add(node_id)
+                    final_content = context.get("final_answer", "")
+                    
+                    # For spreadsheet output, format as CSV/table data
+                    if node_type == "spreadsheet":
+                        # Store spreadsheet flag for final output
+                        context["output_format"] = "spreadsheet"
+                        yield sse_event("agent_complete", {
+                            "agent": node_id,
+                            "step": Step(
+                                agent=node_type,
+                                model="none",
+                                action="spreadsheet_output",
+                                content=final_content,
+                                extras={"format": "spreadsheet"},
+                            )
+                        })
+                    elif node_type == "code_viewer":
+                        # Get code content and language from formatting agent
+                        code_content = context.get("code_content") or context.get("formatted_content") or final_content
+                        code_language = context.get("code_language", "html")
+                        output_format = context.get("output_format", code_language)
+                        
+                        context["output_format"] = output_format
+                        yield sse_event("agent_complete", {
+                            "agent": node_id,
+                            "step": Step(
+                                agent=node_type,
+                                model="none",
+                                action="code_output",
+                                content=code_content,
+                                extras={"format": output_format, "language": code_language},
+                            )
+                        })
+                    else:
+                        yield sse_event("agent_complete", {
+                            "agent": node_id,
+                            "step": Step(
+                                agent=node_type,
+                                model="none",
+                                action="output",
+                                content=final_content,
+                            )
+                        })
+                    continue
                 
-                # Determine which branch was selected
-                selected_branch_id = None
-                excluded_branch_ids = []
+                # === BRANCH ROUTING LOGIC ===
+                # A node should only execute if at least one of its upstream dependencies was executed
+                # If ALL dependencies were excluded, this node should also be excluded
+                should_execute = True
                 
-                if "image_generator" in tools_to_execute:
-                    # Find the image_generator branch
-                    for child_id, child_type in orchestrator_child_types.items():
-                        if child_type == "image_generator":
-                            selected_branch_id = child_id
-                        else:
-                            excluded_branch_ids.append(child_id)
-                else:
-                    # Default: select non-image_generator branches
-                    for child_id, child_type in orchestrator_child_types.items():
-                        if child_type == "image_generator":
-                            excluded_branch_ids.append(child_id)
-                        else:
-                            if selected_branch_id is None:
-                                selected_branch_id = child_id
+                workflow_logger.debug("Branch routing check for %s:", node_id)
+                workflow_logger.debug("  Dependencies: %s", dependencies)
+                workflow_logger.debug("  Executed nodes: %s", executed_nodes)
+                workflow_logger.debug("  Excluded nodes: %s", excluded_nodes)
                 
-                # Build set of all nodes reachable from excluded branches (but NOT from selected branch)
-                def get_all_descendants(start_node_id: str) -> Set[str]:
-                    """Get all nodes reachable from start_node_id via forward edges."""
-                    descendants = set()
-                    queue = [start_node_id]
-                    while queue:
-                        current = queue.pop(0)
-                        if current in descendants:
-                            continue
-                        descendants.add(current)
-                        for edge in valid_edges:
-                            if edge["source"] == current and edge["target"] not in descendants:
-                                queue.append(edge["target"])
-                    return descendants
+                if dependencies:
+                    # A node is only scheduled once every dependency has finished, and a
+                    # finished node is either executed or excluded - so one pass splits them
+                    excluded_deps = [dep for dep in dependencies if dep in excluded_nodes]
+                    executed_deps = (
+                        dependencies if not excluded_deps
+                        else [dep for dep in dependencies if dep not in excluded_nodes]
+                    )
+                    
+                    workflow_logger.debug("  Executed dependencies: %s", executed_deps)
+                    workflow_logger.debug("  Excluded dependencies: %s", excluded_deps)
+                    
+                    has_executed_dependency = len(executed_deps) > 0
+                    
+                    if not has_executed_dependency:
+                        # All our dependencies were excluded - we should be excluded too
+                        should_execute = False
+                        excluded_nodes.add(node_id)
+                        
+                        debugger.log_branch_decision(
+                            node_id, node_type, "EXCLUDE",
+                            f"All dependencies excluded: {excluded_deps}",
+                            {"executed_deps": executed_deps, "excluded_deps": excluded_deps}
+                        )
+                        debugger.log_node_excluded(node_id, node_type, "All upstream dependencies were excluded")
+                        
+                        yield sse_event("agent_complete", {
+                            "agent": node_id,
+                            "step": Step(
+                                agent=node_type,
+                                model="none",
+                                action="exclude",
+                                content="Excluded (upstream path not taken)",
+                                extras={"excluded": True},
+                            )
+                        })
+                        continue
+                    else:
+                        debugger.log_branch_decision(
+                            node_id, node_type, "EXECUTE",
+                            f"Has executed dependencies: {executed_deps}",
+                            {"executed_deps": executed_deps, "excluded_deps": excluded_deps}
+                        )
                 
-                # Get descendants of selected branch (these should execute)
-                selected_descendants = set()
-                if selected_branch_id:
-                    selected_descendants = get_all_descendants(selected_branch_id)
+                # === ORCHESTRATOR BRANCH ROUTING (GRAPH-BASED) ===
+                # When orchestrator selects specific tools, trace the graph to find which paths to exclude.
+                # This properly handles ALL nodes downstream of non-selected branches.
                 
-                # Get descendants of excluded branches
-                excluded_descendants = set()
-                for excluded_id in excluded_branch_ids:
-                    excluded_descendants.update(get_all_descendants(excluded_id))
+                # Find an already executed orchestrator this node is downstream of
+                orchestrator_node_id = next(
+                    (
+                        orch_id for orch_id in orchestrator_nodes
+                        if orch_id in executed_nodes and has_path(orch_id, node_id, successors)
+                    ),
+                    None,
+                )
                 
-                # Nodes to exclude: in excluded branches but NOT in selected branch
-                nodes_to_exclude = excluded_descendants - selected_descendants
+                if orchestrator_node_id:
+                    tools_to_execute = context.get("orchestrator_result", {}).get("tools_to_execute", [])
+                    routing_key = (orchestrator_node_id, frozenset(tools_to_execute))
                 
-                # Check if current node should be excluded
-                if node_id in nodes_to_exclude:
-                    workflow_logger.info(f"ORCHESTRATOR GRAPH ROUTING: Excluding {node_id} ({node_type})")
-                    workflow_logger.info(f"  Selected tool: {tools_to_execute}")
-                    workflow_logger.info(f"  Node is on excluded branch, not on selected branch")
+                # Trace the branches once per orchestrator decision, not once per node
+                if orchestrator_node_id and routing_key not in orchestrator_exclusions:
+                    # Find all direct children of the orchestrator (the branch points)
+                    orchestrator_children = successors[orchestrator_node_id]
                     
-                    should_execute = False
-                    excluded_nodes.add(node_id)
+                    # Get the node types of direct children
+                    orchestrator_child_types = {child_id: specs[child_id].type for child_id in orchestrator_children}
                     
-                    debugger.log_branch_decision(
-                        node_id, node_type, "EXCLUDE",
-                        f"Graph routing: Not on selected path (tools={tools_to_execute})",
-                        {"tools_to_execute": tools_to_execute, "node_type": node_type}
-                    )
-                    debugger.log_node_excluded(node_id, node_type, f"Not on selected orchestrator path")
+                    # Determine which branch was selected
+                    selected_branch_id = None
+                    excluded_branch_ids = []
                     
-                    yield _sse_event("agent_complete", {
-                        "agent": node_id,
-                        "step": {
-                            "agent": node_type,
-                            "model": "none",
-                            "action": "exclude",
-                            "content": f"Excluded (orchestrator selected: {tools_to_execute or 'default path'})",
-                            "excluded": True,
-                        }
-                    })
-                    continue
-                elif node_id in selected_descendants or node_id == selected_branch_id:
-                    workflow_logger.debug(f"ORCHESTRATOR: {node_id} is on selected path - executing")
-            
-            # === SUPERVISOR PATH ROUTING (SIMPLIFIED) ===
-            # The orchestrator graph routing above handles most cases.
-            # This is a fallback for workflows without orchestrator but with supervisor.
-            # It uses node type matching as a simpler heuristic.
-            
-            # Only apply if orchestrator didn't already handle this
-            if orchestrator_node_id is None:
-                supervisor_guidance = context.get("supervisor_guidance", "")
-                supervisor_plan = context.get("supervisor_plan", "")
-                workflow_path_text = f"{supervisor_guidance}\n{supervisor_plan}"
-                
-                # Extract the workflow path selected by supervisor
-                selected_path = None
-                if "WORKFLOW PATH:" in workflow_path_text.upper():
-                    for line in workflow_path_text.split("\n"):
-                        if "WORKFLOW PATH:" in line.upper():
-                            path_line = line.upper()
-                            if "IMAGE_GENERATOR" in path_line or "IMAGE GENERATOR" in path_line:
-                                selected_path = "IMAGE_GENERATOR"
-                                break
-                            elif "SEMANTIC_SEARCH" in path_line or "SEMANTIC SEARCH" in path_line:
-                                selected_path = "SEMANTIC_SEARCH"
-                                break
-                
-                if selected_path:
-                    # Simple type-based exclusion for non-orchestrator workflows
-                    image_path_nodes = {"image_generator"}
-                    text_path_nodes = {"semantic_search", "sampler", "synthesis", "summarization"}
+                    if "image_generator" in routing_key[1]:
+                        # Find the image_generator branch
+                        for child_id, child_type in orchestrator_child_types.items():
+                            if child_type == "image_generator":
+                                selected_branch_id = child_id
+                            else:
+                                excluded_branch_ids.append(child_id)
+                    else:
+                        # Default: select non-image_generator branches
+                        for child_id, child_type in orchestrator_child_types.items():
+                            if child_type == "image_generator":
+                                excluded_branch_ids.append(child_id)
+                            else:
+                                if selected_branch_id is None:
+                                    selected_branch_id = child_id
                     
-                    should_exclude = False
-                    if selected_path == "IMAGE_GENERATOR" and node_type in text_path_nodes:
-                        should_exclude = True
-                    elif selected_path == "SEMANTIC_SEARCH" and node_type in image_path_nodes:
-                        should_exclude = True
+                    # Get descendants of selected branch (these should execute)
+                    selected_descendants = set()
+                    if selected_branch_id:
+                        selected_descendants = {selected_branch_id, *descendants(selected_branch_id, successors)}
                     
-                    if should_exclude:
-                        workflow_logger.info(f"SUPERVISOR: Excluding {node_id} ({node_type}) - not on {selected_path} path")
+                    # Get descendants of excluded branches
+                    excluded_descendants = set()
+                    for excluded_id in excluded_branch_ids:
+                        excluded_descendants.add(excluded_id)
+                        excluded_descendants.update(descendants(excluded_id, successors))
+                    
+                    # Nodes to exclude: in excluded branches but NOT in selected branch
+                    orchestrator_exclusions[routing_key] = (
+                        excluded_descendants - selected_descendants,
+                        selected_descendants,
+                    )
+                
+                if orchestrator_node_id:
+                    branch_excluded, branch_selected = orchestrator_exclusions[routing_key]
+                    # Check if current node should be excluded
+                    if node_id in branch_excluded:
+                        workflow_logger.info("ORCHESTRATOR GRAPH ROUTING: Excluding %s (%s)", node_id, node_type)
+                        workflow_logger.info("  Selected tool: %s", tools_to_execute)
+                        workflow_logger.info("  Node is on excluded branch, not on selected branch")
+                        
                         should_execute = False
                         excluded_nodes.add(node_id)
                         
-                        yield _sse_event("agent_complete", {
+                        debugger.log_branch_decision(
+                            node_id, node_type, "EXCLUDE",
+                            f"Graph routing: Not on selected path (tools={tools_to_execute})",
+                            {"tools_to_execute": tools_to_execute, "node_type": node_type}
+                        )
+                        debugger.log_node_excluded(node_id, node_type, f"Not on selected orchestrator path")
+                        
+                        yield sse_event("agent_complete", {
                             "agent": node_id,
-                            "step": {
-                                "agent": node_type,
-                                "model": "none",
-                                "action": "exclude",
-                                "content": f"Excluded (supervisor selected: {selected_path})",
-                                "excluded": True,
-                            }
+                            "step": Step(
+                                agent=node_type,
+                                model="none",
+                                action="exclude",
+                                content=f"Excluded (orchestrator selected: {tools_to_execute or 'default path'})",
+                                extras={"excluded": True},
+                            )
                         })
                         continue
-            
-            if not should_execute:
-                continue
-            
-            # Execute the agent
-            yield _sse_event("agent_start", {"agent": node_id, "status": "working"})
-            
-            # Use context user_message (which may include uploaded file content)
-            effective_message = context.get("user_message", user_message)
-            
-            result = await _execute_agent(
-                node_type=node_type,
-                user_message=effective_message,
-                context=context,
-                settings=node_settings,
-                llm_client=llm_client,
-                small_model=small_model,
-                large_model=large_model,
-                valid_edges=valid_edges,
-                reachable_nodes=reachable_nodes,
-                node_map=node_map,
-            )
-            
-            if result:
-                # Update context with agent's results
-                workflow_logger.debug(f"Context updates from {node_id}:")
-                for key, value in result.context_updates.items():
-                    debugger.log_context_update(key, value, node_id)
+                    elif node_id in branch_selected:
+                        workflow_logger.debug("ORCHESTRATOR: %s is on selected path - executing", node_id)
+                
+                # === SUPERVISOR PATH ROUTING (SIMPLIFIED) ===
+                # The orchestrator graph routing above handles most cases.
+                # This is a fallback for workflows without orchestrator but with supervisor.
+                # It uses node type matching as a simpler heuristic.
+                
+                # Only apply if orchestrator didn't already handle this
+                if orchestrator_node_id is None:
+                    supervisor_guidance = context.get("supervisor_guidance", "")
+                    supervisor_plan = context.get("supervisor_plan", "")
                     
-                    if key == "context_snippets":
-                        context["context_snippets"].extend(value)
-                    elif key == "images":
-                        context["tool_outputs"]["images"].extend(value)
-                    elif key == "docs":
-                        context["docs"].extend(value)
-                    else:
-                        context[key] = value
+                    # Extract the workflow path selected by supervisor (reparsed
+                    # only when a supervisor has written new guidance or plan)
+                    parsed_guidance, parsed_plan, selected_path = supervisor_paths[component_of[node_id]]
+                    if supervisor_guidance is not parsed_guidance or supervisor_plan is not parsed_plan:
+                        selected_path = _parse_supervisor_path(supervisor_guidance, supervisor_plan)
+                        supervisor_paths[component_of[node_id]] = (supervisor_guidance, supervisor_plan, selected_path)
                     
-                    # Special logging for orchestrator decisions
-                    if key == "orchestrator_result":
-                        tools = value.get("tools_to_execute", [])
-                        reasoning = value.get("reasoning", "")
-                        debugger.log_orchestrator_decision(
-                            tools,
-                            context.get("available_tools", []),
-                            reasoning
-                        )
+                    if selected_path:
+                        # Simple type-based exclusion for non-orchestrator workflows
+                        should_exclude = False
+                        if selected_path == "IMAGE_GENERATOR" and node_type in TEXT_PATH_NODE_TYPES:
+                            should_exclude = True
+                        elif selected_path == "SEMANTIC_SEARCH" and node_type in IMAGE_PATH_NODE_TYPES:
+                            should_exclude = True
+                        
+                        if should_exclude:
+                            workflow_logger.info("SUPERVISOR: Excluding %s (%s) - not on %s path", node_id, node_type, selected_path)
+                            should_execute = False
+                            excluded_nodes.add(node_id)
+                            
+                            yield sse_event("agent_complete", {
+                                "agent": node_id,
+                                "step": Step(
+                                    agent=node_type,
+                                    model="none",
+                                    action="exclude",
+                                    content=f"Excluded (supervisor selected: {selected_path})",
+                                    extras={"excluded": True},
+                                )
+                            })
+                            continue
                 
-                # Record step
-                step = {
-                    "agent": result.agent,
-                    "model": result.model,
-                    "action": result.action,
-                    "content": result.content,
-                    **result.metadata,
-                }
-                steps.append(step)
-                executed_nodes.add(node_id)
+                if not should_execute:
+                    continue
                 
-                debugger.log_node_execution(node_id, node_type, result.action, result.content)
                 
-                yield _sse_event("agent_complete", {"agent": node_id, "step": step})
-            else:
-                executed_nodes.add(node_id)
-                yield _sse_event("agent_complete", {
-                    "agent": node_id,
-                    "step": {
-                        "agent": node_type,
-                        "model": "none",
-                        "action": "skip",
-                        "content": "Skipped",
-                    }
-                })
+                # Launch the agent; its result is merged when it completes
+                yield sse_event("agent_start", {"agent": node_id, "status": "working"})
+                
+                # Use context user_message (which may include uploaded file content)
+                effective_message = context.get("user_message", user_message)
+                
+                # Snapshot view: merges from agents finishing meanwhile don't leak in mid-run
+                agent_context = ContextView(dict(context))
+                task = asyncio.create_task(_execute_agent(
+                    node_type=node_type,
+                    user_message=effective_message,
+                    context=agent_context,
+                    settings=node_settings,
+                    llm_client=llm_client,
+                    models_for_default=models_for_default,
+                    valid_edges=valid_edges,
+                    nodes_by_type=nodes_by_type,
+                    on_decision=(
+                        decision_callback(node_id)
+                        if node_type == "orchestrator" and config.ORCHESTRATOR_EARLY_DECISION
+                        else None
+                    ),
+                    tool_calls=tool_calls,
+                ))
+                running[task] = (node_id, node_type, agent_context)
+                launched = True
+            finally:
+                if not launched:
+                    release(node_id)
+        
+        # Nodes on a cycle never become ready
+        for node_id in execution_order:
+            if node_id not in executed_nodes and node_id not in excluded_nodes and unfinished_deps[node_id] > 0:
+                debugger.log_node_skipped(node_id, "Dependency cycle")
         
         # Determine final answer
+        context = _merge_component_contexts(contexts)
         final_answer = context.get("final_answer", "")
         if not final_answer and context.get("context_snippets"):
             final_answer = "\n\n".join(context["context_snippets"])
@@ -804,17 +1743,18 @@ async def execute_workflow(
             workflow_latency
         )
         
-        # Prepare final tool outputs
+        # Prepare final tool outputs (every key is kept: the frontend's ToolOutputs requires them)
+        images = context["tool_outputs"].get("images")
         final_tool_outputs = {
             "images": [
                 {
                     "prompt": img.get("prompt"),
                     "style": img.get("style"),
-                    "url": img.get("url"),
-                    "has_data": bool(img.get("url")),
+                    "url": (url := img.get("url")),
+                    "has_data": bool(url),
                 }
-                for img in context["tool_outputs"].get("images", [])
-            ],
+                for img in images
+            ] if images else [],
             "calculations": context["tool_outputs"].get("calculations", []),
             "web_results": context["tool_outputs"].get("web_results", []),
             "docs": context.get("docs", []),
@@ -823,10 +1763,10 @@ async def execute_workflow(
         # Check if spreadsheet output was requested
         output_format = context.get("output_format", "text")
         
-        workflow_logger.info(f"Final output format: {output_format}")
-        workflow_logger.info(f"Final answer length: {len(final_answer)} chars")
+        workflow_logger.info("Final output format: %s", output_format)
+        workflow_logger.info("Final answer length: %s chars", len(final_answer))
         
-        yield _sse_event("done", {
+        yield sse_event("done", {
             "answer": final_answer,
             "tool_outputs": final_tool_outputs,
             "trace": {"steps": steps},
@@ -836,20 +1776,111 @@ async def execute_workflow(
         
     except Exception as exc:
         debugger.log_error(f"Workflow execution failed", exc)
-        yield _sse_event("error", {"message": str(exc)})
+        yield sse_event("error", {"message": str(exc)})
+    finally:
+        # Client disconnected or a node failed: don't leave agents running
+        for task in running:
+            task.cancel()
+        if decision_waiter is not None:
+            decision_waiter.cancel()
+
+
+def _parse_supervisor_path(supervisor_guidance: Any, supervisor_plan: Any) -> Optional[str]:
+    """
+    Find the path a supervisor chose on its "WORKFLOW PATH:" line.
+    
+    Returns:
+        "IMAGE_GENERATOR", "SEMANTIC_SEARCH", or None when no path was chosen
+    """
+    workflow_path_text = f"{supervisor_guidance}\n{supervisor_plan}"
+    if "WORKFLOW PATH:" not in workflow_path_text.upper():
+        return None
+    for line in workflow_path_text.split("\n"):
+        if "WORKFLOW PATH:" in line.upper():
+            path_line = line.upper()
+            if "IMAGE_GENERATOR" in path_line or "IMAGE GENERATOR" in path_line:
+                return "IMAGE_GENERATOR"
+            elif "SEMANTIC_SEARCH" in path_line or "SEMANTIC SEARCH" in path_line:
+                return "SEMANTIC_SEARCH"
+    return None
+
+
+def _add_downstream_nodes(
+    context: ContextView,
+    nodes_by_type: Dict[str, Set[str]],
+) -> None:
+    """Add downstream node TYPES to context for supervisor (so it understands workflow structure)."""
+    # Get the node types, not IDs - supervisor needs to know what's in the workflow
+    downstream_types = set(nodes_by_type)
+    context.set("downstream_nodes", list(downstream_types))
+    workflow_logger.debug("[SUPERVISOR] Downstream node types: %s", downstream_types)
+
+
+# Tool node types the orchestrator can choose between
+_ORCHESTRATOR_TOOLS = ("image_generator", "web_search")
+
+
+def _add_available_tools(
+    context: ContextView,
+    nodes_by_type: Dict[str, Set[str]],
+) -> None:
+    """Add available tools to context for orchestrator."""
+    available_tools = [tool for tool in _ORCHESTRATOR_TOOLS if tool in nodes_by_type]
+    
+    workflow_logger.debug("Orchestrator available tools detection:")
+    workflow_logger.debug("  Reachable node types: %s", sorted(nodes_by_type))
+    workflow_logger.debug("  Detected available tools: %s", available_tools)
+    
+    context.set("available_tools", available_tools)
+
+
+def _semantic_search_call_key(
+    user_message: str, context: Dict[str, Any], settings: Dict[str, Any]
+) -> Tuple[Any, ...]:
+    settings = settings or {}
+    return (
+        context.get("search_guidance", user_message),
+        settings.get("topK", 5),
+        settings.get("enableReranking", True),
+    )
+
+
+def _image_generator_call_key(
+    user_message: str, context: Dict[str, Any], settings: Dict[str, Any]
+) -> Tuple[Any, ...]:
+    orchestrator_result = context.get("orchestrator_result", {})
+    return (
+        orchestrator_result.get("image_prompt", user_message),
+        orchestrator_result.get("image_type"),
+        json.dumps(settings or {}, sort_keys=True, default=str),
+    )
+
+
+# Inputs that fully determine a tool node's external call, keyed by node type
+_TOOL_CALL_KEYS: Dict[str, Callable[[str, Dict[str, Any], Dict[str, Any]], Tuple[Any, ...]]] = {
+    "semantic_search": _semantic_search_call_key,
+    "image_generator": _image_generator_call_key,
+}
+
+
+# Context augmentation run before specific agents, keyed by node type
+_CONTEXT_ENRICHERS: Dict[str, Callable[[ContextView, Dict[str, Set[str]]], None]] = {
+    "supervisor": _add_downstream_nodes,
+    "orchestrator": _add_available_tools,
+}
 
 
 async def _execute_agent(
     node_type: str,
     user_message: str,
-    context: Dict[str, Any],
+    context: ContextView,
     settings: Dict[str, Any],
     llm_client: LLMClientProtocol,
-    small_model: str,
-    large_model: str,
+    models_for_default: Dict[str, Optional[str]],
     valid_edges: List[Dict[str, str]],
-    reachable_nodes: Set[str],
-    node_map: Dict[str, Any],
+    nodes_by_type: Dict[str, Set[str]],
+    on_decision: Optional[Callable[[Dict[str, Any]], None]] = None,
+    tool_calls: Optional[Dict[Tuple[str, Tuple[Any, ...]], "asyncio.Future[AgentResult]"]] = None,
 ) -> Optional[AgentResult]:
     """
     Execute a single agent based on node type.
@@ -857,87 +1888,69 @@ async def _execute_agent(
     Args:
         node_type: Type of node to execute
         user_message: Original user query
-        context: Shared execution context
+        context: The agent's view of the execution context
         settings: Node-specific settings
         llm_client: LLM client for completions
-        small_model: Small model name
-        large_model: Large model name
+        models_for_default: Model name for each agent default_model ("small", "large", ...)
         valid_edges: Valid workflow edges
-        reachable_nodes: Set of reachable node IDs
+        nodes_by_type: Reachable node IDs grouped by node type
+        on_decision: Orchestrator only - receives its routing decision early
+        tool_calls: Per-execution in-flight tool calls, for coalescing duplicates
         
     Returns:
         AgentResult or None if agent not found
     """
-    # Get agent class from registry
-    agent_class = AGENT_REGISTRY.get(node_type)
+    # Get (or create) the agent for this node type
+    agent = _get_agent(node_type, llm_client)
     
-    if not agent_class:
-        print(f"[WORKFLOW] Unknown agent type: {node_type}")
+    if agent is None:
+        workflow_logger.warning("[WORKFLOW] Unknown agent type: %s", node_type)
         return None
     
-    # Create agent instance
-    if node_type == "semantic_search":
-        agent = agent_class(llm_client, retrieval)
-    else:
-        agent = agent_class(llm_client)
-    
     # Determine which model to use
-    if agent.default_model == "large":
-        model = large_model
-    elif agent.default_model == "embedding":
-        model = None  # Semantic search uses embeddings
-    else:
-        model = small_model
-    
-    # Add downstream node TYPES to context for supervisor (so it understands workflow structure)
-    if node_type == "supervisor":
-        # Get the node types, not IDs - supervisor needs to know what's in the workflow
-        downstream_types = set()
-        for nid in reachable_nodes:
-            # Extract type from node ID (format: "type-timestamp")
-            if "-" in nid:
-                ntype = nid.rsplit("-", 1)[0]
-                downstream_types.add(ntype)
-            else:
-                downstream_types.add(nid)
-        context["downstream_nodes"] = list(downstream_types)
-        print(f"[SUPERVISOR] Downstream node types: {downstream_types}")
-    
-    # Add available tools to context for orchestrator
-    if node_type == "orchestrator":
-        available_tools = []
-        for node_id in reachable_nodes:
-            # Look up the node in node_map to get its actual type
-            node = node_map.get(node_id)
-            if node:
-                node_data = node.get("data", {})
-                other_node_type = node_data.get("nodeType", "")
-                
-                # Check if this is a tool node that should be available
-                if other_node_type == "image_generator" and "image_generator" not in available_tools:
-                    available_tools.append("image_generator")
-                elif other_node_type == "web_search" and "web_search" not in available_tools:
-                    available_tools.append("web_search")
-        
-        workflow_logger.debug(f"Orchestrator available tools detection:")
-        workflow_logger.debug(f"  Reachable nodes: {reachable_nodes}")
-        for node_id in reachable_nodes:
-            node = node_map.get(node_id)
-            if node:
-                node_data = node.get("data", {})
-                other_node_type = node_data.get("nodeType", "")
-                workflow_logger.debug(f"    {node_id} -> {other_node_type}")
-        workflow_logger.debug(f"  Detected available tools: {available_tools}")
-        
-        context["available_tools"] = available_tools
+    model = models_for_default.get(agent.default_model, models_for_default["small"])
+    
+    # Node-type specific context (e.g. workflow structure for routing agents)
+    enrich = _CONTEXT_ENRICHERS.get(node_type)
+    if enrich is not None:
+        enrich(context, nodes_by_type)
+    
+    # Pure agents: identical inputs give the identical result, so skip the LLM call
+    cache_key = None
+    if agent.pure and config.AGENT_CACHE_SIZE > 0:
+        cache_key = _agent_cache_key(node_type, model, settings, user_message, context, agent.reads)
+        cached = _agent_cache_get(cache_key)
+        if cached is not None:
+            workflow_logger.debug("[WORKFLOW] Reusing memoized %s result", node_type)
+            return cached
+    
+    # Tool calls: nodes issuing an identical call in this run share one request
+    call_key = None
+    key_fn = _TOOL_CALL_KEYS.get(node_type)
+    if key_fn is not None and tool_calls is not None:
+        call_key = (node_type, key_fn(user_message, context, settings))
+        shared = tool_calls.get(call_key)
+        if shared is not None:
+            workflow_logger.debug("[WORKFLOW] Sharing identical %s call from an earlier node", node_type)
+            return copy.deepcopy(await shared)
     
     # Execute agent
-    result = await agent.execute(
+    extra = {"on_decision": on_decision} if on_decision is not None else {}
+    call = agent.execute(
         user_message=user_message,
         context=context,
         settings=settings,
         model=model,
+        **extra,
     )
+    if model is not None:
+        call = _run_limited(call, model, models_for_default.get("large"), _estimate_tokens(user_message, context))
+    if call_key is not None:
+        call = tool_calls[call_key] = asyncio.ensure_future(call)
+    result = await call
+    
+    if cache_key is not None and result is not None and result.success:
+        _agent_cache_put(cache_key, result)
     
     return result
 
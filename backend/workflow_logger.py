@@ -7,14 +7,15 @@ especially branch routing and node selection issues.
 
 import json
 import logging
+import os
 import sys
 from datetime import datetime
 from typing import Any, Dict, List, Optional, Set
 from functools import wraps
 
-# Configure the workflow logger
+# Configure the workflow logger (WORKFLOW_LOG_LEVEL=DEBUG for per-node traces)
 workflow_logger = logging.getLogger("workflow")
-workflow_logger.setLevel(logging.DEBUG)
+workflow_logger.setLevel(os.getenv("WORKFLOW_LOG_LEVEL", "INFO").upper())
 
 # Create console handler with formatting
 console_handler = logging.StreamHandler(sys.stdout)
@@ -111,9 +112,10 @@ class WorkflowDebugger:
         workflow_logger.info(f"Execution order: {execution_order}")
         
         # Log edge connections
-        workflow_logger.debug("Edge connections:")
-        for edge in edges:
-            workflow_logger.debug(f"  {edge['source']} --> {edge['target']}")
+        if workflow_logger.isEnabledFor(logging.DEBUG):
+            workflow_logger.debug("Edge connections:")
+            for edge in edges:
+                workflow_logger.debug("  %s --> %s", edge['source'], edge['target'])
             
     def log_node_start(self, node_id: str, node_type: str, dependencies: List[str]):
         """Log when a node is about to be evaluated."""
@@ -129,13 +131,15 @@ class WorkflowDebugger:
         excluded_nodes: Set[str],
     ):
         """Log dependency status for a node."""
-        workflow_logger.debug(f"Dependency check for {node_id}:")
+        if not workflow_logger.isEnabledFor(logging.DEBUG):
+            return
+        workflow_logger.debug("Dependency check for %s:", node_id)
         for dep in dependencies:
             in_executed = dep in executed_nodes
             in_excluded = dep in excluded_nodes
             status = "EXECUTED" if in_executed else ("EXCLUDED" if in_excluded else "PENDING")
             color = Colors.GREEN if in_executed else (Colors.YELLOW if in_excluded else Colors.RED)
-            workflow_logger.debug(f"  {color}  {dep}: {status}{Colors.END}")
+            workflow_logger.debug("  %s  %s: %s%s", color, dep, status, Colors.END)
             
     def log_branch_decision(
         self,
@@ -159,8 +163,8 @@ class WorkflowDebugger:
         workflow_logger.info(f"{color}BRANCH DECISION for {node_id}: {decision}{Colors.END}")
         workflow_logger.info(f"  Reason: {reason}")
         
-        if context_data:
-            workflow_logger.debug(f"  Context data: {json.dumps(context_data, indent=2, default=str)[:500]}")
+        if context_data and workflow_logger.isEnabledFor(logging.DEBUG):
+            workflow_logger.debug("  Context data: %s", json.dumps(context_data, indent=2, default=str)[:500])
             
     def log_orchestrator_decision(
         self,
@@ -197,8 +201,8 @@ class WorkflowDebugger:
         self.node_execution_log.append(entry)
         
         workflow_logger.info(f"{Colors.GREEN}✓ EXECUTED: {node_id} ({node_type}){Colors.END}")
-        workflow_logger.debug(f"  Action: {action}")
-        workflow_logger.debug(f"  Result: {result_preview[:200]}...")
+        workflow_logger.debug("  Action: %s", action)
+        workflow_logger.debug("  Result: %s...", entry["result_preview"])
         
     def log_node_excluded(self, node_id: str, node_type: str, reason: str):
         """Log when a node is excluded from execution."""
@@ -220,9 +224,12 @@ class WorkflowDebugger:
         
     def log_context_update(self, key: str, value: Any, node_id: str):
         """Log context updates."""
+        # Serializing the value is the expensive part, so skip it unless it's shown
+        if not workflow_logger.isEnabledFor(logging.DEBUG):
+            return
         value_preview = str(value)[:200] if not isinstance(value, (list, dict)) else json.dumps(value, default=str)[:200]
-        workflow_logger.debug(f"Context update from {node_id}:")
-        workflow_logger.debug(f"  {key} = {value_preview}...")
+        workflow_logger.debug("Context update from %s:", node_id)
+        workflow_logger.debug("  %s = %s...", key, value_preview)
         
     def log_execution_summary(
         self,
@@ -264,16 +271,19 @@ def log_agent_call(func):
     @wraps(func)
     async def wrapper(self, *args, **kwargs):
         agent_name = getattr(self, 'agent_id', 'unknown')
-        workflow_logger.debug(f"Agent {agent_name} execute() called")
-        workflow_logger.debug(f"  Args: {str(args)[:200]}")
-        workflow_logger.debug(f"  Kwargs keys: {list(kwargs.keys())}")
+        debug = workflow_logger.isEnabledFor(logging.DEBUG)
+        if debug:
+            workflow_logger.debug("Agent %s execute() called", agent_name)
+            workflow_logger.debug("  Args: %s", str(args)[:200])
+            workflow_logger.debug("  Kwargs keys: %s", list(kwargs.keys()))
         
         try:
             result = await func(self, *args, **kwargs)
-            workflow_logger.debug(f"Agent {agent_name} completed successfully")
-            if result:
-                workflow_logger.debug(f"  Action: {result.action}")
-                workflow_logger.debug(f"  Content preview: {result.content[:200]}...")
+            if debug:
+                workflow_logger.debug("Agent %s completed successfully", agent_name)
+                if result:
+                    workflow_logger.debug("  Action: %s", result.action)
+                    workflow_logger.debug("  Content preview: %s...", result.content[:200])
             return result
         except Exception as e:
             workflow_logger.error(f"Agent {agent_name} failed: {e}")